@@ -1,53 +1,196 @@
-import google.generativeai as genai
 import json
 import re
 import logging
 import os # ★ 追加済み
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_client
+import metrics
+import prompt_registry
+import result_cache
+import thread_state
+from token_estimator import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
 # グローバル変数としてGeminiモデルのインスタンスを保持
+# (google.generativeai のインポートと初期化は初回の利用時まで遅らせる)
 _gemini_model = None
 _gemini_model_name = 'gemini-2.0-flash'
+_gemini_api_key = None
+_gemini_model_lock = threading.Lock()
+# Gemini APIの接続先 (ローカルの代替サーバーで検証する場合に指定する。指定時はREST通信になる)
+GEMINI_API_ENDPOINT = os.environ.get("GEMINI_API_ENDPOINT")
 
 # プロンプトファイルのパス
-PROMPT_DIR = "prompts"
+PROMPT_DIR = prompt_registry.PROMPT_DIR
+# 全プロンプトテンプレート (起動時に一度だけ読み込んで検証する、読み取り専用)
+PROMPTS = prompt_registry.load_prompt_registry(PROMPT_DIR)
+
+# カテゴリごとの議事録テンプレート (該当なしは misc_minutes.txt)
+MINUTES_PROMPT_FILES = {
+    "プリセールス": "presales_minutes.txt",
+    "要件定義": "requirements_minutes.txt",
+    "運用保守": "maintenance_minutes.txt",
+}
+
+# --- 分類・議事録生成のパイプラインモード ---
+#  two_step:    全文で分類 → 全文で議事録生成 (従来方式、API呼び出し2回)
+#  prefix:      冒頭の一部だけで分類 → 全文で議事録生成
+#  heuristic:   キーワードによるローカル分類 → 全文で議事録生成 (API呼び出し1回)
+#  single_call: 分類と議事録生成を1回の呼び出しで行う
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", "two_step")
+# prefix モードで分類に使う冒頭の文字数
+CLASSIFY_PREFIX_CHARS = int(os.environ.get("CLASSIFY_PREFIX_CHARS", "4000"))
+# heuristic モードで「その他」以外と判定するのに必要な最低キーワード出現数
+HEURISTIC_MIN_SCORE = int(os.environ.get("HEURISTIC_MIN_SCORE", "3"))
+
+# heuristic モードのカテゴリ別キーワード
+CATEGORY_KEYWORDS = {
+    "プリセールス": ("提案", "見積", "商談", "ヒアリング", "予算", "導入", "デモ", "受注", "競合", "価格", "契約"),
+    "要件定義": ("要件", "仕様", "設計", "画面", "機能", "スコープ", "非機能", "項目", "帳票", "遷移", "合意"),
+    "運用保守": ("障害", "問い合わせ", "保守", "運用", "不具合", "復旧", "監視", "インシデント", "アラート", "パッチ", "リリース後"),
+}
+
+# single_call モードの応答1行目 (カテゴリ行) のパターン
+_SINGLE_CALL_CATEGORY_PATTERN = re.compile(r"^\s*カテゴリ\s*[:：]\s*\**\s*(プリセールス|要件定義|運用保守|その他)")
+
+# Gemini API呼び出し層 (レート制限・リトライ・サーキットブレーカーを全ジョブで共有する)
+_llm_client = llm_client.LLMClient()
+
+# 分類結果・議事録のキャッシュ (同じ文字起こしの再投稿時にAPI呼び出しを省略する)
+_result_cache = result_cache.create_result_cache()
+
+# スレッド単位の要約状態 (同じスレッドに続きや修正版の文字起こしが投稿された場合に差分だけを要約する)
+_thread_state_store = thread_state.create_thread_state_store()
+# 同じスレッドの差分要約を直列化するロック (スレッドのキーのハッシュで振り分ける)
+_thread_locks = [threading.Lock() for _ in range(64)]
+
+# Gemini APIの呼び出し回数と推定トークン数の累計
+_token_usage = {"calls": 0, "input_tokens": 0, "output_tokens": 0}
+_token_usage_lock = threading.Lock()
+
+# --- 長時間会議向けの分割要約 (map-reduce) 設定 ---
+# 推定トークン数がこの値を超える文字起こしは分割して要約する (0 以下で無効)
+# 既定では無効 (従来どおり全文を1回で要約する)。長時間会議でモデルの入力上限や応答時間が問題になる場合に
+# 30000 程度を設定する
+CHUNKED_THRESHOLD_TOKENS = int(os.environ.get("CHUNKED_THRESHOLD_TOKENS", "0"))
+# 1チャンクあたりの推定トークン数の上限
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", "8000"))
+# 前のチャンク末尾から次のチャンクに重複させる行数 (文脈の切れ目対策)
+CHUNK_OVERLAP_LINES = int(os.environ.get("CHUNK_OVERLAP_LINES", "3"))
+# チャンク要約を並列に実行する最大数
+CHUNK_MAX_WORKERS = int(os.environ.get("CHUNK_MAX_WORKERS", "4"))
 
 def _load_prompt(file_name: str) -> str:
-    """プロンプトファイルを読み込むヘルパー関数"""
-    path = os.path.join(PROMPT_DIR, file_name)
+    """読み込み済みのプロンプトテンプレートを返すヘルパー関数"""
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return f.read()
-    except FileNotFoundError:
-        logger.error(f"プロンプトファイルが見つかりません: {path}")
-        raise
-    except Exception as e:
-        logger.error(f"プロンプトファイルの読み込みに失敗しました: {path}, Error: {e}")
+        return PROMPTS[file_name]
+    except KeyError:
+        logger.error(f"プロンプトファイルが見つかりません: {os.path.join(PROMPT_DIR, file_name)}")
         raise
 
 def set_gemini_client_and_model(api_key: str, model_name: str = 'gemini-2.0-flash'):
     """
     Geminiクライアントとモデルを設定します。（旧SDK方式）
+    SDKのインポートとモデルの初期化は、最初に必要になった時点で行います。
     """
-    global _gemini_model, _gemini_model_name
-    _gemini_model_name = model_name
+    global _gemini_model, _gemini_model_name, _gemini_api_key
+    with _gemini_model_lock:
+        _gemini_model_name = model_name
+        _gemini_api_key = api_key
+        _gemini_model = None
 
-    if api_key:
-        try:
-            # ★ 修正点 1: genai.configure でAPIキーを設定 ★
-            genai.configure(api_key=api_key)
+    if not api_key:
+        logger.warning("APIキーが提供されていないため、Gemini Modelは初期化されません。")
 
-            # ★ 修正点 2: genai.GenerativeModel でモデルを初期化 ★
-            _gemini_model = genai.GenerativeModel(_gemini_model_name)
+def _get_gemini_model():
+    """
+    Geminiモデルを返します。未初期化の場合はここでSDKをインポートして初期化します。
+    初期化できない場合は None を返します。
+    """
+    global _gemini_model
+    if _gemini_model is not None or not _gemini_api_key:
+        return _gemini_model
+    with _gemini_model_lock:
+        if _gemini_model is None and _gemini_api_key:
+            try:
+                import google.generativeai as genai
 
-            logger.info(f"Gemini Model '{_gemini_model_name}' が正常に初期化されました。(genai.configure方式)")
-        except Exception as e:
-            logger.error(f"Gemini Model の初期化に失敗しました: {e}")
-            _gemini_model = None
-    else:
-        _gemini_model = None
-        logger.warning("APIキーが提供されていないため、Gemini Modelは初期化されません。")
+                # ★ 修正点 1: genai.configure でAPIキーを設定 ★
+                if GEMINI_API_ENDPOINT:
+                    genai.configure(api_key=_gemini_api_key, transport="rest",
+                                    client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+                else:
+                    genai.configure(api_key=_gemini_api_key)
+
+                # ★ 修正点 2: genai.GenerativeModel でモデルを初期化 ★
+                _gemini_model = genai.GenerativeModel(_gemini_model_name)
+
+                logger.info(f"Gemini Model '{_gemini_model_name}' が正常に初期化されました。(genai.configure方式)")
+            except Exception as e:
+                logger.error(f"Gemini Model の初期化に失敗しました: {e}")
+                _gemini_model = None
+    return _gemini_model
+
+class GeminiAPIError(Exception):
+    """
+    リトライしても Gemini API から応答を得られなかった場合の例外。
+    """
+    pass
+
+def set_llm_client(client: llm_client.LLMClient):
+    """
+    Gemini API呼び出し層を差し替えます。
+    """
+    global _llm_client
+    _llm_client = client
+
+def get_llm_client() -> llm_client.LLMClient:
+    return _llm_client
+
+def set_result_cache(cache: result_cache.ResultCache):
+    """
+    分類結果・議事録のキャッシュを差し替えます。
+    """
+    global _result_cache
+    _result_cache = cache
+
+def get_result_cache() -> result_cache.ResultCache:
+    return _result_cache
+
+def set_thread_state_store(store: thread_state.ThreadStateStore):
+    """
+    スレッド単位の要約状態のストアを差し替えます。
+    """
+    global _thread_state_store
+    _thread_state_store = store
+
+def get_thread_state_store() -> thread_state.ThreadStateStore:
+    return _thread_state_store
+
+def _record_usage(prompt: str, text: str):
+    """
+    Gemini APIの呼び出し回数と推定トークン数を集計します (バッチ処理のコスト見積もり用)。
+    """
+    input_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(text)
+    with _token_usage_lock:
+        _token_usage["calls"] += 1
+        _token_usage["input_tokens"] += input_tokens
+        _token_usage["output_tokens"] += output_tokens
+    metrics.incr("llm_calls")
+    metrics.incr("prompt_tokens", input_tokens)
+    metrics.incr("response_tokens", output_tokens)
+
+def get_token_usage() -> dict:
+    with _token_usage_lock:
+        return dict(_token_usage)
+
+def reset_token_usage():
+    with _token_usage_lock:
+        for name in _token_usage:
+            _token_usage[name] = 0
 
 # --- プロンプト生成関数 (外部ファイル読み込み) ---
 def generate_classify_meeting_prompt(text: str) -> str:
@@ -70,21 +213,75 @@ def generate_misc_minutes_prompt(text: str) -> str:
     prompt_template = _load_prompt("misc_minutes.txt")
     return prompt_template.format(text=text)
 
+def generate_classify_and_minutes_prompt(text: str) -> str:
+    prompt_template = _load_prompt("classify_and_minutes.txt")
+    return prompt_template.format(text=text)
+
+def generate_chunk_summary_prompt(text: str, part: int, total: int) -> str:
+    prompt_template = _load_prompt("chunk_summary.txt")
+    return prompt_template.format(text=text, part=part, total=total)
+
+def generate_merge_minutes_prompt(minutes: str, text: str) -> str:
+    prompt_template = _load_prompt("merge_minutes.txt")
+    return prompt_template.format(minutes=minutes, text=text)
+
+# --- 長時間会議向けの分割処理 ---
+def split_transcript_into_chunks(text: str, max_tokens: int = None, overlap_lines: int = None) -> list:
+    """
+    文字起こしを行 (キュー/発言) の境界で、推定トークン数が max_tokens 以下のチャンクに分割します。
+    各チャンクの先頭には、前のチャンク末尾の overlap_lines 行を重複して含めます。
+    """
+    max_tokens = max_tokens or CHUNK_MAX_TOKENS
+    overlap_lines = CHUNK_OVERLAP_LINES if overlap_lines is None else overlap_lines
+
+    lines = []
+    for line in text.split("\n"):
+        # 1行だけで上限を超える場合は文字数で強制的に分割する
+        while estimate_tokens(line) > max_tokens:
+            lines.append(line[:max_tokens])
+            line = line[max_tokens:]
+        lines.append(line)
+
+    chunks = []
+    current, current_tokens, new_lines = [], 0, 0
+    for line in lines:
+        line_tokens = estimate_tokens(line) + 1 # 改行分
+        if new_lines and current_tokens + line_tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current = current[-overlap_lines:] if overlap_lines > 0 else []
+            current_tokens = sum(estimate_tokens(l) + 1 for l in current)
+            # 重複行だけで上限に近い場合は重複を諦める
+            if current_tokens + line_tokens > max_tokens:
+                current, current_tokens = [], 0
+            new_lines = 0
+        current.append(line)
+        current_tokens += line_tokens
+        new_lines += 1
+    if new_lines:
+        chunks.append("\n".join(current))
+    return chunks
+
+def _needs_chunking(text: str) -> bool:
+    return CHUNKED_THRESHOLD_TOKENS > 0 and estimate_tokens(text) > CHUNKED_THRESHOLD_TOKENS
+
 # --- API呼び出し (変更あり) ---
 def _get_gemini_response(prompt: str) -> str:
     """
     Gemini APIにプロンプトを送信し、応答を取得する内部ヘルパー関数。（旧SDK方式）
     """
-    if not _gemini_model:
+    model = _get_gemini_model()
+    if not model:
         logger.error("Gemini モデルが初期化されていません。")
         raise Exception("Gemini モデルが初期化されていません。")
 
     try:
         # ★ 修正点 3: _gemini_model.generate_content を呼び出す ★
-        gemini_response = _gemini_model.generate_content(
-            contents=prompt
+        # (一時的なエラーのリトライやレート制限は llm_client が行うため、SDK側のリトライは無効にする)
+        gemini_response = _llm_client.call(lambda timeout: model.generate_content(
+            contents=prompt,
+            request_options={"timeout": timeout, "retry": None},
             # generation_config={'temperature': 0.7} # 必要なら調整
-        )
+        ))
         # response.text が空の場合のエラーハンドリングを追加
         if not gemini_response.text:
              logger.warning("Gemini APIからの応答テキストが空です。")
@@ -93,17 +290,71 @@ def _get_gemini_response(prompt: str) -> str:
              # 安全なデフォルト値を返すか、エラーを発生させる
              # return "(空の応答)"
              raise Exception("Gemini APIからの応答テキストが空でした。")
+        _record_usage(prompt, gemini_response.text)
         return gemini_response.text
     except Exception as e:
         logger.error(f"Gemini API Error: {e}", exc_info=True) # exc_info=Trueでトレースバックを出力
         # エラーの詳細を返すか、より具体的な例外を発生させる
-        raise Exception(f"Gemini APIによる処理中にエラーが発生しました: {e}")
+        raise GeminiAPIError(f"Gemini APIによる処理中にエラーが発生しました: {e}") from e
+
+def _get_gemini_response_streaming(prompt: str, on_progress) -> str:
+    """
+    Gemini APIからストリーミングで応答を受け取り、受信のたびに
+    それまでの累積テキストで on_progress を呼び出します。最終的な全文を返します。
+    """
+    model = _get_gemini_model()
+    if not model:
+        logger.error("Gemini モデルが初期化されていません。")
+        raise Exception("Gemini モデルが初期化されていません。")
+
+    def stream(timeout):
+        parts = []
+        for chunk in model.generate_content(contents=prompt, stream=True, request_options={"timeout": timeout, "retry": None}):
+            chunk_text = chunk.text
+            if not chunk_text:
+                continue
+            parts.append(chunk_text)
+            try:
+                on_progress("".join(parts))
+            except Exception as e:
+                # 途中経過の通知に失敗しても生成は続ける
+                logger.warning(f"ストリーミングの途中経過の通知に失敗しました: {e}")
+        return "".join(parts)
+
+    try:
+        # 途中で失敗してリトライした場合は、最初から受信し直した累積テキストが通知される
+        # (ヘッジは同じメッセージを2つのストリームで更新してしまうため使わない)
+        text = _llm_client.call(stream, hedge=False)
+        if not text:
+            logger.warning("Gemini APIからの応答テキストが空です。")
+            raise Exception("Gemini APIからの応答テキストが空でした。")
+        _record_usage(prompt, text)
+        return text
+    except Exception as e:
+        logger.error(f"Gemini API Error: {e}", exc_info=True)
+        raise GeminiAPIError(f"Gemini APIによる処理中にエラーが発生しました: {e}") from e
+
+def _generate_text(prompt: str, on_progress=None) -> str:
+    """
+    on_progress が指定されていればストリーミングで、それ以外は一括で応答を取得します。
+    """
+    if on_progress is None:
+        return _get_gemini_response(prompt)
+    return _get_gemini_response_streaming(prompt, on_progress)
 
 
 def classify_meeting_transcript(text_to_classify: str) -> str:
     """
     Gemini APIを使用して会議の文字起こしを分類します。
     """
+    cache_key = result_cache.make_cache_key(
+        "classify", text_to_classify, _load_prompt("classify_meeting.txt"), _gemini_model_name
+    )
+    cached_category = _result_cache.get(cache_key)
+    if cached_category is not None:
+        logger.info("分類結果をキャッシュから取得しました。")
+        return cached_category
+
     prompt = generate_classify_meeting_prompt(text_to_classify)
     json_str_response = _get_gemini_response(prompt)
 
@@ -111,14 +362,137 @@ def classify_meeting_transcript(text_to_classify: str) -> str:
     cleaned_str = re.sub(r"^```json|```$", "", json_str_response.strip(), flags=re.MULTILINE)
     try:
         classified_data = json.loads(cleaned_str)
-        return classified_data.get("category", "その他") # カテゴリを返す
+        category = classified_data.get("category", "その他") # カテゴリを返す
+        _result_cache.set(cache_key, category)
+        return category
     except json.JSONDecodeError as e:
         logger.error(f"分類結果のJSONパースに失敗しました: {e}. 元の応答: {json_str_response}")
         return "その他" # パース失敗時はデフォルトで「その他」とする
 
-def generate_meeting_minutes(text: str, category: str = "その他") -> str:
+def classify_meeting_transcript_heuristic(text: str) -> str:
+    """
+    API を使わず、キーワードの出現数で会議の文字起こしを分類します。
+    """
+    scores = {
+        category: sum(text.count(keyword) for keyword in keywords)
+        for category, keywords in CATEGORY_KEYWORDS.items()
+    }
+    category, score = max(scores.items(), key=lambda item: item[1])
+    logger.info(f"キーワード分類のスコア: {scores}")
+    return category if score >= HEURISTIC_MIN_SCORE else "その他"
+
+def _prefix_for_classification(text: str) -> str:
+    """
+    分類用に文字起こしの冒頭 CLASSIFY_PREFIX_CHARS 文字を行の境界で切り出します。
+    """
+    if len(text) <= CLASSIFY_PREFIX_CHARS:
+        return text
+    cut = text.rfind("\n", 0, CLASSIFY_PREFIX_CHARS)
+    return text[:cut if cut > 0 else CLASSIFY_PREFIX_CHARS]
+
+def classify_and_generate_minutes(text: str, on_progress=None) -> tuple:
+    """
+    1回のAPI呼び出しで分類と議事録生成を行い、(カテゴリ, 議事録) を返します。
+    """
+    cache_key = result_cache.make_cache_key(
+        "classify_and_minutes", text, _load_prompt("classify_and_minutes.txt"), _gemini_model_name
+    )
+    cached_response = _result_cache.get(cache_key)
+    if cached_response is not None:
+        logger.info("分類・議事録をキャッシュから取得しました。")
+        response = cached_response
+    else:
+        def report_minutes_progress(partial):
+            # 途中経過からはカテゴリ行 (1行目) を除いて通知する
+            if "\n" in partial:
+                on_progress(partial.split("\n", 1)[1].lstrip())
+        response = _generate_text(generate_classify_and_minutes_prompt(text),
+                                  report_minutes_progress if on_progress is not None else None)
+        _result_cache.set(cache_key, response)
+
+    first_line, _, rest = response.strip().partition("\n")
+    match = _SINGLE_CALL_CATEGORY_PATTERN.match(first_line)
+    if not match:
+        logger.warning(f"応答の1行目からカテゴリを取得できませんでした: {first_line[:100]}")
+        return "その他", response.strip()
+    return match.group(1), rest.strip()
+
+def generate_meeting_minutes(text: str, category: str = "その他", on_progress=None) -> str:
     """
     会議の文字起こしから、指定されたカテゴリに基づいて議事録を生成します。
+    長い文字起こしは分割要約 (map-reduce) で処理します。
+    on_progress を指定すると、生成途中の議事録を受け取れます (ストリーミング)。
+    """
+    chunked = _needs_chunking(text)
+    prompt_template = _load_prompt(MINUTES_PROMPT_FILES.get(category, "misc_minutes.txt"))
+    if chunked:
+        # 分割要約は分割設定やチャンク用プロンプトでも結果が変わるためキーに含める
+        prompt_template += f"\0{_load_prompt('chunk_summary.txt')}\0{CHUNK_MAX_TOKENS}:{CHUNK_OVERLAP_LINES}"
+    cache_key = result_cache.make_cache_key("minutes", text, prompt_template, _gemini_model_name)
+    cached_minutes = _result_cache.get(cache_key)
+    if cached_minutes is not None:
+        logger.info("議事録をキャッシュから取得しました。")
+        return cached_minutes
+
+    if chunked:
+        minutes = generate_meeting_minutes_chunked(text, category, on_progress)
+    else:
+        minutes = _generate_text(_build_minutes_prompt(text, category), on_progress)
+    _result_cache.set(cache_key, minutes)
+    return minutes
+
+def generate_meeting_minutes_chunked(text: str, category: str = "その他", on_progress=None) -> str:
+    """
+    文字起こしをチャンクに分割して並列に要約 (map) し、
+    その要約をカテゴリ別テンプレートで1つの議事録にまとめます (reduce)。
+    """
+    combined = _summarize_chunks(text)
+    return _generate_text(_build_minutes_prompt(combined, category), on_progress)
+
+def _summarize_chunks(text: str) -> str:
+    """
+    文字起こしをチャンクに分割して並列に要約し、パートごとの要約を連結したメモを返します。
+    """
+    chunks = split_transcript_into_chunks(text)
+    total = len(chunks)
+    logger.info(f"文字起こしを {total} チャンクに分割して要約します。(推定 {estimate_tokens(text)} トークン)")
+
+    def summarize_chunk(index):
+        return _get_gemini_response(generate_chunk_summary_prompt(chunks[index], index + 1, total))
+
+    max_workers = max(1, min(CHUNK_MAX_WORKERS, total))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chunk-summary") as executor:
+        # 1チャンクでも失敗した場合は例外が伝播し、議事録全体をエラーとする
+        chunk_summaries = list(executor.map(metrics.bind(summarize_chunk), range(total)))
+    logger.info("チャンクごとの要約が完了しました。議事録に統合します。")
+
+    return "（長時間の会議のため、文字起こしをパートごとに要約したメモです）\n\n" + "\n\n".join(
+        f"### パート {i}/{total}\n{summary.strip()}" for i, summary in enumerate(chunk_summaries, start=1)
+    )
+
+def merge_meeting_minutes(previous_minutes: str, new_text: str, on_progress=None) -> str:
+    """
+    既存の議事録に、同じ会議の文字起こしのうち新しく追加・変更された部分を統合した議事録を生成します。
+    新しい部分が長い場合は、先に分割要約 (map) してから統合します。
+    """
+    chunked = _needs_chunking(new_text)
+    prompt_template = f"{_load_prompt('merge_minutes.txt')}\0{previous_minutes}"
+    if chunked:
+        prompt_template += f"\0{_load_prompt('chunk_summary.txt')}\0{CHUNK_MAX_TOKENS}:{CHUNK_OVERLAP_LINES}"
+    cache_key = result_cache.make_cache_key("merge", new_text, prompt_template, _gemini_model_name)
+    cached_minutes = _result_cache.get(cache_key)
+    if cached_minutes is not None:
+        logger.info("統合した議事録をキャッシュから取得しました。")
+        return cached_minutes
+
+    notes = _summarize_chunks(new_text) if chunked else new_text
+    minutes = _generate_text(generate_merge_minutes_prompt(previous_minutes, notes), on_progress)
+    _result_cache.set(cache_key, minutes)
+    return minutes
+
+def _build_minutes_prompt(text: str, category: str) -> str:
+    """
+    カテゴリに対応する議事録テンプレートでプロンプトを生成します。
     """
     prompt = ""
     if category == "プリセールス":
@@ -129,27 +503,116 @@ def generate_meeting_minutes(text: str, category: str = "その他") -> str:
         prompt = generate_maintenance_minutes_prompt(text)
     else: # その他または分類失敗時
         prompt = generate_misc_minutes_prompt(text)
+    return prompt
 
-    return _get_gemini_response(prompt)
-
-def process_meeting_transcript(plain_text_transcript: str) -> str:
+def process_meeting_transcript(plain_text_transcript: str, mode: str = None, on_progress=None,
+                               raise_on_error: bool = False, thread_key: str = None, mention_key: str = None) -> str:
     """
     会議の文字起こしを分類し、その後、分類結果に基づいて議事録を生成します。
+    mode を省略した場合は PIPELINE_MODE の設定に従います。
+    on_progress を指定すると、議事録の生成をストリーミングで行い途中経過を通知します。
+    raise_on_error が True の場合、エラーメッセージを返す代わりに例外を送出します (バッチ処理用)。
+    thread_key (Slackのスレッドなど) を指定し、スレッド状態のストアが有効な場合は、
+    同じスレッドで要約済みの会議の続き・修正版であれば、差分だけを要約して前回の議事録に統合します。
+    mention_key (メンションのts など) が同じ会議 (同時に添付された別のファイル) には統合しません。
     """
-    if not _gemini_model: # _gemini_client から _gemini_model に変更
+    mode = mode or PIPELINE_MODE
+    if not _get_gemini_model(): # _gemini_client から _gemini_model に変更
+        if raise_on_error:
+            raise GeminiAPIError("Gemini APIキーが設定されていないか、モデルの初期化に失敗しました。")
         return "Gemini APIキーが設定されていないか、モデルの初期化に失敗したため、処理できませんでした。"
 
+    job_metrics = metrics.current()
+    if job_metrics is not None:
+        job_metrics.set(pipeline_mode=mode)
     try:
-        # 1. 会議のカテゴリを分類
-        category = classify_meeting_transcript(plain_text_transcript)
-        logger.info(f"会議のカテゴリ: {category}")
-
-        # 2. 分類されたカテゴリに基づいて議事録を生成
-        minutes_markdown = generate_meeting_minutes(plain_text_transcript, category)
-        logger.info("Markdown議事録の生成が完了しました。")
-        return minutes_markdown
+        if thread_key and _thread_state_store.enabled:
+            # 同じスレッドに続けて投稿されたファイルは、前のファイルの状態を反映してから処理する
+            with _thread_locks[hash(thread_key) % len(_thread_locks)]:
+                return _process_thread_transcript(plain_text_transcript, thread_key, mode, on_progress, mention_key)
+        return _classify_and_generate(plain_text_transcript, mode, on_progress)[1]
 
     except Exception as e:
         logger.error(f"会議文字起こし処理全体でエラーが発生しました: {e}", exc_info=True)
+        if raise_on_error:
+            raise
         # ユーザーに返すエラーメッセージはシンプルに
-        return f"議事録の生成中にエラーが発生しました。詳細はログを確認してください。"
\ No newline at end of file
+        return f"議事録の生成中にエラーが発生しました。詳細はログを確認してください。"
+
+def _classify_and_generate(plain_text_transcript: str, mode: str, on_progress=None) -> tuple:
+    """
+    パイプラインモードに従って分類と議事録生成を行い、(カテゴリ, 議事録) を返します。
+    """
+    chunked = _needs_chunking(plain_text_transcript)
+    if mode == "single_call" and not chunked:
+        # 分類と生成を1回で行うため、計測上は generate ステージに含める
+        with metrics.stage("generate"):
+            category, minutes_markdown = classify_and_generate_minutes(plain_text_transcript, on_progress)
+        logger.info(f"会議のカテゴリ: {category} (single_call)")
+        logger.info(f"Markdown議事録の生成が完了しました。(キャッシュ: {_result_cache.stats()})")
+        return category, minutes_markdown
+
+    # 1. 会議のカテゴリを分類
+    with metrics.stage("classify"):
+        if mode == "heuristic":
+            category = classify_meeting_transcript_heuristic(plain_text_transcript)
+        elif mode in ("prefix", "single_call"):
+            # single_call でも分割要約が必要な長さの場合は prefix 方式で分類する
+            category = classify_meeting_transcript(_prefix_for_classification(plain_text_transcript))
+        elif chunked:
+            # 長い文字起こしは冒頭のチャンクのみで分類する
+            category = classify_meeting_transcript(split_transcript_into_chunks(plain_text_transcript)[0])
+        else:
+            category = classify_meeting_transcript(plain_text_transcript)
+    logger.info(f"会議のカテゴリ: {category} ({mode})")
+
+    # 2. 分類されたカテゴリに基づいて議事録を生成
+    with metrics.stage("generate"):
+        minutes_markdown = generate_meeting_minutes(plain_text_transcript, category, on_progress)
+    logger.info(f"Markdown議事録の生成が完了しました。(キャッシュ: {_result_cache.stats()})")
+    return category, minutes_markdown
+
+def _process_thread_transcript(plain_text_transcript: str, thread_key: str, mode: str, on_progress=None,
+                               mention_key: str = None) -> str:
+    """
+    スレッドの要約状態を使って議事録を生成します。
+    スレッドで要約済みの会議のうち、行の重複率が THREAD_STATE_MIN_OVERLAP 以上のもの (続きのパートを含む
+    文字起こしや修正版) があれば、前回のカテゴリを再利用して、要約済みでない行だけを前回の議事録に統合します。
+    該当がない場合 (初回・別の会議・同じメンションに添付された別のファイル) は通常どおり分類・生成します。
+    """
+    meetings = thread_state.meetings_of(_thread_state_store.get(thread_key))
+    line_hashes = thread_state.diff_lines(plain_text_transcript, None)[1]
+    index = thread_state.find_related_meeting(meetings, line_hashes, exclude_mention=mention_key)
+    if index is None:
+        if meetings:
+            logger.info(f"スレッドで要約済みの会議の続き・修正版ではないため、最初から要約します: {thread_key}")
+        meeting = None
+        category, minutes_markdown = _classify_and_generate(plain_text_transcript, mode, on_progress)
+    else:
+        meeting = meetings.pop(index)
+        new_text, _ = thread_state.diff_lines(plain_text_transcript, meeting.get("line_hashes"))
+        category = meeting.get("category", "その他")
+        job_metrics = metrics.current()
+        if job_metrics is not None:
+            job_metrics.set(pipeline_mode="incremental")
+        metrics.incr("incremental_new_chars", len(new_text))
+        if not new_text.strip():
+            logger.info(f"スレッドで要約済みの内容と同じため、前回の議事録を返します: {thread_key}")
+            return meeting["minutes"]
+        logger.info(
+            f"スレッドの前回の議事録に差分を統合します: {thread_key} (カテゴリ: {category}, "
+            f"差分 {len(new_text)}/{len(plain_text_transcript)}文字)"
+        )
+        with metrics.stage("generate"):
+            minutes_markdown = merge_meeting_minutes(meeting["minutes"], new_text, on_progress)
+
+    # 更新した会議を末尾 (最新) に置き、古い会議から捨てる
+    meetings.append({
+        "category": category,
+        "minutes": minutes_markdown,
+        "line_hashes": thread_state.merge_line_hashes(meeting.get("line_hashes") if meeting else None, line_hashes),
+        "runs": (meeting.get("runs", 0) if meeting else 0) + 1,
+        "mention": mention_key,
+    })
+    _thread_state_store.put(thread_key, {"meetings": meetings[-thread_state.THREAD_STATE_MAX_MEETINGS:]})
+    return minutes_markdown
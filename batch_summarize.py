@@ -0,0 +1,332 @@
+"""
+過去の文字起こしファイル (VTT/TXT) をまとめて議事録化するバッチ処理。
+Slackを介さず、ディレクトリまたはマニフェストに列挙されたファイルを
+text_extractor → (transcript_compactor) → ai_processor.process_meeting_transcript の順に処理します。
+
+    python batch_summarize.py ARCHIVE_DIR --output-dir minutes/ [--jsonl minutes.jsonl]
+    python batch_summarize.py --manifest files.txt --output-dir minutes/ --checkpoint batch.ckpt
+
+チェックポイントファイルを指定すると、処理済みのファイル (内容が変わっていないもの) は再実行時にスキップします。
+マニフェストは1行1パスのテキスト、または "path" キーを持つJSON Linesです (相対パスはマニフェストの場所から解決)。
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import ai_processor
+import llm_client
+import slack_utils
+import text_extractor
+import transcript_compactor
+
+logger = logging.getLogger(__name__)
+
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+GEMINI_MODEL_NAME = os.environ.get("GEMINI_MODEL_NAME", "gemini-2.0-flash")
+
+# 並列に処理するファイル数
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "4"))
+# 同時に実行中にできるGemini API呼び出しの上限 (全ワーカー・チャンク処理で共有)
+BATCH_LLM_CONCURRENCY = int(os.environ.get("BATCH_LLM_CONCURRENCY", str(llm_client.LLM_MAX_CONCURRENCY)))
+# コスト見積もり用の100万トークンあたりの料金 (USD)
+GEMINI_INPUT_PRICE_PER_1M_TOKENS = float(os.environ.get("GEMINI_INPUT_PRICE_PER_1M_TOKENS", "0.10"))
+GEMINI_OUTPUT_PRICE_PER_1M_TOKENS = float(os.environ.get("GEMINI_OUTPUT_PRICE_PER_1M_TOKENS", "0.40"))
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+STATUS_UNSUPPORTED = "unsupported"
+
+
+def discover_files(root):
+    """
+    ディレクトリ以下の対応形式のファイルをパス順に返します。
+    """
+    paths = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if text_extractor.select_extractor(file_name) is not None:
+                paths.append(os.path.join(dir_path, file_name))
+    return paths
+
+
+def read_manifest(manifest_path):
+    """
+    マニフェストからファイルパスの一覧を読み込みます。空行と # で始まる行は無視します。
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    paths = []
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            path = json.loads(line)["path"] if line.startswith("{") else line
+            paths.append(path if os.path.isabs(path) else os.path.join(base_dir, path))
+    return paths
+
+
+def file_fingerprint(path):
+    """
+    ファイルが更新されたかを判定するための値 (サイズと更新時刻)。
+    """
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class Checkpoint:
+    """
+    処理結果を1ファイル1行のJSON Linesで追記していくチェックポイント。
+    途中で中断しても、書き込み済みの行までは再実行時に引き継がれます。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._done = {} # path -> fingerprint
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 書き込み途中で中断された最終行は無視する
+                        continue
+                    if entry.get("status") == STATUS_OK:
+                        self._done[entry["path"]] = entry.get("fingerprint")
+                    else:
+                        self._done.pop(entry["path"], None)
+        self._file = open(path, "a", encoding="utf-8") if path else None
+
+    def is_done(self, path, fingerprint):
+        return self._done.get(path) == fingerprint
+
+    def __len__(self):
+        return len(self._done)
+
+    def record(self, path, fingerprint, status):
+        if self._file is None:
+            return
+        with self._lock:
+            self._file.write(json.dumps({"path": path, "fingerprint": fingerprint, "status": status}, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            if status == STATUS_OK:
+                self._done[path] = fingerprint
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class MinutesWriter:
+    """
+    議事録をファイルごとのMarkdownと、まとめたJSON Linesに書き出します。
+    """
+
+    def __init__(self, output_dir=None, jsonl_path=None, base_dir=None):
+        self.output_dir = output_dir
+        self.base_dir = base_dir
+        self._lock = threading.Lock()
+        self._jsonl = open(jsonl_path, "a", encoding="utf-8") if jsonl_path else None
+
+    def markdown_path(self, path):
+        """
+        議事録のMarkdownのパス。同じディレクトリの a.vtt と a.txt が上書きし合わないよう、元の拡張子を残します (a.vtt.md)。
+        """
+        relative = os.path.relpath(path, self.base_dir) if self.base_dir else os.path.basename(path)
+        if relative.startswith(".."):
+            relative = os.path.basename(path)
+        return os.path.join(self.output_dir, relative + ".md")
+
+    def write(self, result):
+        if self.output_dir and result["status"] == STATUS_OK:
+            md_path = self.markdown_path(result["path"])
+            os.makedirs(os.path.dirname(md_path), exist_ok=True)
+            with open(md_path, "w", encoding="utf-8") as f:
+                f.write(result["minutes"])
+            result["output"] = md_path
+        if self._jsonl is not None:
+            with self._lock:
+                self._jsonl.write(json.dumps(result, ensure_ascii=False) + "\n")
+                self._jsonl.flush()
+
+    def close(self):
+        if self._jsonl is not None:
+            self._jsonl.close()
+
+
+def _iter_file_chunks(path, chunk_size=slack_utils.DOWNLOAD_CHUNK_SIZE):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def summarize_file(path):
+    """
+    1ファイルを議事録化します。例外は呼び出し元に伝播させず、結果の辞書に格納して返します。
+    """
+    start = time.perf_counter()
+    result = {"path": path, "status": STATUS_OK}
+    try:
+        extractor, chunks = text_extractor.detect_extractor(path, None, _iter_file_chunks(path))
+        if extractor is None:
+            result["status"] = STATUS_UNSUPPORTED
+            return result
+        # Slackからのダウンロード時と同じく、文字コードを判定しながら行単位で読み込む (バイナリ形式はそのまま渡す)
+        text = extractor(chunks if extractor.binary else slack_utils.decode_lines(chunks))
+        result["transcript_tokens"] = ai_processor.estimate_tokens(text)
+        if transcript_compactor.COMPACTION_ENABLED:
+            text = transcript_compactor.compact_transcript(text).text
+        result["minutes"] = ai_processor.process_meeting_transcript(text, raise_on_error=True)
+    except Exception as e:
+        logger.error(f"File processing error for '{path}': {e}", exc_info=True)
+        result["status"] = STATUS_ERROR
+        result["error"] = str(e)
+    finally:
+        result["elapsed_s"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def estimate_cost(usage):
+    """
+    推定トークン数からコスト (USD) を見積もります。
+    """
+    return (usage["input_tokens"] * GEMINI_INPUT_PRICE_PER_1M_TOKENS
+            + usage["output_tokens"] * GEMINI_OUTPUT_PRICE_PER_1M_TOKENS) / 1_000_000
+
+
+def run_batch(paths, output_dir=None, jsonl_path=None, checkpoint_path=None, workers=None, base_dir=None):
+    """
+    ファイル群をスレッドプールで並列に議事録化し、集計結果を返します。
+    Gemini API呼び出しの同時実行数は ai_processor の LLMClient が全スレッドで共有して制限します。
+    """
+    workers = workers or BATCH_WORKERS
+    checkpoint = Checkpoint(checkpoint_path)
+    writer = MinutesWriter(output_dir, jsonl_path, base_dir)
+    usage_before = ai_processor.get_token_usage()
+    llm_stats_before = ai_processor.get_llm_client().stats()
+    counts = {STATUS_OK: 0, STATUS_ERROR: 0, STATUS_UNSUPPORTED: 0, "skipped": 0}
+    transcript_tokens = 0
+
+    pending = []
+    unreadable = []
+    for path in paths:
+        try:
+            fingerprint = file_fingerprint(path)
+        except OSError as e:
+            # 存在しない・読めないファイルは失敗として記録し、残りのファイルの処理を続ける
+            logger.error(f"File processing error for '{path}': {e}")
+            unreadable.append({"path": path, "status": STATUS_ERROR, "error": str(e), "elapsed_s": 0.0})
+            continue
+        if checkpoint.is_done(path, fingerprint):
+            counts["skipped"] += 1
+        else:
+            pending.append((path, fingerprint))
+    logger.info(f"{len(pending)} 件のファイルを処理します。(スキップ: {counts['skipped']} 件, 並列数: {workers})")
+
+    start = time.perf_counter()
+    try:
+        for result in unreadable:
+            counts[STATUS_ERROR] += 1
+            writer.write(result)
+            checkpoint.record(result["path"], None, STATUS_ERROR)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(summarize_file, path): (path, fingerprint) for path, fingerprint in pending}
+            for done, future in enumerate(as_completed(futures), 1):
+                path, fingerprint = futures[future]
+                result = future.result()
+                counts[result["status"]] += 1
+                transcript_tokens += result.get("transcript_tokens", 0)
+                writer.write(result)
+                checkpoint.record(path, fingerprint, result["status"])
+                logger.info(f"[{done}/{len(pending)}] {path}: {result['status']} ({result['elapsed_s']}秒)")
+    finally:
+        writer.close()
+        checkpoint.close()
+    elapsed = time.perf_counter() - start
+
+    usage_after = ai_processor.get_token_usage()
+    usage = {name: usage_after[name] - usage_before[name] for name in usage_after}
+    llm_stats_after = ai_processor.get_llm_client().stats()
+    processed = counts[STATUS_OK] + counts[STATUS_ERROR]
+    return {
+        "files": len(paths),
+        **counts,
+        "elapsed_s": round(elapsed, 3),
+        "files_per_minute": round(processed / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "transcript_tokens": transcript_tokens,
+        "llm_calls": usage["calls"],
+        "llm_retries": llm_stats_after["retries"] - llm_stats_before["retries"],
+        "input_tokens": usage["input_tokens"],
+        "output_tokens": usage["output_tokens"],
+        "cache": ai_processor.get_result_cache().stats(),
+        "estimated_cost_usd": round(estimate_cost(usage), 4),
+    }
+
+
+def format_stats(stats):
+    return "\n".join([
+        f"ファイル数: {stats['files']} (成功: {stats[STATUS_OK]}, 失敗: {stats[STATUS_ERROR]}, "
+        f"未対応: {stats[STATUS_UNSUPPORTED]}, スキップ: {stats['skipped']})",
+        f"処理時間: {stats['elapsed_s']}秒 ({stats['files_per_minute']} ファイル/分)",
+        f"Gemini API呼び出し: {stats['llm_calls']} 回 (リトライ: {stats['llm_retries']} 回, "
+        f"キャッシュヒット: {stats['cache']['hits']} 回)",
+        f"推定トークン数: 入力 {stats['input_tokens']} / 出力 {stats['output_tokens']} "
+        f"(文字起こし合計 {stats['transcript_tokens']})",
+        f"推定コスト: ${stats['estimated_cost_usd']}",
+    ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("directory", nargs="?", help="文字起こしファイルを含むディレクトリ (サブディレクトリも対象)")
+    source.add_argument("--manifest", help="処理するファイルの一覧")
+    parser.add_argument("--output-dir", help="議事録のMarkdownを書き出すディレクトリ")
+    parser.add_argument("--jsonl", help="結果をJSON Linesで追記するファイル")
+    parser.add_argument("--checkpoint", help="再開用のチェックポイントファイル")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="並列に処理するファイル数")
+    parser.add_argument("--llm-concurrency", type=int, default=BATCH_LLM_CONCURRENCY,
+                        help="同時に実行中にできるGemini API呼び出しの上限")
+    parser.add_argument("--stats-json", help="集計結果をJSONで書き出すファイル")
+    args = parser.parse_args(argv)
+    if not (args.output_dir or args.jsonl):
+        parser.error("--output-dir か --jsonl のいずれかを指定してください。")
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    if not GEMINI_API_KEY:
+        parser.error("GEMINI_API_KEY が設定されていません。")
+    ai_processor.set_gemini_client_and_model(GEMINI_API_KEY, model_name=GEMINI_MODEL_NAME)
+    ai_processor.set_llm_client(llm_client.LLMClient(
+        concurrency=llm_client.AdaptiveConcurrencyLimiter(max_limit=args.llm_concurrency),
+    ))
+
+    if args.manifest:
+        paths = read_manifest(args.manifest)
+        base_dir = os.path.dirname(os.path.abspath(args.manifest))
+    else:
+        paths = discover_files(args.directory)
+        base_dir = args.directory
+
+    try:
+        stats = run_batch(paths, args.output_dir, args.jsonl, args.checkpoint, args.workers, base_dir)
+    finally:
+        text_extractor.shutdown_process_pool()
+    print(format_stats(stats))
+    if args.stats_json:
+        with open(args.stats_json, "w", encoding="utf-8") as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+    return 0 if stats[STATUS_ERROR] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+文字起こし圧縮 (transcript_compactor) によるトークン削減量を計測し、
+圧縮後のテキストで全プロンプトテンプレートが問題なく組み立てられることを確認します。
+
+    python benchmarks/bench_compaction.py [--lines 2000] [ファイル ...]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_processor
+import text_extractor
+import transcript_compactor
+
+
+def make_noisy_transcript(n_lines, seed=0):
+    """
+    フィラー・ロールアップ字幕・重複を含む合成の文字起こしを生成します。
+    """
+    rng = random.Random(seed)
+    fillers = ("えーと、", "あのー、", "まあ、", "うーん、", "")
+    topics = ("障害の原因はDBの接続数です", "来週までに見積を出します", "画面の仕様を確認させてください", "ログを共有します")
+    lines = []
+    for i in range(n_lines):
+        speaker = rng.choice(("山田", "Suzuki", "佐藤"))
+        sentence = rng.choice(topics)
+        stamp = f"[{i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d}]"
+        # ロールアップ字幕 (途中経過 → 完成形) を再現する
+        if rng.random() < 0.3:
+            lines.append(f"{stamp} {speaker}: {sentence[:len(sentence) // 2]}")
+        lines.append(f"{stamp} {speaker}: {rng.choice(fillers)}{sentence}")
+        if rng.random() < 0.2:
+            lines.append(f"{stamp} {speaker}: {sentence}。")
+        if rng.random() < 0.1:
+            lines.append(f"{stamp} {speaker}: うーん")
+    return "\n".join(lines)
+
+
+def check_prompt_templates(text):
+    """
+    圧縮後のテキストで全テンプレートを組み立て、本文が欠けずに埋め込まれることを確認します。
+    """
+    builders = (
+        ai_processor.generate_classify_meeting_prompt,
+        ai_processor.generate_presales_minutes_prompt,
+        ai_processor.generate_requirements_minutes_prompt,
+        ai_processor.generate_maintenance_minutes_prompt,
+        ai_processor.generate_misc_minutes_prompt,
+        ai_processor.generate_classify_and_minutes_prompt,
+        lambda t: ai_processor.generate_chunk_summary_prompt(t, 1, 1),
+        lambda t: ai_processor.generate_merge_minutes_prompt("", t),
+    )
+    for build in builders:
+        prompt = build(text)
+        if text not in prompt or "{text}" in prompt:
+            raise AssertionError(f"テンプレートの組み立てに失敗しました: {build}")
+    return len(builders)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="計測する .vtt / .txt ファイル (省略時は合成データ)")
+    parser.add_argument("--lines", type=int, default=2000)
+    parser.add_argument("--json", help="結果をJSONで書き出すファイルパス")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    samples = []
+    for path in args.files:
+        with open(path, "rb") as f:
+            if path.lower().endswith(".vtt"):
+                samples.append((path, text_extractor.extract_speaker_text_from_vtt(f)))
+            else:
+                samples.append((path, text_extractor.extract_text_from_txt(f.read().decode("utf-8"))))
+    if not samples:
+        samples.append((f"synthetic({args.lines} lines)", make_noisy_transcript(args.lines)))
+
+    results = []
+    for name, text in samples:
+        start = time.perf_counter()
+        compaction = transcript_compactor.compact_transcript(text)
+        elapsed = time.perf_counter() - start
+        templates = check_prompt_templates(compaction.text)
+        results.append({
+            "sample": name,
+            "original_tokens": compaction.original_tokens,
+            "compacted_tokens": compaction.compacted_tokens,
+            "ratio": round(compaction.ratio, 3),
+            "removed_lines": compaction.removed_lines,
+            "seconds": round(elapsed, 4),
+            "templates_checked": templates,
+        })
+        print(f"{name}: {compaction.original_tokens} -> {compaction.compacted_tokens} tokens "
+              f"(ratio {compaction.ratio:.2f}, removed {compaction.removed_lines} lines, {elapsed:.3f}s), "
+              f"{templates} templates OK")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""
+lambda_handler のエンドツーエンドの負荷試験。
+Slack Web API・ファイルダウンロード・Gemini をローカルの代替サーバー (遅延とエラー率を指定可能) に置き換え、
+合成の app_mention イベントを目標のレートで lambda_handler に流し込みます (オープンループ)。
+シナリオごとに新しいPythonプロセスで実行し (環境変数による設定とメモリ計測を分離するため)、
+ハンドラの応答時間と、Slackに結果が届くまでの時間 (エンドツーエンド) の p50/p95/p99、スループット、
+最大メモリ、LLM呼び出し回数、Slack API呼び出し回数を計測して JSON に書き出します。
+
+    python benchmarks/bench_e2e_load.py [--scenarios baseline multi_file ...] [--events 40] [--rate 4]
+                                        [--output results.json] [--compare previous.json]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 全シナリオ共通の環境変数 (メトリクスのログ出力は計測の邪魔になるため止め、ヒストグラムだけ集計する)
+BASE_ENV = {
+    "SLACK_BOT_TOKEN": "xoxb-dummy",
+    "GEMINI_API_KEY": "dummy-key",
+    "METRICS_ENABLED": "false",
+    "PAYLOAD_LOG_SAMPLE_RATE": "0",
+}
+
+# シナリオ: files は1メンションに添付するファイルの種類、env はシナリオ固有の環境変数、
+# gemini / slack / download は代替サーバーの遅延・エラーの設定 (既定値を上書きする)
+SCENARIOS = {
+    "baseline": {
+        "description": "1ファイル (TXT) のメンション、two_step",
+        "files": ["txt"],
+    },
+    "multi_file": {
+        "description": "3ファイル (VTT / SRT / Teams JSON) のメンション",
+        "files": ["vtt", "srt", "json"],
+    },
+    "long_meeting": {
+        "description": "長時間会議のVTT (分割要約)",
+        "files": ["vtt_long"],
+        "events_scale": 0.25,
+        "env": {"CHUNKED_THRESHOLD_TOKENS": "30000"},
+    },
+    "single_call": {
+        "description": "PIPELINE_MODE=single_call",
+        "files": ["txt"],
+        "env": {"PIPELINE_MODE": "single_call"},
+    },
+    "streaming": {
+        "description": "STREAMING_ENABLED=true (処理中メッセージを随時更新)",
+        "files": ["txt"],
+        "env": {"STREAMING_ENABLED": "true", "STREAM_UPDATE_INTERVAL_SECONDS": "0.2"},
+    },
+    "llm_errors": {
+        "description": "Gemini のエラー率 10%・テール遅延 5%",
+        "files": ["txt"],
+        "gemini": {"error_rate": 0.1, "slow_rate": 0.05, "slow_latency": 1.0},
+        "env": {"LLM_BACKOFF_BASE_SECONDS": "0.2", "LLM_BACKOFF_MAX_SECONDS": "2"},
+    },
+    "slack_pressure": {
+        "description": "全メンションが1チャンネル、Slackの投稿間隔の制限 1秒",
+        "files": ["txt"],
+        "channels": 1,
+        "slack": {"min_interval": 1.0},
+    },
+    "async_queue": {
+        "description": "PROCESSING_MODE=async (キューに積んで即時応答し、ワーカーで処理)",
+        "files": ["txt"],
+        "env": {"PROCESSING_MODE": "async"},
+    },
+}
+
+FILE_NAMES = {"txt": "meeting.txt", "vtt": "meeting.vtt", "vtt_long": "long_meeting.vtt", "srt": "meeting.srt",
+              "json": "meeting.json"}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _summary(values):
+    return {
+        "p50_s": _round(percentile(values, 50)),
+        "p95_s": _round(percentile(values, 95)),
+        "p99_s": _round(percentile(values, 99)),
+        "max_s": _round(max(values) if values else None),
+    }
+
+
+def _round(value, digits=3):
+    return None if value is None else round(value, digits)
+
+
+def _clock(seconds, separator="."):
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}{separator}000"
+
+
+def make_file(kind, index, lines):
+    """
+    イベントごとに内容の異なる (結果キャッシュが効かない) 合成の文字起こしを生成します。
+    """
+    from benchmarks.fakes import make_transcript
+
+    n_lines = lines * 15 if kind == "vtt_long" else lines
+    utterances = [f"会議{index}の記録。"] + make_transcript(n_lines).split("\n")
+    if kind == "txt":
+        return "\n".join(utterances)
+    if kind == "json":
+        entries = []
+        for i, line in enumerate(utterances):
+            speaker, _, text = line.partition(": ")
+            entries.append({"text": text or speaker, "speakerDisplayName": speaker if text else None,
+                            "startOffset": f"{_clock(i * 3)}0000"})
+        return json.dumps({"entries": entries}, ensure_ascii=False)
+    separator = "," if kind == "srt" else "."
+    blocks = ["WEBVTT\n"] if kind != "srt" else []
+    for i, line in enumerate(utterances):
+        speaker, _, text = line.partition(": ")
+        payload = f"<v {speaker}>{text}</v>" if kind != "srt" and text else line
+        blocks.append(f"{i + 1}\n{_clock(i * 3, separator)} --> {_clock(i * 3 + 3, separator)}\n{payload}\n")
+    return "\n".join(blocks)
+
+
+def build_events(config, file_server):
+    events = []
+    for i in range(config["events"]):
+        ts = f"{1700000000 + i}.000100"
+        files = []
+        for j, kind in enumerate(config["files"]):
+            name = f"e{i}_f{j}_{FILE_NAMES[kind]}"
+            url = file_server.add(name, make_file(kind, i, config["lines"]))
+            files.append({"id": f"F{i:05d}{j}", "name": name, "mimetype": None, "url_private": url})
+        body = {
+            "event_id": f"Ev{i:06d}",
+            "event": {"type": "app_mention", "channel": f"C{i % config['channels']}", "user": "U1", "ts": ts,
+                      "text": "<@UBOT> 議事録お願いします", "files": files},
+        }
+        events.append((ts, {"body": json.dumps(body, ensure_ascii=False), "headers": {}}))
+    return events
+
+
+def run_child(config_path, output_path):
+    """
+    (子プロセス) 1シナリオを実行して結果を output_path に書き出します。
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    # 環境変数はモジュールの読み込み時に参照されるため、リポジトリのモジュールより先に設定する
+    os.environ.update(BASE_ENV)
+    os.environ.update(config["env"])
+    warnings.filterwarnings("ignore")
+
+    from benchmarks.fakes import FakeFileServer, FakeGeminiServer, FakeSlackServer
+
+    gemini = FakeGeminiServer(seed=1, **config["gemini"]).start()
+    slack = FakeSlackServer(**config["slack"]).start()
+    file_server = FakeFileServer(seed=1, **config["download"]).start()
+
+    import ai_processor
+    import lambda_function
+    import metrics
+    import slack_delivery
+
+    ai_processor.GEMINI_API_ENDPOINT = gemini.endpoint
+    slack_delivery.SLACK_API_BASE_URL = slack.base_url
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    events = build_events(config, file_server)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # 非同期モードはワーカー (worker_handler) を別スレッドで回す
+    stop_workers = threading.Event()
+
+    def worker_loop():
+        while True:
+            lambda_function.worker_handler({}, None)
+            if stop_workers.is_set() and len(lambda_function._get_job_queue()) == 0:
+                return
+            time.sleep(0.02)
+
+    workers = []
+    if config["env"].get("PROCESSING_MODE") == "async":
+        workers = [threading.Thread(target=worker_loop, daemon=True) for _ in range(config["concurrency"])]
+        for worker in workers:
+            worker.start()
+
+    def invoke(event):
+        try:
+            response = lambda_function.lambda_handler(event, None)
+            ok = response.get("statusCode") == 200
+        except Exception:
+            ok = False
+        return time.monotonic(), ok
+
+    start = time.monotonic()
+    scheduled = []
+    # オープンループ: 前のイベントの完了を待たずに目標レートでイベントを投入する
+    # (同時実行数は Lambda の同時実行数の上限に相当する)
+    with ThreadPoolExecutor(max_workers=config["concurrency"]) as executor:
+        futures = []
+        for i, (ts, event) in enumerate(events):
+            at = start + i / config["rate"]
+            delay = at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            scheduled.append((ts, at))
+            futures.append(executor.submit(invoke, event))
+        outcomes = [future.result() for future in futures]
+    stop_workers.set()
+    for worker in workers:
+        worker.join()
+    end = time.monotonic()
+
+    handler_latencies = [done - at for (done, _), (_, at) in zip(outcomes, scheduled)]
+    e2e_latencies = []
+    undelivered = 0
+    for ts, at in scheduled:
+        last_write = slack.thread_activity.get(ts)
+        if last_write is None:
+            undelivered += 1
+        else:
+            e2e_latencies.append(last_write - at)
+    finished = max([at + latency for (_, at), latency in zip(scheduled, e2e_latencies)] + [end]) if e2e_latencies else end
+
+    gemini_stats = gemini.stats()
+    slack_stats = slack.stats()
+    usage = ai_processor.get_token_usage()
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result = {
+        "scenario": config["name"],
+        "description": config["description"],
+        "events": len(events),
+        "files_per_event": len(config["files"]),
+        "target_rate_eps": config["rate"],
+        "concurrency": config["concurrency"],
+        "duration_s": _round(end - start),
+        "throughput_eps": _round(len(e2e_latencies) / (finished - start) if finished > start else None),
+        "handler": _summary(handler_latencies),
+        "e2e": _summary(e2e_latencies),
+        "handler_errors": sum(1 for _, ok in outcomes if not ok),
+        "undelivered": undelivered,
+        "llm_requests": gemini_stats["calls"],
+        "llm_injected_errors": gemini_stats["errors"],
+        "llm_calls": usage["calls"],
+        "llm_calls_per_event": _round(usage["calls"] / len(events)),
+        "llm_input_tokens": usage["input_tokens"],
+        "slack_calls": slack_stats["calls"],
+        "slack_rate_limited": slack_stats["rate_limited"],
+        "downloads": file_server.stats()["downloads"],
+        # ru_maxrss は Linux では KB 単位 (代替サーバーのスレッドも同じプロセスに含まれる)
+        "rss_peak_mb": _round(rss_peak / 1024, 1),
+        "rss_growth_mb": _round((rss_peak - rss_before) / 1024, 1),
+        "stages_ms": metrics.histograms(),
+    }
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    for server in (gemini, slack, file_server):
+        server.stop()
+
+
+def scenario_config(name, args):
+    scenario = SCENARIOS[name]
+    return {
+        "name": name,
+        "description": scenario["description"],
+        "files": scenario["files"],
+        "events": max(1, int(args.events * scenario.get("events_scale", 1))),
+        "rate": args.rate * scenario.get("events_scale", 1),
+        "concurrency": args.concurrency,
+        "channels": scenario.get("channels", args.channels),
+        "lines": args.lines,
+        "env": dict(scenario.get("env", {})),
+        "gemini": dict({"base_latency": args.llm_latency, "latency_per_1k_tokens": args.llm_latency_per_1k_tokens},
+                       **scenario.get("gemini", {})),
+        "slack": dict({"min_interval": args.slack_min_interval, "latency": args.slack_latency}, **scenario.get("slack", {})),
+        "download": dict({"latency": args.download_latency}, **scenario.get("download", {})),
+    }
+
+
+def run_scenario(name, args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = os.path.join(tmp_dir, "config.json")
+        output_path = os.path.join(tmp_dir, "result.json")
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump(scenario_config(name, args), f, ensure_ascii=False)
+        output = None if args.verbose else subprocess.DEVNULL
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", config_path, output_path],
+            cwd=ROOT, stdout=output, stderr=output, timeout=args.timeout,
+        )
+        if completed.returncode != 0 or not os.path.exists(output_path):
+            return {"scenario": name, "error": f"子プロセスが異常終了しました (returncode={completed.returncode})"}
+        with open(output_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_results(results):
+    print(f"{'scenario':<15} {'eps':>6} {'e2e p50':>8} {'p95':>7} {'p99':>7} {'handler p95':>11} "
+          f"{'llm/ev':>7} {'slack':>6} {'429':>4} {'lost':>5} {'rss MB':>7}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['scenario']:<15} {r['error']}")
+            continue
+        print(f"{r['scenario']:<15} {r['throughput_eps'] or 0:>6.2f} {r['e2e']['p50_s'] or 0:>8.3f} "
+              f"{r['e2e']['p95_s'] or 0:>7.3f} {r['e2e']['p99_s'] or 0:>7.3f} {r['handler']['p95_s'] or 0:>11.3f} "
+              f"{r['llm_calls_per_event']:>7.2f} {r['slack_calls']:>6} {r['slack_rate_limited']:>4} "
+              f"{r['undelivered']:>5} {r['rss_peak_mb']:>7.1f}")
+
+
+def print_comparison(results, previous_path):
+    """
+    前回の結果ファイルと、シナリオごとの主要な値を比較して表示します。
+    """
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = {r["scenario"]: r for r in json.load(f)["results"] if "error" not in r}
+    print(f"\ncompared with {previous_path}")
+    metrics_to_compare = (
+        ("e2e p95", lambda r: r["e2e"]["p95_s"]),
+        ("throughput", lambda r: r["throughput_eps"]),
+        ("llm/event", lambda r: r["llm_calls_per_event"]),
+        ("rss MB", lambda r: r["rss_peak_mb"]),
+    )
+    for r in results:
+        before = previous.get(r["scenario"])
+        if before is None or "error" in r:
+            continue
+        parts = []
+        for label, get in metrics_to_compare:
+            old, new = get(before), get(r)
+            if old is None or new is None:
+                continue
+            change = f"{(new - old) / old:+.1%}" if old else "n/a"
+            parts.append(f"{label} {old} -> {new} ({change})")
+        print(f"{r['scenario']:<15} " + "  ".join(parts))
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        run_child(sys.argv[2], sys.argv[3])
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--events", type=int, default=40, help="シナリオごとのイベント数")
+    parser.add_argument("--rate", type=float, default=4.0, help="イベントの投入レート (件/秒)")
+    parser.add_argument("--concurrency", type=int, default=8, help="ハンドラの同時実行数の上限")
+    parser.add_argument("--channels", type=int, default=8, help="イベントを振り分けるチャンネル数")
+    parser.add_argument("--lines", type=int, default=200, help="文字起こしの行数 (長時間会議はこの15倍)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="代替Geminiの基本遅延 (秒)")
+    parser.add_argument("--llm-latency-per-1k-tokens", type=float, default=0.02)
+    parser.add_argument("--slack-min-interval", type=float, default=1.0, help="代替Slack APIのチャンネルごとの投稿間隔 (秒)")
+    parser.add_argument("--slack-latency", type=float, default=0.02)
+    parser.add_argument("--download-latency", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=600, help="シナリオごとの制限時間 (秒)")
+    parser.add_argument("--output", default="bench_e2e_load.json", help="結果を書き出すJSONファイル")
+    parser.add_argument("--compare", help="比較する前回の結果ファイル")
+    parser.add_argument("--verbose", action="store_true", help="子プロセスのログを表示する")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.scenarios:
+        print(f"running {name} ...", file=sys.stderr)
+        results.append(run_scenario(name, args))
+    print_results(results)
+
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "args": {name: value for name, value in vars(args).items() if name not in ("compare", "verbose")},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nresults written to {args.output}")
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+形式ごとの合成の文字起こし (VTT / SRT / Teams JSON / Zoom JSON / DOCX / TXT) で、
+形式の判定 (拡張子なしの中身による判定を含む) と抽出のスループットを計測します。
+VTT・SRT は直列の解析とプロセスプールでの並列解析を比較し、出力が一致することも確認します。
+
+    python benchmarks/bench_extractors.py [--size-mb 20] [--workers 4] [--formats vtt srt teams_json zoom_json docx txt]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import slack_utils
+import text_extractor
+
+SPEAKERS = ("山田 太郎", "Suzuki Hanako", "佐藤")
+FORMATS = ("vtt", "srt", "teams_json", "zoom_json", "docx", "txt")
+EXTENSIONS = {"vtt": ".vtt", "srt": ".srt", "teams_json": ".json", "zoom_json": ".json", "docx": ".docx", "txt": ".txt"}
+
+
+def _clock(seconds, separator="."):
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}{separator}000"
+
+
+def iter_utterances(size_bytes):
+    """
+    (番号, 開始秒, 発言者, 本文) を、本文の合計がおおよそ size_bytes になるまで返します。
+    同じ発言者が3キュー続くため、発言者ごとのまとめも計測に含まれます。
+    """
+    written = 0
+    i = 0
+    while written < size_bytes:
+        text = f"本日の議題{i}について、障害対応の進捗を確認します。"
+        yield i, i * 2, SPEAKERS[(i // 3) % len(SPEAKERS)], text
+        written += len(text.encode("utf-8")) + 40
+        i += 1
+
+
+def write_fixture(fmt, path, size_bytes):
+    if fmt == "docx":
+        paragraphs = []
+        for i, start, speaker, text in iter_utterances(size_bytes):
+            # Teams の表記 (1時間未満は M:SS、以降は H:MM:SS)
+            clock = f"{start // 3600}:{start % 3600 // 60:02d}:{start % 60:02d}" if start >= 3600 else f"{start // 60}:{start % 60:02d}"
+            paragraphs.append(f"<w:p><w:r><w:t>{escape(speaker)}   {clock}</w:t></w:r></w:p>")
+            paragraphs.append(f"<w:p><w:r><w:t>{escape(text)}</w:t></w:r></w:p>")
+        document = (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+            + "".join(paragraphs) + "</w:body></w:document>"
+        )
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("word/document.xml", document)
+            archive.writestr("[Content_Types].xml", '<?xml version="1.0"?><Types/>')
+        return
+
+    with open(path, "w", encoding="utf-8") as f:
+        if fmt == "vtt":
+            f.write("WEBVTT\n\n")
+        elif fmt == "teams_json":
+            f.write('{"$schema": "transcript", "version": "1.0.0", "entries": [\n')
+        elif fmt == "zoom_json":
+            f.write('{"meeting_id": "123", "timeline": [\n')
+        first = True
+        for i, start, speaker, text in iter_utterances(size_bytes):
+            if fmt == "vtt":
+                f.write(f"{i + 1}\n{_clock(start)} --> {_clock(start + 2)}\n<v {speaker}>{text}</v>\n\n")
+            elif fmt == "srt":
+                f.write(f"{i + 1}\n{_clock(start, ',')} --> {_clock(start + 2, ',')}\n{speaker}: {text}\n\n")
+            elif fmt == "teams_json":
+                entry = {"id": f"{i}", "text": text, "speakerDisplayName": speaker,
+                         "startOffset": f"{_clock(start)}0000", "endOffset": f"{_clock(start + 2)}0000"}
+                f.write(("" if first else ",\n") + json.dumps(entry, ensure_ascii=False))
+            elif fmt == "zoom_json":
+                entry = {"ts": _clock(start), "end_ts": _clock(start + 2), "text": text, "users": [{"username": speaker}]}
+                f.write(("" if first else ",\n") + json.dumps(entry, ensure_ascii=False))
+            else:
+                f.write(f"{speaker}: {text}\n")
+            first = False
+        if fmt in ("teams_json", "zoom_json"):
+            f.write("\n]}\n")
+
+
+def _iter_file_chunks(path, chunk_size=slack_utils.DOWNLOAD_CHUNK_SIZE):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def extract(path, file_name, mimetype):
+    # Slackからのダウンロードと同じく、チャンク → (判定) → デコード → 抽出 の順に処理する
+    extractor, chunks = text_extractor.detect_extractor(file_name, mimetype, _iter_file_chunks(path))
+    if extractor is None:
+        raise ValueError(f"形式を判定できません: {file_name}")
+    return extractor.name, extractor(chunks if extractor.binary else slack_utils.decode_lines(chunks))
+
+
+def measure(path, file_name, mimetype, repeat):
+    durations = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        name, text = extract(path, file_name, mimetype)
+        durations.append(time.perf_counter() - start)
+    return name, text, min(durations)
+
+
+def run(formats, size_mb, workers, repeat):
+    results = []
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for fmt in formats:
+            path = os.path.join(tmp_dir, f"fixture{EXTENSIONS[fmt]}")
+            write_fixture(fmt, path, size_mb * 1024 * 1024)
+            file_mb = os.path.getsize(path) / 1024 / 1024
+            # 拡張子あり / なし (中身による判定) の両方で計測する
+            # (Slackは形式を特定できないテキストファイルを text/plain として送ってくる)
+            for file_name, mimetype in ((os.path.basename(path), None), ("transcript", "text/plain")):
+                text_extractor.EXTRACT_PARALLEL_WORKERS = 1
+                name, text, seconds = measure(path, file_name, mimetype, repeat)
+                row = {
+                    "format": fmt,
+                    "file_name": file_name,
+                    "detected": name,
+                    "file_mb": round(file_mb, 1),
+                    "serial_s": round(seconds, 3),
+                    "serial_mb_per_s": round(file_mb / seconds, 1),
+                    "output_chars": len(text),
+                }
+                if name in ("vtt", "srt") and workers > 1:
+                    text_extractor.EXTRACT_PARALLEL_WORKERS = workers
+                    text_extractor.shutdown_process_pool()
+                    extract(path, file_name, mimetype) # プロセスの起動を計測から除く
+                    _, parallel_text, parallel_seconds = measure(path, file_name, mimetype, repeat)
+                    row.update({
+                        "parallel_workers": workers,
+                        "parallel_s": round(parallel_seconds, 3),
+                        "parallel_mb_per_s": round(file_mb / parallel_seconds, 1),
+                        "parallel_output_matches": parallel_text == text,
+                    })
+                results.append(row)
+    finally:
+        text_extractor.shutdown_process_pool()
+        for file_name in os.listdir(tmp_dir):
+            os.remove(os.path.join(tmp_dir, file_name))
+        os.rmdir(tmp_dir)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=20, help="各形式の合成ファイルの本文の大きさ (MB)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="並列解析のワーカー数 (1 で比較しない)")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="結果をJSONで書き出すファイルパス")
+    args = parser.parse_args()
+
+    # 並列解析は小さいまとまりでも試せるよう、しきい値をファイルの大きさに合わせて下げる
+    text_extractor.EXTRACT_PARALLEL_MIN_CHARS = min(text_extractor.EXTRACT_PARALLEL_MIN_CHARS, args.size_mb * 1024 * 1024 // 8)
+    text_extractor.EXTRACT_PARALLEL_BATCH_CHARS = min(text_extractor.EXTRACT_PARALLEL_BATCH_CHARS,
+                                                     max(65536, args.size_mb * 1024 * 1024 // (args.workers * 4)))
+    results = run(args.formats, args.size_mb, args.workers, args.repeat)
+    for r in results:
+        line = (f"{r['format']:<11} {r['file_name']:<16} -> {r['detected']:<15} {r['file_mb']:>7.1f} MB  "
+                f"output {r['output_chars']:>9} chars  serial {r['serial_mb_per_s']:>7.1f} MB/s")
+        if "parallel_s" in r:
+            line += (f"  parallel({r['parallel_workers']}) {r['parallel_mb_per_s']:>7.1f} MB/s"
+                     f"  {'same output' if r['parallel_output_matches'] else 'OUTPUT DIFFERS'}")
+        print(line)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+同じスレッドへの続きの投稿 (パート2・修正版・再投稿) を、毎回最初から要約する従来方式と、
+スレッドの要約状態を使って差分だけを統合する方式で、API呼び出し回数・入力トークン数・レイテンシを比較します。
+別の会議 (unrelated) と、同じメンションに添付された別のファイル (sibling) は統合されず、
+従来方式と同じく最初から要約されることも確認します (ratio が 1 前後になる)。
+
+    python benchmarks/bench_incremental_summary.py [--lines 600 3000] [--corrected-lines 10]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_processor
+import llm_client
+import result_cache
+import thread_state
+from benchmarks.fakes import FakeGeminiModel, make_transcript
+
+
+def make_followups(n_lines, corrected_lines):
+    """
+    (シナリオ名, 先に同じスレッドに投稿されたファイル, 続けて投稿されるファイル, 同じメンションか) のリストを返します。
+    """
+    transcript = make_transcript(n_lines).split("\n")
+    half = n_lines // 2
+    corrected = list(transcript)
+    step = max(1, n_lines // max(1, corrected_lines))
+    for i in range(0, n_lines, step)[:corrected_lines]:
+        corrected[i] = corrected[i].replace("確認", "再確認")
+    full = "\n".join(transcript)
+    other = make_transcript(n_lines, seed_words=("新機能", "の", "要件", "を", "整理", "し", "画面", "設計", "へ", "進めます"))
+    return [
+        # 会議の途中で書き出した文字起こしの後に、最後まで書き出し直したもの
+        ("part2", "\n".join(transcript[:half]), full, False),
+        ("corrected", full, "\n".join(corrected), False),
+        ("repost", full, full, False),
+        ("unrelated", other, full, False),
+        ("sibling", "\n".join(transcript[:half]), full, True),
+    ]
+
+
+def measure(func):
+    model = FakeGeminiModel(base_latency=0.02, latency_per_1k_tokens=0.01)
+    ai_processor._gemini_model = model
+    # レート制限の枠 (トークンバケット) が前の計測から持ち越されないよう、計測ごとに作り直す
+    ai_processor.set_llm_client(llm_client.LLMClient())
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    stats = model.stats()
+    return {"latency_s": round(elapsed, 3), "llm_calls": stats["calls"], "input_tokens": stats["input_tokens"]}
+
+
+def run(lines_list, corrected_lines):
+    # 同じ文字起こしの結果キャッシュが効くと比較にならないため無効化する
+    ai_processor.set_result_cache(result_cache.NullCache())
+    results = []
+    for n_lines in lines_list:
+        for name, previous, text, same_mention in make_followups(n_lines, corrected_lines):
+            baseline = measure(lambda: ai_processor.process_meeting_transcript(text, mode="two_step"))
+
+            # 先の投稿でスレッドの状態を作ってから、続きの投稿を計測する
+            ai_processor.set_thread_state_store(thread_state.InMemoryThreadStateStore())
+            ai_processor.process_meeting_transcript(previous, mode="two_step", thread_key="C1:1.0", mention_key="1.0")
+            mention_key = "1.0" if same_mention else "2.0"
+            incremental = measure(lambda: ai_processor.process_meeting_transcript(
+                text, mode="two_step", thread_key="C1:1.0", mention_key=mention_key
+            ))
+            ai_processor.set_thread_state_store(thread_state.NullThreadStateStore())
+
+            results.append({
+                "lines": n_lines,
+                "scenario": name,
+                "followup_tokens": ai_processor.estimate_tokens(text),
+                "baseline": baseline,
+                "incremental": incremental,
+                "input_token_ratio": round(incremental["input_tokens"] / baseline["input_tokens"], 3),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, nargs="+", default=[600, 3000])
+    parser.add_argument("--corrected-lines", type=int, default=10, help="修正版で書き換える行数")
+    parser.add_argument("--json", help="結果をJSONで書き出すファイルパス")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = run(args.lines, args.corrected_lines)
+    print(f"{'lines':>6} {'scenario':<10} {'tokens':>8} {'calls':>11} {'in_tokens':>17} {'latency(s)':>15} {'ratio':>6}")
+    for r in results:
+        b, i = r["baseline"], r["incremental"]
+        print(f"{r['lines']:>6} {r['scenario']:<10} {r['followup_tokens']:>8} "
+              f"{b['llm_calls']:>4} -> {i['llm_calls']:<4} {b['input_tokens']:>7} -> {i['input_tokens']:<7} "
+              f"{b['latency_s']:>6} -> {i['latency_s']:<6} {r['input_token_ratio']:>6}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+LLMクライアント層 (llm_client) を、遅延とエラーを注入するローカルの代替Geminiサーバーに対して計測します。
+実際の google.generativeai SDK を REST 通信で代替サーバーに向け、
+リトライなし / リトライあり / リトライ+ヘッジ の各設定で同時に呼び出したときの
+成功率とレイテンシ (p50/p95/p99) を比較します。
+
+    python benchmarks/bench_llm_client.py [--requests 100] [--concurrency 10] [--error-rate 0.1] [--slow-rate 0.05]
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_processor
+import llm_client
+from benchmarks.fakes import FakeGeminiServer
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_scenario(name, client, n_requests, concurrency):
+    ai_processor.set_llm_client(client)
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            ai_processor._get_gemini_response(f"リクエスト{i}: 会議の文字起こしをまとめてください。")
+            return True, time.perf_counter() - start
+        except Exception:
+            return False, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(one, range(n_requests)))
+    elapsed = time.perf_counter() - start
+    latencies = [latency for ok, latency in outcomes if ok]
+    stats = client.stats()
+    return {
+        "scenario": name,
+        "success_rate": round(len(latencies) / n_requests, 3),
+        "p50_s": round(percentile(latencies, 50) or 0, 3),
+        "p95_s": round(percentile(latencies, 95) or 0, 3),
+        "p99_s": round(percentile(latencies, 99) or 0, 3),
+        "mean_s": round(statistics.mean(latencies), 3) if latencies else None,
+        "wall_s": round(elapsed, 3),
+        **stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="テール遅延が発生する確率")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="テール遅延の秒数")
+    parser.add_argument("--latency", type=float, default=0.1, help="基本遅延の秒数")
+    parser.add_argument("--hedge-after", type=float, default=0.3)
+    parser.add_argument("--json", help="結果をJSONで書き出すファイルパス")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    warnings.filterwarnings("ignore")
+
+    server = FakeGeminiServer(
+        base_latency=args.latency, latency_per_1k_tokens=0, error_rate=args.error_rate,
+        error_status=args.error_status, slow_rate=args.slow_rate, slow_latency=args.slow_latency, seed=42,
+    ).start()
+    try:
+        ai_processor.GEMINI_API_ENDPOINT = server.endpoint
+        ai_processor.set_gemini_client_and_model("dummy-key")
+
+        def make_client(**options):
+            defaults = dict(
+                rate_limiter=llm_client.TokenBucket(rate_per_second=0),
+                concurrency=llm_client.AdaptiveConcurrencyLimiter(max_limit=args.concurrency),
+                breaker=llm_client.CircuitBreaker(failure_threshold=10 ** 6),
+                backoff_base_seconds=0.05, backoff_max_seconds=0.5, deadline_seconds=30,
+            )
+            defaults.update(options)
+            return llm_client.LLMClient(**defaults)
+
+        scenarios = (
+            ("no_retry", make_client(max_attempts=1)),
+            ("retry", make_client(max_attempts=4)),
+            ("retry_hedge", make_client(max_attempts=4, hedge_after_seconds=args.hedge_after)),
+        )
+        results = []
+        for name, client in scenarios:
+            result = run_scenario(name, client, args.requests, args.concurrency)
+            results.append(result)
+            print(f"{name:<12} success {result['success_rate']:6.1%}  p50 {result['p50_s']:6.3f}s  "
+                  f"p95 {result['p95_s']:6.3f}s  p99 {result['p99_s']:6.3f}s  "
+                  f"attempts {result['attempts']:4d}  retries {result['retries']:4d}  hedges {result['hedges']:4d}")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+パイプラインモード (two_step / prefix / heuristic / single_call) のレイテンシとトークン数を比較します。
+
+    python benchmarks/bench_pipeline_modes.py [--lines 200 2000] [--repeat 3]
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_processor
+import result_cache
+from benchmarks.fakes import FakeGeminiModel, make_transcript
+
+MODES = ("two_step", "prefix", "heuristic", "single_call")
+
+
+def run(lines_list, repeat):
+    results = []
+    for n_lines in lines_list:
+        transcript = make_transcript(n_lines)
+        for mode in MODES:
+            model = FakeGeminiModel()
+            ai_processor._gemini_model = model
+            # キャッシュが効くと比較にならないため無効化する
+            ai_processor.set_result_cache(result_cache.NullCache())
+            durations = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                ai_processor.process_meeting_transcript(transcript, mode=mode)
+                durations.append(time.perf_counter() - start)
+            stats = model.stats()
+            results.append({
+                "lines": n_lines,
+                "transcript_tokens": ai_processor.estimate_tokens(transcript),
+                "mode": mode,
+                "latency_median_s": round(statistics.median(durations), 4),
+                "llm_calls": stats["calls"] / repeat,
+                "input_tokens": stats["input_tokens"] / repeat,
+                "output_tokens": stats["output_tokens"] / repeat,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, nargs="+", default=[200, 2000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="結果をJSONで書き出すファイルパス")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    # プロンプトは相対パス (prompts/) で読み込まれるためリポジトリのルートで実行する
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    results = run(args.lines, args.repeat)
+
+    print(f"{'lines':>6} {'tokens':>8} {'mode':<12} {'latency(s)':>10} {'calls':>6} {'in_tokens':>10} {'out_tokens':>10}")
+    for r in results:
+        print(f"{r['lines']:>6} {r['transcript_tokens']:>8} {r['mode']:<12} {r['latency_median_s']:>10} "
+              f"{r['llm_calls']:>6.1f} {r['input_tokens']:>10.0f} {r['output_tokens']:>10.0f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
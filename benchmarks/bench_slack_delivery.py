@@ -0,0 +1,124 @@
+"""
+Slackへの返信を、従来の1通知1投稿と、レート制限・429リトライ・返信のまとめ送りを行う配信層で比較します。
+ローカルのモックSlack API (FakeSlackServer) に実際の slack_sdk.WebClient で送信します。
+
+    python benchmarks/bench_slack_delivery.py [--mentions 6] [--files 3] [--channels 2] [--min-interval 0.3]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import slack_delivery
+import slack_utils
+from benchmarks.fakes import FakeSlackServer
+
+
+def make_results(n_files):
+    # 議事録・未対応形式・エラーが混ざった1メンション分の結果
+    kinds = [
+        {"status": "ok", "minutes": "## 会議概要\n- 状況確認\n" * 20},
+        {"status": "unsupported"},
+        {"status": "error", "error": "Gemini APIによる処理中にエラーが発生しました"},
+    ]
+    return [(f"file{i}.txt", kinds[i % len(kinds)]) for i in range(n_files)]
+
+
+def post_baseline(client, poster, channel, index, results):
+    slack_utils.send_processing_message(client, channel, "U1", f"{index}.0")
+    for file_name, result in results:
+        if result["status"] == "ok":
+            slack_utils.send_summary_message(client, channel, "U1", file_name, result["minutes"], f"{index}.0")
+        elif result["status"] == "unsupported":
+            slack_utils.send_non_vtt_message(client, channel, "U1", file_name, "application/pdf", f"{index}.0")
+        else:
+            slack_utils.send_error_message(client, channel, "U1", file_name, result["error"], f"{index}.0")
+
+
+def post_delivery(client, poster, channel, index, results):
+    replies = slack_delivery.MentionReplies(client, poster, channel, "U1", f"{index}.0")
+    replies.start()
+    for file_name, result in results:
+        replies.add(file_name, result, "application/pdf")
+    replies.finish()
+
+
+def run(name, post, make_client, async_mode, args):
+    server = FakeSlackServer(min_interval=args.min_interval, retry_after=1).start()
+    try:
+        client = make_client(server)
+        poster = slack_delivery.SlackPoster(async_mode=async_mode)
+        results = make_results(args.files)
+        start = time.perf_counter()
+        # 複数のメンションが同時に届いた状況を再現する
+        with ThreadPoolExecutor(max_workers=args.mentions) as executor:
+            futures = [
+                executor.submit(post, client, poster, f"C{i % args.channels}", i, results)
+                for i in range(args.mentions)
+            ]
+            for future in futures:
+                future.result()
+        handler_done = time.perf_counter() - start
+        poster.drain()
+        elapsed = time.perf_counter() - start
+        stats = server.stats()
+        # 届いた結果 (ファイル名を含むメッセージ) の数で取りこぼしを数える
+        delivered = sum(
+            message["text"].count("'file") for message in server.messages.values() if message.get("text")
+        )
+        return {
+            "scenario": name,
+            "api_calls": stats["calls"],
+            "rate_limited": stats["rate_limited"],
+            "messages": stats["messages"],
+            "results_delivered": delivered,
+            "results_expected": args.mentions * args.files,
+            "handler_s": round(handler_done, 3),
+            "elapsed_s": round(elapsed, 3),
+        }
+    finally:
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mentions", type=int, default=6)
+    parser.add_argument("--files", type=int, default=3)
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--min-interval", type=float, default=0.3, help="モックSlack APIのチャンネルごとの投稿間隔 (秒)")
+    parser.add_argument("--json", help="結果をJSONで書き出すファイルパス")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    def plain_client(server):
+        from slack_sdk import WebClient
+        return WebClient(token="xoxb-dummy", base_url=server.base_url)
+
+    def delivery_client(server):
+        return slack_delivery.RateLimitedSlackClient(
+            slack_delivery.create_web_client("xoxb-dummy", base_url=server.base_url),
+            slack_delivery.ChannelRateLimiter(args.min_interval),
+        )
+
+    scenarios = [
+        ("baseline", post_baseline, plain_client, False),
+        ("delivery", post_delivery, delivery_client, False),
+        ("delivery_async", post_delivery, delivery_client, True),
+    ]
+    results = [run(name, post, make_client, async_mode, args) for name, post, make_client, async_mode in scenarios]
+    for r in results:
+        print(f"{r['scenario']:<15} calls {r['api_calls']:>4}  429s {r['rate_limited']:>3}  "
+              f"delivered {r['results_delivered']:>3}/{r['results_expected']:<3}  "
+              f"handler {r['handler_s']:>6.2f}s  total {r['elapsed_s']:>6.2f}s")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
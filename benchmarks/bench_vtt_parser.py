@@ -0,0 +1,108 @@
+"""
+VTTパーサーのスループットとピークメモリを比較します。
+従来の extract_text_from_vtt (全体をデコードして一括処理) と、ハンドラが使う
+extract_speaker_text_from_vtt (1行ずつ読みながら解析し、発言者と時刻を残した出力全体を組み立てる) を
+合成VTTファイルで計測します。どちらも出力の文字列全体を作るため、ピークメモリには出力の大きさも含まれます。
+(並列解析は bench_extractors.py で計測するため、ここでは直列で解析します)
+
+    python benchmarks/bench_vtt_parser.py [--size-mb 200] [--keep]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import text_extractor
+
+
+def write_synthetic_vtt(path, size_mb):
+    """
+    Teams形式 (<v 発言者>) の合成VTTを size_mb MB 程度の大きさで書き出します。
+    """
+    speakers = ("山田 太郎", "Suzuki Hanako", "佐藤")
+    target = size_mb * 1024 * 1024
+    written = 0
+    i = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("WEBVTT\n\n")
+        while written < target:
+            start = i * 2
+            block = (
+                f"{i + 1}\n"
+                f"{start // 3600:02d}:{start % 3600 // 60:02d}:{start % 60:02d}.000 --> "
+                f"{(start + 2) // 3600:02d}:{(start + 2) % 3600 // 60:02d}:{(start + 2) % 60:02d}.000\n"
+                f"<v {speakers[(i // 3) % len(speakers)]}>本日の議題{i}について、障害対応の進捗を確認します。</v>\n\n"
+            )
+            f.write(block)
+            written += len(block.encode("utf-8"))
+            i += 1
+    return i
+
+
+def run_legacy(path):
+    with open(path, "rb") as f:
+        content = f.read().decode("utf-8")
+    return len(text_extractor.extract_text_from_vtt(content))
+
+
+def run_speaker_text(path):
+    with open(path, "rb") as f:
+        return len(text_extractor.extract_speaker_text_from_vtt(f))
+
+
+def measure(func, path):
+    gc.collect()
+    start = time.perf_counter()
+    output_chars = func(path)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    func(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, output_chars
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--keep", action="store_true", help="生成したVTTファイルを削除しない")
+    parser.add_argument("--json", help="結果をJSONで書き出すファイルパス")
+    args = parser.parse_args()
+    text_extractor.EXTRACT_PARALLEL_WORKERS = 1
+
+    fd, path = tempfile.mkstemp(suffix=".vtt")
+    os.close(fd)
+    try:
+        cues = write_synthetic_vtt(path, args.size_mb)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f"synthetic VTT: {path} ({size_mb:.1f} MB, {cues} cues)")
+        results = []
+        for name, func in (("legacy", run_legacy), ("speaker_text", run_speaker_text)):
+            elapsed, peak, output_chars = measure(func, path)
+            results.append({
+                "parser": name,
+                "size_mb": round(size_mb, 1),
+                "seconds": round(elapsed, 3),
+                "mb_per_s": round(size_mb / elapsed, 1),
+                "peak_mb": round(peak / 1024 / 1024, 1),
+                "output_chars": output_chars,
+            })
+            print(f"{name:<12} {elapsed:8.2f}s {size_mb / elapsed:8.1f} MB/s  peak {peak / 1024 / 1024:8.1f} MB  output {output_chars} chars")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+    finally:
+        if not args.keep:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+"""
+ベンチマーク用のローカルな代替実装 (実際のAPIを呼ばずに遅延や呼び出し回数を再現する)。
+"""
+import http.server
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_processor
+
+
+def fake_response_for(prompt, category="運用保守"):
+    """
+    プロンプトの種類 (分類・分類+議事録・チャンク要約・議事録) に応じたそれらしい応答を返します。
+    """
+    minutes = "## 会議概要\n- 会議の目的: 状況確認\n- 参加者: A, B\n\n## 次のアクション\n- Aが対応する"
+    if "「カテゴリ: <" in prompt:
+        return f"カテゴリ: {category}\n{minutes}"
+    if '"category"' in prompt:
+        return f'```json\n{{"category": "{category}", "reason": "fake"}}\n```'
+    if "番目のパートです" in prompt:
+        return "- 話題: 障害対応\n- ToDo: 調査"
+    return minutes
+
+
+class FakeLatencyModel:
+    """
+    代替Geminiの遅延とエラーの分布。
+    基本遅延 + 入力トークン比例の遅延に加え、slow_rate の確率で slow_latency の遅延 (テール) を足し、
+    error_rate の確率で error_status のエラーを返します。
+    """
+
+    def __init__(self, base_latency=0.05, latency_per_1k_tokens=0.02, error_rate=0.0, error_status=503,
+                 slow_rate=0.0, slow_latency=1.0, seed=None):
+        self.base_latency = base_latency
+        self.latency_per_1k_tokens = latency_per_1k_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self, input_tokens):
+        """(遅延秒数, エラーのHTTPステータスまたは None) を返します。"""
+        with self._lock:
+            slow = self._random.random() < self.slow_rate
+            failed = self._random.random() < self.error_rate
+        latency = self.base_latency + self.latency_per_1k_tokens * input_tokens / 1000
+        if slow:
+            latency += self.slow_latency
+        return latency, (self.error_status if failed else None)
+
+
+class FakeGeminiError(Exception):
+    """
+    代替Geminiが返すエラー (google.api_core の例外と同じく code にHTTPステータスを持つ)。
+    """
+
+    def __init__(self, code, message="injected error"):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class FakeGeminiResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """
+    google.generativeai.GenerativeModel のプロセス内の代替。
+    入力トークン数に比例した遅延とエラーを注入し、呼び出し回数とトークン数を記録します。
+    """
+
+    def __init__(self, base_latency=0.05, latency_per_1k_tokens=0.02, category="運用保守", **latency_options):
+        self.latency_model = FakeLatencyModel(base_latency, latency_per_1k_tokens, **latency_options)
+        self.category = category
+        self.calls = 0
+        self.errors = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents, stream=False, request_options=None, **kwargs):
+        input_tokens = ai_processor.estimate_tokens(contents)
+        latency, error_status = self.latency_model.sample(input_tokens)
+        timeout = (request_options or {}).get("timeout")
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("fake gemini request timed out")
+        time.sleep(latency)
+        if error_status:
+            with self._lock:
+                self.errors += 1
+            raise FakeGeminiError(error_status)
+        text = fake_response_for(contents, self.category)
+        with self._lock:
+            self.output_tokens += ai_processor.estimate_tokens(text)
+        if stream:
+            # 数行ずつ返すストリーム
+            lines = text.splitlines(keepends=True)
+            return iter([FakeGeminiResponse("".join(lines[i:i + 2])) for i in range(0, len(lines), 2)])
+        return FakeGeminiResponse(text)
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "errors": self.errors,
+                    "input_tokens": self.input_tokens, "output_tokens": self.output_tokens}
+
+
+class FakeGeminiServer:
+    """
+    Gemini API (REST, v1beta) のローカルHTTPサーバー版の代替。
+    実際の google.generativeai SDK を transport="rest" で api_endpoint をこのサーバーに向けて使います。
+
+        server = FakeGeminiServer(error_rate=0.1).start()
+        genai.configure(api_key="dummy", transport="rest", client_options={"api_endpoint": server.endpoint})
+    """
+
+    def __init__(self, category="運用保守", **latency_options):
+        self.latency_model = FakeLatencyModel(**latency_options)
+        self.category = category
+        self.calls = 0
+        self.errors = 0
+        self.input_tokens = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def endpoint(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        fake = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                prompt = "".join(
+                    part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", [])
+                )
+                status, payload, content_type = fake._handle(self.path, prompt)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _handle(self, path, prompt):
+        input_tokens = ai_processor.estimate_tokens(prompt)
+        latency, error_status = self.latency_model.sample(input_tokens)
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+        time.sleep(latency)
+        if error_status:
+            with self._lock:
+                self.errors += 1
+            error = {"error": {"code": error_status, "message": "injected error", "status": "UNAVAILABLE"}}
+            return error_status, json.dumps(error).encode("utf-8"), "application/json"
+
+        def candidate(text):
+            return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}]}
+
+        text = fake_response_for(prompt, self.category)
+        if ":streamGenerateContent" in path:
+            # REST版SDKのストリーミングは応答のJSON配列を順に読み込む
+            lines = text.splitlines(keepends=True)
+            chunks = [candidate("".join(lines[i:i + 2])) for i in range(0, len(lines), 2)]
+            return 200, json.dumps(chunks, ensure_ascii=False).encode("utf-8"), "application/json"
+        return 200, json.dumps(candidate(text), ensure_ascii=False).encode("utf-8"), "application/json"
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "errors": self.errors, "input_tokens": self.input_tokens}
+
+
+def make_transcript(n_lines, seed_words=None):
+    """
+    運用保守の会議を想定した合成の文字起こしを生成します。
+    """
+    words = seed_words or ("障害", "の", "対応", "について", "確認", "します", "ログ", "監視", "復旧", "手順")
+    lines = []
+    for i in range(n_lines):
+        speaker = "山田" if i % 3 else "Suzuki"
+        body = "".join(words[(i + j) % len(words)] for j in range(12))
+        lines.append(f"{speaker}: {body}、{i}件目の件です。")
+    return "\n".join(lines)
+
+
+class FakeSlackClient:
+    """
+    slack_sdk.WebClient の代替。呼び出されたAPIと引数を記録し、成功応答を返します。
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = []
+        self._lock = threading.Lock()
+        self._ts = 0
+
+    def _record(self, method, kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls.append((method, kwargs))
+            self._ts += 1
+            return {"ok": True, "ts": f"1700000000.{self._ts:06d}"}
+
+    def __getattr__(self, method):
+        if method.startswith("_"):
+            raise AttributeError(method)
+        return lambda **kwargs: self._record(method, kwargs)
+
+
+class FakeSlackServer:
+    """
+    Slack Web API のローカルHTTPサーバー版の代替 (chat.postMessage / chat.update / chat.delete / files_upload_v2)。
+    実際の slack_sdk.WebClient を base_url=server.base_url で使います。
+    同じチャンネルへの投稿が min_interval 秒より短い間隔で届くと 429 (Retry-After 付き) を返します。
+
+        server = FakeSlackServer(min_interval=1.0).start()
+        client = WebClient(token="xoxb-dummy", base_url=server.base_url)
+    """
+
+    RATE_LIMITED_METHODS = {"chat.postMessage", "files.completeUploadExternal"}
+
+    def __init__(self, min_interval=1.0, retry_after=1, latency=0.0):
+        self.min_interval = min_interval
+        self.retry_after = retry_after
+        self.latency = latency
+        self.calls = []
+        self.rate_limited = 0
+        self.messages = {} # ts -> {"channel", "thread_ts", "text"}
+        self.thread_activity = {} # thread_ts -> 最後に投稿・更新された時刻 (time.monotonic)
+        self._last_post = {}
+        self._ts = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}/api/"
+
+    def start(self):
+        fake = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                from urllib.parse import parse_qsl, urlsplit
+
+                url = urlsplit(self.path)
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if url.path.startswith("/upload/"):
+                    status, payload, headers = 200, b"OK", {}
+                else:
+                    params = dict(parse_qsl(url.query))
+                    if "json" in (self.headers.get("Content-Type") or ""):
+                        params.update(json.loads(raw or b"{}"))
+                    else:
+                        params.update(parse_qsl(raw.decode("utf-8")))
+                    status, body, headers = fake._handle(url.path.rsplit("/", 1)[-1], params)
+                    payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _handle(self, method, params):
+        if self.latency:
+            time.sleep(self.latency)
+        channel = params.get("channel") or params.get("channel_id")
+        with self._lock:
+            self.calls.append((method, params))
+            if method in self.RATE_LIMITED_METHODS and self.min_interval > 0:
+                now = time.monotonic()
+                if now - self._last_post.get(channel, -1e9) < self.min_interval:
+                    self.rate_limited += 1
+                    return 429, {"ok": False, "error": "ratelimited"}, {"Retry-After": str(self.retry_after)}
+                self._last_post[channel] = now
+            self._ts += 1
+            ts = f"1700000000.{self._ts:06d}"
+            if method == "chat.postMessage":
+                self.messages[ts] = {"channel": channel, "thread_ts": params.get("thread_ts"), "text": params.get("text")}
+                self.thread_activity[params.get("thread_ts")] = time.monotonic()
+                return 200, {"ok": True, "channel": channel, "ts": ts}, {}
+            if method == "chat.update":
+                if params.get("ts") not in self.messages:
+                    return 200, {"ok": False, "error": "message_not_found"}, {}
+                self.messages[params["ts"]]["text"] = params.get("text")
+                self.thread_activity[self.messages[params["ts"]]["thread_ts"]] = time.monotonic()
+                return 200, {"ok": True, "channel": channel, "ts": params["ts"]}, {}
+            if method == "chat.delete":
+                self.messages.pop(params.get("ts"), None)
+                return 200, {"ok": True, "channel": channel, "ts": params.get("ts")}, {}
+            if method == "files.getUploadURLExternal":
+                file_id = f"F{self._ts:08d}"
+                upload_url = f"http://127.0.0.1:{self._server.server_port}/upload/{file_id}"
+                return 200, {"ok": True, "upload_url": upload_url, "file_id": file_id}, {}
+            if method == "files.completeUploadExternal":
+                self.messages[ts] = {"channel": channel, "thread_ts": params.get("thread_ts"),
+                                     "text": params.get("initial_comment"), "file": True}
+                self.thread_activity[params.get("thread_ts")] = time.monotonic()
+                files = json.loads(params.get("files", "[]"))
+                return 200, {"ok": True, "files": [{"id": f.get("id"), "title": f.get("title")} for f in files]}, {}
+            return 200, {"ok": True}, {}
+
+    def stats(self):
+        with self._lock:
+            methods = {}
+            for method, _ in self.calls:
+                methods[method] = methods.get(method, 0) + 1
+            return {"calls": len(self.calls), "rate_limited": self.rate_limited,
+                    "messages": len(self.messages), "methods": methods}
+
+
+class FakeFileServer:
+    """
+    Slackのファイルダウンロード (url_private) のローカルHTTPサーバー版の代替。
+    add() で登録した内容を GET で返します。応答までの遅延・転送速度・エラー率を指定できます。
+
+        server = FakeFileServer(latency=0.05, bytes_per_second=20 * 1024 * 1024).start()
+        url = server.add("meeting.vtt", data)
+    """
+
+    def __init__(self, latency=0.0, bytes_per_second=0, error_rate=0.0, error_status=500, seed=None):
+        self.latency = latency
+        self.bytes_per_second = bytes_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.downloads = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self._files = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    def add(self, name, data):
+        """
+        ファイルを登録し、ダウンロード用のURLを返します。
+        """
+        with self._lock:
+            self._files[name] = data.encode("utf-8") if isinstance(data, str) else data
+        return f"http://127.0.0.1:{self._server.server_port}/files/{name}"
+
+    def start(self):
+        fake = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                name = self.path.rsplit("/", 1)[-1]
+                with fake._lock:
+                    data = fake._files.get(name)
+                    failed = fake._random.random() < fake.error_rate
+                    fake.downloads += 1
+                    if failed:
+                        fake.errors += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if data is None or failed:
+                    status = 404 if data is None else fake.error_status
+                    self.send_response(status)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                block = 64 * 1024
+                for i in range(0, len(data), block):
+                    self.wfile.write(data[i:i + block])
+                    if fake.bytes_per_second:
+                        time.sleep(min(block, len(data) - i) / fake.bytes_per_second)
+                with fake._lock:
+                    fake.bytes_sent += len(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {"downloads": self.downloads, "errors": self.errors, "bytes_sent": self.bytes_sent}
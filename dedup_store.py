@@ -0,0 +1,225 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 重複排除ストアのバックエンド ("none" / "memory" / "sqlite" / "dynamodb")
+# 複数のインスタンスで共有できるストア ("sqlite" (共有ファイル) / "dynamodb") 以外では、
+# 従来どおり Slack のリトライヘッダーでリトライを無視する
+# (処理中のイベントのリトライは必ず別のLambdaインスタンスに届くため、プロセス内のストアでは重複を判定できない)
+DEDUP_BACKEND = os.environ.get("DEDUP_BACKEND", "none")
+# 処理中の権利 (claim) の有効期間 (秒)。これを過ぎた処理中レコードは放棄されたとみなし引き継げる
+# Lambdaでは呼び出しの残り時間 (関数のタイムアウト) + DEDUP_LEASE_MARGIN_SECONDS を使い、
+# この値は残り時間が分からない場合 (ローカル実行など) に使う (既定値は Lambda のタイムアウトの上限)
+DEDUP_LEASE_SECONDS = int(os.environ.get("DEDUP_LEASE_SECONDS", "900"))
+# 残り時間から決めた有効期間に足す余裕 (秒)
+DEDUP_LEASE_MARGIN_SECONDS = int(os.environ.get("DEDUP_LEASE_MARGIN_SECONDS", "30"))
+# 残り時間から決めた有効期間の上限 (秒)。0 は上限なし
+# Slack のリトライはイベントの約5分後が最後のため、強制終了された処理をリトライに引き継がせたい場合は
+# 5分より短く (例: 240) する。ただしこの時間を超える処理は、実行中でもリトライが重複して処理する
+DEDUP_LEASE_MAX_SECONDS = int(os.environ.get("DEDUP_LEASE_MAX_SECONDS", "0"))
+# 完了済みレコードを保持する期間 (秒)
+DEDUP_TTL_SECONDS = int(os.environ.get("DEDUP_TTL_SECONDS", "86400"))
+# SQLiteストアのファイルパス
+DEDUP_SQLITE_PATH = os.environ.get("DEDUP_SQLITE_PATH", "/tmp/slack_summarizer_dedup.db")
+# DynamoDBストアのテーブル名 (パーティションキー: dedup_key, TTL属性: expires_at)
+DEDUP_TABLE = os.environ.get("DEDUP_TABLE")
+
+STATUS_PROCESSING = "processing"
+STATUS_COMPLETED = "completed"
+
+
+class DedupStore:
+    """
+    イベント・ファイル単位の重複排除ストアの共通インターフェース。
+    claim で処理の権利を原子的に取得し、処理後に complete、失敗時に release します。
+    shared は、別のプロセス (Lambdaインスタンス) と状態を共有できるストアかどうかです。
+    """
+    shared = False
+
+    def claim(self, key: str, lease_seconds: int = None) -> bool:
+        """
+        処理の権利を取得できた場合に True を返します。
+        未登録・期限切れ・放棄された (リース切れの) 処理中レコードは取得でき、
+        処理中 (リース有効) または完了済みのレコードは取得できません。
+        """
+        raise NotImplementedError
+
+    def complete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def release(self, key: str) -> None:
+        """処理に失敗した場合に権利を手放し、リトライで再処理できるようにします。"""
+        raise NotImplementedError
+
+
+class NullDedupStore(DedupStore):
+    """
+    重複排除を行わない実装 (DEDUP_BACKEND=none)。
+    """
+
+    def claim(self, key, lease_seconds=None):
+        return True
+
+    def complete(self, key):
+        pass
+
+    def release(self, key):
+        pass
+
+
+class InMemoryDedupStore(DedupStore):
+    """
+    プロセス内の重複排除ストア。同一のLambdaインスタンス内でのみ有効です。
+    """
+
+    def __init__(self, ttl_seconds: int = DEDUP_TTL_SECONDS):
+        self._ttl_seconds = ttl_seconds
+        self._records = {} # key -> (status, expires_at)
+        self._lock = threading.Lock()
+
+    def claim(self, key, lease_seconds=None):
+        now = time.time()
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None and record[1] > now:
+                return False
+            if len(self._records) > 10000:
+                # 期限切れのレコードを掃除する
+                self._records = {k: v for k, v in self._records.items() if v[1] > now}
+            self._records[key] = (STATUS_PROCESSING, now + (lease_seconds or DEDUP_LEASE_SECONDS))
+            return True
+
+    def complete(self, key):
+        with self._lock:
+            self._records[key] = (STATUS_COMPLETED, time.time() + self._ttl_seconds)
+
+    def release(self, key):
+        with self._lock:
+            self._records.pop(key, None)
+
+
+class SQLiteDedupStore(DedupStore):
+    """
+    SQLiteファイルを使った重複排除ストア。同一ホストの複数プロセスで共有できます。
+    """
+    shared = True
+
+
+    def __init__(self, path: str = DEDUP_SQLITE_PATH, ttl_seconds: int = DEDUP_TTL_SECONDS):
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dedup ("
+            " dedup_key TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+
+    def claim(self, key, lease_seconds=None):
+        now = time.time()
+        with self._lock:
+            # 有効期限内のレコードがない場合のみ書き込む (1文で判定と更新を行うため原子的)
+            cursor = self._conn.execute(
+                "INSERT INTO dedup (dedup_key, status, expires_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(dedup_key) DO UPDATE SET status = excluded.status, expires_at = excluded.expires_at"
+                " WHERE dedup.expires_at <= ?",
+                (key, STATUS_PROCESSING, now + (lease_seconds or DEDUP_LEASE_SECONDS), now),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, key):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE dedup SET status = ?, expires_at = ? WHERE dedup_key = ?",
+                (STATUS_COMPLETED, time.time() + self._ttl_seconds, key),
+            )
+
+    def release(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM dedup WHERE dedup_key = ? AND status = ?", (key, STATUS_PROCESSING))
+
+
+class DynamoDBDedupStore(DedupStore):
+    """
+    DynamoDBテーブルを使った重複排除ストア。条件付き書き込みで複数のLambdaインスタンス間でも原子的に claim します。
+    """
+    shared = True
+
+
+    def __init__(self, table_name: str = DEDUP_TABLE, ttl_seconds: int = DEDUP_TTL_SECONDS):
+        if not table_name:
+            raise ValueError("DEDUP_TABLE が設定されていません。")
+        import boto3  # Lambdaランタイムに同梱されているため requirements.txt には含めない
+        self._table = boto3.resource("dynamodb").Table(table_name)
+        self._ttl_seconds = ttl_seconds
+
+    def claim(self, key, lease_seconds=None):
+        now = int(time.time())
+        try:
+            self._table.put_item(
+                Item={
+                    "dedup_key": key,
+                    "status": STATUS_PROCESSING,
+                    "expires_at": now + (lease_seconds or DEDUP_LEASE_SECONDS),
+                },
+                ConditionExpression="attribute_not_exists(dedup_key) OR expires_at <= :now",
+                ExpressionAttributeValues={":now": now},
+            )
+            return True
+        except self._table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+
+    def complete(self, key):
+        self._table.update_item(
+            Key={"dedup_key": key},
+            UpdateExpression="SET #status = :completed, expires_at = :expires_at",
+            ExpressionAttributeNames={"#status": "status"},
+            ExpressionAttributeValues={":completed": STATUS_COMPLETED, ":expires_at": int(time.time()) + self._ttl_seconds},
+        )
+
+    def release(self, key):
+        try:
+            self._table.delete_item(
+                Key={"dedup_key": key},
+                ConditionExpression="#status = :processing",
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={":processing": STATUS_PROCESSING},
+            )
+        except self._table.meta.client.exceptions.ConditionalCheckFailedException:
+            pass
+
+
+def lease_seconds_for(remaining_seconds: float = None) -> int:
+    """
+    処理中の権利の有効期間を、呼び出しの残り時間から決めます。
+    処理が終わるまで権利が切れないため、実行中の処理をリトライが重複して処理することはありません。
+    Slack のリトライはイベントの約5分後が最後のため、残り時間がそれより長いと、強制終了された処理は
+    リトライでは引き継がれません (DEDUP_LEASE_MAX_SECONDS で有効期間を短くできます)。
+    """
+    if remaining_seconds is None:
+        return DEDUP_LEASE_SECONDS
+    lease_seconds = int(remaining_seconds) + DEDUP_LEASE_MARGIN_SECONDS
+    if DEDUP_LEASE_MAX_SECONDS > 0:
+        lease_seconds = min(lease_seconds, DEDUP_LEASE_MAX_SECONDS)
+    return lease_seconds
+
+
+def create_dedup_store(backend: str = None) -> DedupStore:
+    """
+    設定に応じた重複排除ストアを生成します。
+    """
+    backend = (backend or DEDUP_BACKEND).lower()
+    if backend == "none":
+        return NullDedupStore()
+    if backend == "memory":
+        return InMemoryDedupStore()
+    if backend == "sqlite":
+        return SQLiteDedupStore()
+    if backend == "dynamodb":
+        return DynamoDBDedupStore()
+    raise ValueError(f"未対応の重複排除バックエンドです: {backend}")
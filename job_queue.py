@@ -0,0 +1,191 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# キューのバックエンド ("memory" / "sqlite" / "sqs")
+# "memory" はハンドラとワーカーが同じプロセスで動く場合 (ローカル実行) 専用。Lambda では "sqs" を使う
+JOB_QUEUE_BACKEND = os.environ.get("JOB_QUEUE_BACKEND", "memory")
+# SQLiteキューのファイルパス (Lambdaでは /tmp のみ書き込み可能)
+JOB_QUEUE_SQLITE_PATH = os.environ.get("JOB_QUEUE_SQLITE_PATH", "/tmp/slack_summarizer_jobs.db")
+# SQLiteキューで取り出したジョブが ack されないまま、この秒数を過ぎたら再び取り出せるようにする
+# (SQSの可視性タイムアウトに相当。ワーカーが処理中に異常終了したジョブを別のワーカーが引き継ぐ)
+JOB_QUEUE_VISIBILITY_TIMEOUT_SECONDS = float(os.environ.get("JOB_QUEUE_VISIBILITY_TIMEOUT_SECONDS", "900"))
+# SQSキューのURL
+JOB_QUEUE_URL = os.environ.get("JOB_QUEUE_URL")
+
+
+class JobQueue:
+    """
+    ジョブキューの共通インターフェース。
+    enqueue でジョブを登録し、ワーカーが dequeue で取り出して処理後に ack します。
+    """
+
+    def enqueue(self, job: dict) -> str:
+        raise NotImplementedError
+
+    def dequeue(self, max_jobs: int = 1) -> list:
+        raise NotImplementedError
+
+    def ack(self, job: dict) -> None:
+        """処理が完了したジョブをキューから削除します。"""
+        pass
+
+
+class InMemoryJobQueue(JobQueue):
+    """
+    プロセス内のキュー。ローカル実行やテスト用の簡易実装です。
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def enqueue(self, job: dict) -> str:
+        job_id = job.setdefault("job_id", uuid.uuid4().hex)
+        self._queue.put(job)
+        return job_id
+
+    def dequeue(self, max_jobs: int = 1) -> list:
+        jobs = []
+        while len(jobs) < max_jobs:
+            try:
+                jobs.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return jobs
+
+    def __len__(self):
+        return self._queue.qsize()
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    SQLiteファイルを使ったキュー。同一ホスト上の別プロセスのワーカーからも取り出せます。
+    取り出してから visibility_timeout 秒以内に ack されなかったジョブは、再び取り出せるようになります。
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_SQLITE_PATH, visibility_timeout: float = JOB_QUEUE_VISIBILITY_TIMEOUT_SECONDS):
+        self._path = path
+        self._visibility_timeout = visibility_timeout
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'pending',"
+            " created_at REAL NOT NULL,"
+            " claimed_at REAL)"
+        )
+        # claimed_at 列がない古いファイルには列を追加する
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "claimed_at" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN claimed_at REAL")
+
+    # 取り出せるジョブ: 未処理、または処理中のまま可視性タイムアウトを過ぎたもの
+    _AVAILABLE_CONDITION = "(status = 'pending' OR (status = 'processing' AND COALESCE(claimed_at, 0) <= ?))"
+
+    def enqueue(self, job: dict) -> str:
+        job_id = job.setdefault("job_id", uuid.uuid4().hex)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, payload, status, created_at) VALUES (?, ?, 'pending', ?)",
+                (job_id, json.dumps(job, ensure_ascii=False), time.time()),
+            )
+        return job_id
+
+    def dequeue(self, max_jobs: int = 1) -> list:
+        with self._lock:
+            # BEGIN IMMEDIATE で書き込みロックを取り、複数ワーカー間の二重取得を防ぐ
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                rows = self._conn.execute(
+                    f"SELECT job_id, payload, status FROM jobs WHERE {self._AVAILABLE_CONDITION} ORDER BY created_at LIMIT ?",
+                    (now - self._visibility_timeout, max_jobs),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE jobs SET status = 'processing', claimed_at = ? WHERE job_id = ?",
+                    [(now, row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        for job_id, _, status in rows:
+            if status == 'processing':
+                logger.warning(f"可視性タイムアウトを過ぎても完了していないジョブを再び取り出しました: job_id={job_id}")
+        return [json.loads(row[1]) for row in rows]
+
+    def ack(self, job: dict) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job.get("job_id"),))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT COUNT(*) FROM jobs WHERE {self._AVAILABLE_CONDITION}", (time.time() - self._visibility_timeout,)
+            ).fetchone()[0]
+
+
+class SQSJobQueue(JobQueue):
+    """
+    Amazon SQS を使ったキュー。本番環境ではワーカーLambdaをSQSトリガーで起動します。
+    """
+
+    def __init__(self, queue_url: str = JOB_QUEUE_URL):
+        if not queue_url:
+            raise ValueError("JOB_QUEUE_URL が設定されていません。")
+        import boto3  # Lambdaランタイムに同梱されているため requirements.txt には含めない
+        self._queue_url = queue_url
+        self._sqs = boto3.client("sqs")
+
+    def enqueue(self, job: dict) -> str:
+        job_id = job.setdefault("job_id", uuid.uuid4().hex)
+        self._sqs.send_message(QueueUrl=self._queue_url, MessageBody=json.dumps(job, ensure_ascii=False))
+        return job_id
+
+    def dequeue(self, max_jobs: int = 1) -> list:
+        response = self._sqs.receive_message(
+            QueueUrl=self._queue_url,
+            MaxNumberOfMessages=min(max_jobs, 10),
+            WaitTimeSeconds=0,
+        )
+        jobs = []
+        for message in response.get("Messages", []):
+            job = json.loads(message["Body"])
+            job["_receipt_handle"] = message["ReceiptHandle"]
+            jobs.append(job)
+        return jobs
+
+    def ack(self, job: dict) -> None:
+        receipt_handle = job.get("_receipt_handle")
+        if receipt_handle:
+            self._sqs.delete_message(QueueUrl=self._queue_url, ReceiptHandle=receipt_handle)
+
+
+def create_job_queue(backend: str = None) -> JobQueue:
+    """
+    設定に応じたジョブキューを生成します。
+    """
+    backend = (backend or JOB_QUEUE_BACKEND).lower()
+    if backend == "memory":
+        return InMemoryJobQueue()
+    if backend == "sqlite":
+        return SQLiteJobQueue()
+    if backend == "sqs":
+        return SQSJobQueue()
+    raise ValueError(f"未対応のジョブキューバックエンドです: {backend}")
+
+
+def jobs_from_sqs_event(event: dict) -> list:
+    """
+    SQSトリガーのイベントからジョブのリストを取り出します。
+    """
+    return [json.loads(record["body"]) for record in event.get("Records", [])]
@@ -1,13 +1,20 @@
 import json
 import os
 import logging
+import random
 import sys
-from slack_sdk import WebClient
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # インポートするモジュールを追加
 import text_extractor
 import ai_processor
 import slack_utils
+import job_queue
+import dedup_store
+import metrics
+import slack_delivery
+import transcript_compactor
 
 # --- ロガー設定 ---
 logger = logging.getLogger()
@@ -21,10 +28,27 @@ logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s [
 SLACK_BOT_TOKEN = os.environ.get("SLACK_BOT_TOKEN")
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 
-# Slackクライアントの初期化
-client = WebClient(token=SLACK_BOT_TOKEN)
+# 処理モード: "sync" はハンドラ内で全処理、"async" はキューに積んで即時応答しワーカーで処理
+PROCESSING_MODE = os.environ.get("PROCESSING_MODE", "sync")
+# Lambda ではハンドラとワーカーが別のインスタンス (別プロセス) で動くため、プロセス内のキューに積んだジョブは
+# ワーカーから見えずに失われる。設定の誤りに気付けるよう起動時にエラーにする
+if PROCESSING_MODE == "async" and os.environ.get("AWS_LAMBDA_FUNCTION_NAME") and job_queue.JOB_QUEUE_BACKEND.lower() == "memory":
+    raise RuntimeError("PROCESSING_MODE=async を Lambda で使う場合は JOB_QUEUE_BACKEND=sqs (JOB_QUEUE_URL) を設定してください。")
+# ワーカーが1回の呼び出しでキューから取り出す最大ジョブ数
+WORKER_MAX_JOBS = int(os.environ.get("WORKER_MAX_JOBS", "10"))
+# 1メンション内の添付ファイルを並列処理する最大数
+MAX_FILE_CONCURRENCY = int(os.environ.get("MAX_FILE_CONCURRENCY", "4"))
+# 議事録をストリーミング生成し、処理中メッセージを随時更新するか
+STREAMING_ENABLED = os.environ.get("STREAMING_ENABLED", "false").lower() == "true"
+# 受信したイベント本文とヘッダーをログに出力する割合 (0〜1)。DEBUGレベルの場合は常に出力する
+PAYLOAD_LOG_SAMPLE_RATE = float(os.environ.get("PAYLOAD_LOG_SAMPLE_RATE", "0"))
 
-# Gemini APIの設定 (古いSDK方式 ai_processor.py で初期化)
+# Slackクライアント (slack_sdk のインポートを含め、初回の利用時に初期化し、ウォームスタート間で再利用する)
+client = None
+# Slackへの投稿の実行役 (SLACK_ASYNC_POST の場合はバックグラウンドで投稿する)
+_slack_poster = None
+
+# Gemini APIの設定 (古いSDK方式 ai_processor.py で初期化、SDKの読み込みは初回の処理時)
 if GEMINI_API_KEY:
     ai_processor.set_gemini_client_and_model(GEMINI_API_KEY, model_name='gemini-2.0-flash')
 else:
@@ -51,18 +75,23 @@ def lambda_handler(event, context):
             'body': json.dumps({'challenge': body_content['challenge']})
         }
 
-    logger.info(f"Received event body: {json.dumps(body_content, indent=2)}")
-
     # Slackイベントヘッダーを取得
     headers = event.get('headers', {})
-    logger.info(f"RECEIVED HEADERS: {json.dumps(headers, indent=2)}") # デバッグ用ログ
+    # イベント全体のログ出力は大量のリクエストでは負荷になるため、サンプリングまたはDEBUG時のみ行う
+    if _should_log_payload():
+        logger.info(f"Received event body: {json.dumps(body_content, ensure_ascii=False)}")
+        logger.info(f"RECEIVED HEADERS: {json.dumps(headers, ensure_ascii=False)}") # デバッグ用ログ
 
     # Slackリトライ検知 (修正版 slack_utils.py を使用)
     if slack_utils.is_slack_retry(headers):
         # リトライ理由もログに出力（デバッグ用）
-        retry_reason = headers.get('X-Slack-Retry-Reason', 'Unknown')
-        logger.warning(f"Detected Slack retry (Retry-Num: {headers.get('X-Slack-Retry-Num')}, Reason: {retry_reason}). Ignoring this event.")
-        return {'statusCode': 200, 'body': json.dumps('OK (Retry Ignored)')}
+        retry_reason = headers.get('x-slack-retry-reason', 'Unknown')
+        # 処理中のイベントのリトライは別のインスタンスに届くため、インスタンス間で共有するストアがなければ無視する
+        if not _get_dedup_store().shared:
+            logger.warning(f"Detected Slack retry (Retry-Num: {headers.get('x-slack-retry-num')}, Reason: {retry_reason}). Ignoring this event.")
+            return {'statusCode': 200, 'body': json.dumps('OK (Retry Ignored)')}
+        # 重複排除ストアで処理中・処理済みを判定するため、リトライでも処理を続ける
+        logger.info(f"Detected Slack retry (Retry-Num: {headers.get('x-slack-retry-num')}, Reason: {retry_reason}).")
 
     # --- メイン処理 ---
     event_data = body_content.get('event', {})
@@ -70,58 +99,42 @@ def lambda_handler(event, context):
     channel_id = event_data.get('channel')
     user_id = event_data.get('user')
     ts = event_data.get('ts') # スレッド返信用のタイムスタンプ
+    thread_ts = event_data.get('thread_ts') # スレッド内でのメンションの場合は親メッセージのタイムスタンプ
 
     # アプリへのメンションイベントかチェック
     if event_type == 'app_mention':
         files = event_data.get('files')
-        if files:
-            logger.info("メンションとファイル添付を検知しました。")
-            # 処理中のフィードバックメッセージを送信 (1回だけ送る)
-            slack_utils.send_processing_message(client, channel_id, user_id, ts)
-
-            for file_info in files:
-                file_id = file_info.get('id')
-                file_name = file_info.get('name')
-                file_url_private = file_info.get('url_private')
-                file_mimetype = file_info.get('mimetype')
-
-                logger.info(f"File detected: ID={file_id}, Name={file_name}, MimeType={file_mimetype}")
-
-                extracted_text = ""
-                try:
-                    # ファイルダウンロード
-                    file_content_bytes = slack_utils.download_file(file_url_private, SLACK_BOT_TOKEN, binary_mode=True)
-                    logger.info(f"File '{file_name}' のダウンロードが完了しました。")
-
-                    # ファイルタイプに応じてテキスト抽出
-                    if file_mimetype == 'text/vtt' or file_name.lower().endswith('.vtt'):
-                        logger.info(f"VTTファイル '{file_name}' を処理します。")
-                        vtt_content = file_content_bytes.decode('utf-8')
-                        extracted_text = text_extractor.extract_text_from_vtt(vtt_content)
-                    elif file_mimetype == 'text/plain' or file_name.lower().endswith('.txt'):
-                        logger.info(f"TXTファイル '{file_name}' を処理します。")
-                        txt_content = file_content_bytes.decode('utf-8')
-                        extracted_text = text_extractor.extract_text_from_txt(txt_content)
-                    else:
-                        logger.warning(f"Unsupported file type: {file_name} ({file_mimetype})")
-                        slack_utils.send_non_vtt_message(client, channel_id, user_id, file_name, file_mimetype, ts)
-                        continue # 次のファイルへ
-
-                    # Gemini APIで議事録生成
-                    meeting_minutes_markdown = ai_processor.process_meeting_transcript(extracted_text)
-
-                    # 結果をSlackに返信
-                    slack_utils.send_summary_message(
-                        client, channel_id, user_id, file_name, meeting_minutes_markdown, ts
-                    )
-
-                except Exception as e:
-                    logger.error(f"File processing error for '{file_name}': {e}", exc_info=True)
-                    slack_utils.send_error_message(client, channel_id, user_id, file_name, str(e), ts)
-        else:
-            # メンションのみの場合
-            logger.info("メンションのみ（ファイル添付なし）を検知しました。")
-            slack_utils.send_general_mention_message(client, channel_id, user_id, ts)
+        # 同じイベントの重複配信 (リトライ・複数インスタンスへの配信) を1回だけ処理する
+        dedup_key = f"event:{body_content.get('event_id') or f'{channel_id}:{ts}'}"
+        store = _get_dedup_store()
+        lease_seconds = _dedup_lease_seconds(context)
+        if not store.claim(dedup_key, lease_seconds):
+            logger.warning(f"処理中または処理済みのイベントのため無視します: {dedup_key}")
+            return {'statusCode': 200, 'body': json.dumps('OK (Duplicate Ignored)')}
+        try:
+            if files and PROCESSING_MODE == 'async':
+                # キューに積んで即座に応答する (Slackの3秒タイムアウト対策)
+                job = {
+                    'event_id': body_content.get('event_id'),
+                    'dedup_key': dedup_key,
+                    'channel_id': channel_id,
+                    'user_id': user_id,
+                    'ts': ts,
+                    'thread_ts': thread_ts,
+                    'files': files,
+                }
+                job_id = _get_job_queue().enqueue(job)
+                logger.info(f"ジョブをキューに登録しました: job_id={job_id}, files={len(files)}")
+                store.complete(dedup_key)
+                return {'statusCode': 200, 'body': json.dumps('OK (Queued)')}
+            process_app_mention(channel_id, user_id, ts, files, dedup_key, thread_ts, lease_seconds)
+            # バックグラウンドの投稿を待ってから応答する (応答後はLambdaが停止するため)
+            _get_slack_poster().drain()
+        except Exception:
+            # 途中で失敗した場合はリトライで再処理できるようにする
+            store.release(dedup_key)
+            raise
+        store.complete(dedup_key)
 
     # 正常終了応答
     return {
@@ -129,3 +142,256 @@ def lambda_handler(event, context):
         'body': json.dumps('OK')
     }
 
+
+
+# ジョブキュー (非同期モード時のみ使用、初回アクセス時に生成)
+_job_queue = None
+# 重複排除ストア (初回アクセス時に生成)
+_dedup_store = None
+
+def _should_log_payload():
+    return logger.isEnabledFor(logging.DEBUG) or random.random() < PAYLOAD_LOG_SAMPLE_RATE
+
+def _get_slack_client():
+    global client
+    if client is None:
+        # 429 の自動リトライとチャンネル単位の投稿間隔の制御を行うクライアント
+        client = slack_delivery.RateLimitedSlackClient(slack_delivery.create_web_client(SLACK_BOT_TOKEN))
+    return client
+
+def _get_slack_poster():
+    global _slack_poster
+    if _slack_poster is None:
+        _slack_poster = slack_delivery.SlackPoster()
+    return _slack_poster
+
+def _get_dedup_store():
+    global _dedup_store
+    if _dedup_store is None:
+        _dedup_store = dedup_store.create_dedup_store()
+    return _dedup_store
+
+def _dedup_lease_seconds(context):
+    """
+    処理中の権利の有効期間を、Lambdaの呼び出しの残り時間から決めます。
+    """
+    get_remaining_time = getattr(context, 'get_remaining_time_in_millis', None)
+    return dedup_store.lease_seconds_for(get_remaining_time() / 1000 if get_remaining_time else None)
+
+def _get_job_queue():
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = job_queue.create_job_queue()
+    return _job_queue
+
+def process_app_mention(channel_id, user_id, ts, files, dedup_key=None, thread_ts=None, lease_seconds=None):
+    """
+    メンションに添付されたファイルをダウンロード → 抽出 → 分類 → 要約 → 投稿します。
+    複数ファイルは並列に処理し、結果は添付順に投稿します。
+    他のインスタンスが処理中・処理済みのファイルは読み飛ばします。
+    同じスレッドで要約済みの会議の続きや修正版は、差分だけを要約して前回の議事録に統合します
+    (THREAD_STATE_BACKEND が有効な場合)。
+    """
+    if files:
+        logger.info("メンションとファイル添付を検知しました。")
+        files = _claim_files(files, dedup_key or f"event:{channel_id}:{ts}", lease_seconds)
+        if not files:
+            logger.warning("全てのファイルが処理中または処理済みのため、処理をスキップします。")
+            return
+        posted_keys = set()
+        try:
+            replies = None
+            if STREAMING_ENABLED:
+                # ファイルごとに処理中メッセージを添付順に投稿し、生成途中の議事録で更新していく
+                streamers = [
+                    slack_utils.StreamingMessageUpdater.start(_get_slack_client(), channel_id, user_id, file_info.get('name'), ts)
+                    for file_info in files
+                ]
+            else:
+                # 処理中のフィードバックメッセージを送信し (1回だけ送る)、結果はまとめてその後に送る
+                replies = slack_delivery.MentionReplies(_get_slack_client(), _get_slack_poster(), channel_id, user_id, ts)
+                replies.start()
+                streamers = [None] * len(files)
+
+            thread_key = f"{channel_id}:{thread_ts or ts}"
+            max_workers = max(1, min(MAX_FILE_CONCURRENCY, len(files)))
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="file-pipeline") as executor:
+                futures = [
+                    executor.submit(_run_file_pipeline, file_info, streamer, thread_key, ts)
+                    for file_info, streamer in zip(files, streamers)
+                ]
+                # 添付順に結果を待って投稿する (後続ファイルの処理はその間も進む)
+                for file_info, streamer, future in zip(files, streamers, futures):
+                    result = future.result()
+                    # 送信後に処理済みとし、ステージ別の所要時間とトークン数などを1レコードで出力する
+                    on_posted = _make_on_posted(file_info['_dedup_key'], result['metrics'], posted_keys)
+                    if replies is not None:
+                        replies.add(file_info.get('name'), result, file_info.get('mimetype'), on_posted)
+                    else:
+                        _get_slack_poster().submit(_post_file_result, channel_id, user_id, ts, file_info, result, streamer,
+                                                   on_posted=on_posted, channel=channel_id)
+                if replies is not None:
+                    replies.finish()
+        except Exception:
+            # 送信済みでないファイルの権利を放棄し、リトライで再処理できるようにする
+            _release_files(files, posted_keys)
+            raise
+    else:
+        # メンションのみの場合
+        logger.info("メンションのみ（ファイル添付なし）を検知しました。")
+        slack_utils.send_general_mention_message(_get_slack_client(), channel_id, user_id, ts)
+
+def _make_on_posted(file_dedup_key, job_metrics, posted_keys):
+    def on_posted(post_seconds):
+        job_metrics.add_time('slack_post', post_seconds)
+        _get_dedup_store().complete(file_dedup_key)
+        posted_keys.add(file_dedup_key)
+        metrics.emit(job_metrics)
+    return on_posted
+
+def _release_files(files, posted_keys):
+    """
+    送信が完了していないファイルの処理の権利を放棄します。
+    """
+    for file_info in files:
+        if file_info['_dedup_key'] not in posted_keys:
+            _get_dedup_store().release(file_info['_dedup_key'])
+
+def _claim_files(files, dedup_key, lease_seconds=None):
+    """
+    ファイルごとに処理の権利を取得し、取得できたファイルだけを返します。
+    """
+    claimed = []
+    for file_info in files:
+        file_key = f"{dedup_key}:file:{file_info.get('id')}"
+        if _get_dedup_store().claim(file_key, lease_seconds):
+            claimed.append(dict(file_info, _dedup_key=file_key))
+        else:
+            logger.warning(f"処理中または処理済みのファイルのため読み飛ばします: {file_key}")
+    return claimed
+
+def _run_file_pipeline(file_info, streamer=None, thread_key=None, mention_key=None):
+    """
+    1ファイル分のパイプライン (ダウンロード → 抽出 → 議事録生成) を実行します。
+    例外は呼び出し元に伝播させず、結果の辞書に格納して返します。
+    streamer を渡すと、生成途中の議事録でメッセージを更新します。
+    結果の 'metrics' には、このファイルの処理のステージ別の計測値が入ります。
+    thread_key は差分要約でスレッドの要約状態を引き継ぐためのキーです。
+    mention_key (メンションの ts) が同じファイル同士は、互いの議事録に統合しません。
+    """
+    file_id = file_info.get('id')
+    file_name = file_info.get('name')
+    file_mimetype = file_info.get('mimetype')
+
+    logger.info(f"File detected: ID={file_id}, Name={file_name}, MimeType={file_mimetype}")
+
+    with metrics.job(file_id=file_id, file_type=os.path.splitext(file_name or '')[1].lstrip('.').lower() or 'unknown') as job_metrics:
+        result = _extract_and_summarize(file_info, streamer, job_metrics, thread_key, mention_key)
+        job_metrics.set(status=result['status'])
+    result['metrics'] = job_metrics
+    return result
+
+def _extract_and_summarize(file_info, streamer, job_metrics, thread_key=None, mention_key=None):
+    file_name = file_info.get('name')
+    file_mimetype = file_info.get('mimetype')
+
+    extracted_text = ""
+    try:
+        # ファイルをストリーミングでダウンロードし、デコードした行をそのまま抽出処理に渡す
+        # (ダウンロード・デコード・抽出は交互に進むため、それぞれの時間を分けて計測する)
+        download = slack_utils.iter_download_chunks(file_info.get('url_private'), SLACK_BOT_TOKEN)
+        chunks = job_metrics.timed_iter(download, 'download', count_bytes=True)
+        # ファイルタイプに応じてテキスト抽出 (拡張子・MIMEタイプで決まらない場合は先頭を読んで判定する)
+        extractor, chunks = text_extractor.detect_extractor(file_name, file_mimetype, chunks)
+        if extractor is None:
+            download.close()
+            logger.warning(f"Unsupported file type: {file_name} ({file_mimetype})")
+            return {'status': 'unsupported'}
+
+        logger.info(f"ファイル '{file_name}' を {extractor.name} 形式として処理します。")
+        # DOCXなどのバイナリ形式はデコードせずにチャンクのまま渡す
+        source = chunks if extractor.binary else job_metrics.timed_iter(slack_utils.decode_lines(chunks), 'decode')
+        with job_metrics.stage('extract'):
+            extracted_text = extractor(source)
+        job_metrics.incr('transcript_chars', len(extracted_text))
+        logger.info(f"File '{file_name}' のダウンロードと抽出が完了しました。({len(extracted_text)}文字)")
+
+        # フィラーや重複行を除去してトークン数を削減
+        if transcript_compactor.COMPACTION_ENABLED:
+            with job_metrics.stage('compact'):
+                compaction = transcript_compactor.compact_transcript(extracted_text)
+            logger.info(f"文字起こしを圧縮しました: {compaction}")
+            extracted_text = compaction.text
+        job_metrics.incr('compacted_chars', len(extracted_text))
+
+        # Gemini APIで議事録生成
+        meeting_minutes_markdown = ai_processor.process_meeting_transcript(
+            extracted_text, on_progress=streamer.update if streamer else None, thread_key=thread_key,
+            mention_key=mention_key
+        )
+        return {'status': 'ok', 'minutes': meeting_minutes_markdown}
+
+    except Exception as e:
+        logger.error(f"File processing error for '{file_name}': {e}", exc_info=True)
+        return {'status': 'error', 'error': str(e)}
+
+def _post_file_result(channel_id, user_id, ts, file_info, result, streamer=None, on_posted=None):
+    """
+    1ファイル分の処理結果をスレッドに返信します。
+    on_posted は返信後に、返信にかかった秒数を引数に呼ばれます。
+    """
+    start = time.perf_counter()
+    try:
+        _send_file_result(channel_id, user_id, ts, file_info, result, streamer)
+    finally:
+        if on_posted is not None:
+            on_posted(time.perf_counter() - start)
+
+def _send_file_result(channel_id, user_id, ts, file_info, result, streamer=None):
+    file_name = file_info.get('name')
+    if streamer is not None:
+        if result['status'] == 'ok':
+            streamer.finish(result['minutes'])
+            return
+        # エラー等は通常のメッセージで送るため処理中メッセージは削除する
+        streamer.discard()
+    if result['status'] == 'ok':
+        slack_utils.send_summary_message(
+            _get_slack_client(), channel_id, user_id, file_name, result['minutes'], ts
+        )
+    elif result['status'] == 'unsupported':
+        slack_utils.send_non_vtt_message(_get_slack_client(), channel_id, user_id, file_name, file_info.get('mimetype'), ts)
+    else:
+        slack_utils.send_error_message(_get_slack_client(), channel_id, user_id, file_name, result['error'], ts)
+
+def worker_handler(event, context):
+    """
+    非同期モードのワーカーのエントリーポイント。
+    SQSトリガーの場合はイベント内のレコードを、それ以外はキューから取り出したジョブを処理します。
+    """
+    if event and 'Records' in event:
+        # SQSトリガー: 正常終了するとLambdaがメッセージを削除する
+        jobs = job_queue.jobs_from_sqs_event(event)
+        for job in jobs:
+            _run_job(job, _dedup_lease_seconds(context))
+        _get_slack_poster().drain()
+        return {'processed': len(jobs)}
+
+    queue = _get_job_queue()
+    processed = 0
+    while True:
+        jobs = queue.dequeue(WORKER_MAX_JOBS)
+        if not jobs:
+            break
+        for job in jobs:
+            # 非同期投稿の場合、前のジョブの投稿は次のジョブの処理と並行して行われる
+            _run_job(job, _dedup_lease_seconds(context))
+            queue.ack(job)
+            processed += 1
+    _get_slack_poster().drain()
+    return {'processed': processed}
+
+def _run_job(job, lease_seconds=None):
+    logger.info(f"ジョブを処理します: job_id={job.get('job_id')}, event_id={job.get('event_id')}")
+    process_app_mention(job.get('channel_id'), job.get('user_id'), job.get('ts'), job.get('files'), job.get('dedup_key'),
+                        job.get('thread_ts'), lease_seconds)
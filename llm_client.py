@@ -0,0 +1,338 @@
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- レート制限 (トークンバケット、全ジョブで共有) ---
+# 1秒あたりに開始できるリクエスト数と、瞬間的に許容するリクエスト数
+LLM_RATE_PER_SECOND = float(os.environ.get("LLM_RATE_PER_SECOND", "5"))
+LLM_BURST = int(os.environ.get("LLM_BURST", "10"))
+# --- 同時実行数 (429を受けると半減し、成功が続くと徐々に戻す) ---
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_MIN_CONCURRENCY = int(os.environ.get("LLM_MIN_CONCURRENCY", "1"))
+# --- リトライ (指数バックオフ + ジッター) ---
+LLM_MAX_ATTEMPTS = int(os.environ.get("LLM_MAX_ATTEMPTS", "4"))
+LLM_BACKOFF_BASE_SECONDS = float(os.environ.get("LLM_BACKOFF_BASE_SECONDS", "1.0"))
+LLM_BACKOFF_MAX_SECONDS = float(os.environ.get("LLM_BACKOFF_MAX_SECONDS", "20"))
+# --- 期限 ---
+# 1回のリクエストのタイムアウトと、リトライを含めた1呼び出し全体の期限 (秒)
+LLM_CALL_TIMEOUT_SECONDS = float(os.environ.get("LLM_CALL_TIMEOUT_SECONDS", "120"))
+LLM_DEADLINE_SECONDS = float(os.environ.get("LLM_DEADLINE_SECONDS", "600"))
+# --- ヘッジリクエスト ---
+# 応答がこの秒数以内に返らない場合に同じリクエストをもう1つ送り、早い方を採用する (0 以下で無効)
+LLM_HEDGE_AFTER_SECONDS = float(os.environ.get("LLM_HEDGE_AFTER_SECONDS", "0"))
+# --- サーキットブレーカー ---
+# 連続してこの回数だけ一時的なエラーが続くと、一定時間リクエストを送らずに即時失敗させる
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.environ.get("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.environ.get("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# リトライ対象とするHTTPステータスと例外名 (google.api_core.exceptions と requests をインポートせずに判定する)
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "BadGateway", "Aborted", "RetryError",
+    # REST通信 (requests) のタイムアウト・通信エラー。ReadTimeout などは基底クラスの名前で判定する
+    "Timeout", "ConnectionError", "ChunkedEncodingError",
+}
+
+
+class LLMClientError(Exception):
+    """
+    LLMクライアント層のエラーの基底クラス。
+    """
+    pass
+
+
+class CircuitOpenError(LLMClientError):
+    """
+    サーキットブレーカーが開いているため、リクエストを送らずに失敗した場合の例外。
+    """
+    pass
+
+
+class LLMDeadlineExceeded(LLMClientError):
+    """
+    リトライを含めた呼び出し全体の期限を超えた場合の例外。
+    """
+    pass
+
+
+def _status_code(error):
+    code = getattr(error, "code", None)
+    # google.api_core の例外は code にHTTPステータスを持つ
+    if isinstance(code, int):
+        return code
+    # requests の HTTPError は response にHTTPステータスを持つ
+    code = getattr(getattr(error, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable_error(error) -> bool:
+    """
+    一時的なエラー (レート制限・サーバーエラー・タイムアウト・通信エラー) かどうかを判定します。
+    """
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if _status_code(error) in RETRYABLE_STATUS_CODES:
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def is_rate_limit_error(error) -> bool:
+    return _status_code(error) == 429 or type(error).__name__ in ("ResourceExhausted", "TooManyRequests")
+
+
+class TokenBucket:
+    """
+    トークンバケットによるレート制限。
+    """
+
+    def __init__(self, rate_per_second: float = LLM_RATE_PER_SECOND, capacity: int = LLM_BURST):
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float = None) -> None:
+        """
+        トークンを1つ取得します。timeout 秒以内に取得できない場合は LLMDeadlineExceeded を送出します。
+        """
+        if self.rate_per_second <= 0:
+            return
+        give_up_at = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_second)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate_per_second
+            if give_up_at is not None and now + wait_seconds > give_up_at:
+                raise LLMDeadlineExceeded("レート制限の待ち時間が期限を超えました。")
+            time.sleep(wait_seconds)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    同時実行数の上限を、レート制限エラーで半減させ、成功のたびに少しずつ増やします (AIMD)。
+    """
+
+    def __init__(self, max_limit: int = LLM_MAX_CONCURRENCY, min_limit: int = LLM_MIN_CONCURRENCY):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout: float = None) -> None:
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._in_flight < int(self.limit), timeout):
+                raise LLMDeadlineExceeded("同時実行数の空き待ちが期限を超えました。")
+            self._in_flight += 1
+
+    def release(self) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    def on_success(self) -> None:
+        with self._condition:
+            previous = int(self.limit)
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if int(self.limit) > previous:
+                self._condition.notify()
+
+    def on_throttle(self) -> None:
+        with self._condition:
+            self.limit = max(self.min_limit, self.limit / 2)
+            logger.warning(f"レート制限を検知したため、LLMの同時実行数の上限を {int(self.limit)} に下げます。")
+
+
+class CircuitBreaker:
+    """
+    一時的なエラーが連続した場合に一定時間リクエストを遮断するサーキットブレーカー。
+    遮断後は1件だけ試行 (half-open) し、成功すれば復帰します。
+    """
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    raise CircuitOpenError("Gemini APIのエラーが続いているため、一時的にリクエストを停止しています。")
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open":
+                if self._probe_in_flight:
+                    raise CircuitOpenError("Gemini APIの復旧を確認中のため、リクエストを停止しています。")
+                self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_ignored(self) -> None:
+        """
+        状態は変えずに、half-open の試行枠だけを空けます (入力不正など、サービスの状態と関係のないエラーの場合)。
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.error(f"Gemini APIのエラーが {self._failures} 回続いたため、サーキットブレーカーを開きます。")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+class LLMClient:
+    """
+    レート制限・同時実行数制御・リトライ・期限・ヘッジ・サーキットブレーカーを備えたLLM呼び出し層。
+    call には「タイムアウト秒数を受け取ってリクエストを1回実行する関数」を渡します。
+    """
+
+    def __init__(self, rate_limiter: TokenBucket = None, concurrency: AdaptiveConcurrencyLimiter = None,
+                 breaker: CircuitBreaker = None, max_attempts: int = LLM_MAX_ATTEMPTS,
+                 backoff_base_seconds: float = LLM_BACKOFF_BASE_SECONDS,
+                 backoff_max_seconds: float = LLM_BACKOFF_MAX_SECONDS,
+                 call_timeout_seconds: float = LLM_CALL_TIMEOUT_SECONDS,
+                 deadline_seconds: float = LLM_DEADLINE_SECONDS,
+                 hedge_after_seconds: float = LLM_HEDGE_AFTER_SECONDS):
+        self.rate_limiter = rate_limiter or TokenBucket()
+        self.concurrency = concurrency or AdaptiveConcurrencyLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.max_attempts = max_attempts
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.call_timeout_seconds = call_timeout_seconds
+        self.deadline_seconds = deadline_seconds
+        self.hedge_after_seconds = hedge_after_seconds
+        self._hedge_executor = None
+        self._hedge_executor_lock = threading.Lock()
+        self._stats = {"calls": 0, "attempts": 0, "retries": 0, "hedges": 0, "failures": 0}
+        self._stats_lock = threading.Lock()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _count(self, name, value=1):
+        with self._stats_lock:
+            self._stats[name] += value
+
+    def backoff_seconds(self, attempt: int) -> float:
+        """
+        attempt 回目の失敗後の待ち時間 (指数バックオフ + フルジッター)。
+        """
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** (attempt - 1)))
+
+    def call(self, request, hedge: bool = True):
+        """
+        request(timeout) を実行して結果を返します。一時的なエラーは期限内でリトライします。
+        """
+        self._count("calls")
+        deadline = time.monotonic() + self.deadline_seconds
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            try:
+                if hedge and self.hedge_after_seconds > 0:
+                    result = self._hedged_attempt(request, deadline)
+                else:
+                    result = self._attempt(request, deadline)
+            except Exception as e:
+                if not is_retryable_error(e):
+                    # 入力不正などはリトライしても結果が変わらないためそのまま失敗させる
+                    # (サービスが復旧したとは言えないため、サーキットブレーカーの状態は変えない)
+                    self.breaker.record_ignored()
+                    self._count("failures")
+                    raise
+                self.breaker.record_failure()
+                if is_rate_limit_error(e):
+                    self.concurrency.on_throttle()
+                remaining = deadline - time.monotonic()
+                delay = self.backoff_seconds(attempt)
+                if attempt >= self.max_attempts or delay >= remaining:
+                    self._count("failures")
+                    logger.error(f"Gemini APIの呼び出しが {attempt} 回失敗しました: {e}")
+                    if delay >= remaining:
+                        raise LLMDeadlineExceeded(f"Gemini APIの呼び出しが期限内に完了しませんでした: {e}") from e
+                    raise
+                logger.warning(f"Gemini APIの一時的なエラーのため {delay:.1f} 秒後にリトライします ({attempt}/{self.max_attempts}): {e}")
+                self._count("retries")
+                metrics.incr("llm_retries")
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            self.concurrency.on_success()
+            return result
+
+    def _attempt(self, request, deadline):
+        """
+        レート制限と同時実行数の枠を取得してリクエストを1回実行します。
+        """
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMDeadlineExceeded("Gemini APIの呼び出しが期限を超えました。")
+        self.rate_limiter.acquire(timeout=remaining)
+        self.concurrency.acquire(timeout=max(0.0, deadline - time.monotonic()))
+        try:
+            self._count("attempts")
+            return request(max(0.001, min(self.call_timeout_seconds, deadline - time.monotonic())))
+        finally:
+            self.concurrency.release()
+
+    def _hedged_attempt(self, request, deadline):
+        """
+        最初のリクエストが hedge_after_seconds 以内に終わらなければ2つ目を送り、先に成功した方を返します。
+        """
+        with self._hedge_executor_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=self.concurrency.max_limit * 2, thread_name_prefix="llm-hedge"
+                )
+        primary = self._hedge_executor.submit(self._attempt, request, deadline)
+        done, _ = wait([primary], timeout=self.hedge_after_seconds)
+        if done:
+            return primary.result()
+
+        logger.info(f"Gemini APIの応答が {self.hedge_after_seconds} 秒以内に返らないため、ヘッジリクエストを送ります。")
+        self._count("hedges")
+        metrics.incr("llm_hedges")
+        pending = {primary, self._hedge_executor.submit(self._attempt, request, deadline)}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise LLMDeadlineExceeded("Gemini APIの呼び出しが期限を超えました。")
+            for future in done:
+                if future.exception() is None:
+                    # 残りのリクエストは結果を捨てる (実行中のものは止められないため完了を待たない)
+                    return future.result()
+                first_error = first_error or future.exception()
+        raise first_error
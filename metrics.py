@@ -0,0 +1,287 @@
+import contextvars
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# ジョブ単位のメトリクスを出力するか
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+# 出力形式 ("emf": CloudWatch Embedded Metric Format / "json": 1行のJSON)
+METRICS_FORMAT = os.environ.get("METRICS_FORMAT", "emf")
+# EMFで出力する場合の CloudWatch 名前空間
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "SlackSummarizerBot")
+# プロセス内のヒストグラムにも記録するか (ウォームスタート間で累積される)
+METRICS_HISTOGRAMS = os.environ.get("METRICS_HISTOGRAMS", "true").lower() == "true"
+
+# EMFのディメンション (カーディナリティが低い項目のみ)
+DIMENSIONS = ("pipeline_mode", "file_type", "status")
+# 数値項目の単位 (ここにない数値項目は Count として扱う)
+UNITS = {
+    "bytes": "Bytes",
+}
+
+_current_job = contextvars.ContextVar("metrics_current_job", default=None)
+
+
+class JobMetrics:
+    """
+    1ジョブ (1ファイルの処理) 分のステージ別の所要時間とカウンタ。
+    ステージは入れ子にでき、所要時間は内側のステージを除いた分だけが記録されます。
+    """
+
+    def __init__(self, **properties):
+        self.properties = dict(properties)
+        self.timings = {} # ステージ名 -> ミリ秒
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started_at = time.perf_counter()
+
+    def set(self, **properties):
+        self.properties.update(properties)
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds * 1000
+
+    @contextmanager
+    def stage(self, name):
+        """
+        ステージの所要時間を計測します。入れ子の場合、外側のステージの計測は内側の実行中は止まります。
+        """
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        now = time.perf_counter()
+        if stack:
+            parent = stack[-1]
+            self.add_time(parent[0], now - parent[1])
+        entry = [name, now]
+        stack.append(entry)
+        try:
+            yield self
+        finally:
+            now = time.perf_counter()
+            self.add_time(name, now - entry[1])
+            stack.pop()
+            if stack:
+                stack[-1][1] = now
+
+    def timed_iter(self, iterable, name, count_bytes=False):
+        """
+        イテレータから要素を取り出す時間を name のステージとして計測します (ストリーミング処理用)。
+        count_bytes=True の場合は要素のバイト数を bytes に加算します。
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            if count_bytes:
+                self.incr("bytes", len(item))
+            yield item
+
+    def to_record(self):
+        """
+        1行で出力する構造化レコードを返します。
+        """
+        record = dict(self.properties)
+        record.update({f"{name}_ms": round(value, 2) for name, value in self.timings.items()})
+        record["total_ms"] = round((time.perf_counter() - self._started_at) * 1000, 2)
+        record.update(self.counters)
+        return record
+
+
+@contextmanager
+def job(**properties):
+    """
+    ジョブの計測を開始し、このスレッド (と bind した関数) から current() で参照できるようにします。
+    """
+    job_metrics = JobMetrics(**properties)
+    token = _current_job.set(job_metrics)
+    try:
+        yield job_metrics
+    finally:
+        _current_job.reset(token)
+
+
+def current():
+    return _current_job.get()
+
+
+def bind(func):
+    """
+    呼び出し時点のジョブを、別スレッドで実行される func からも参照できるようにします。
+    """
+    job_metrics = _current_job.get()
+
+    def wrapper(*args, **kwargs):
+        token = _current_job.set(job_metrics)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current_job.reset(token)
+    return wrapper
+
+
+@contextmanager
+def stage(name):
+    """
+    実行中のジョブのステージを計測します。ジョブがない場合は何もしません。
+    """
+    job_metrics = _current_job.get()
+    if job_metrics is None:
+        yield None
+        return
+    with job_metrics.stage(name):
+        yield job_metrics
+
+
+def incr(name, value=1):
+    job_metrics = _current_job.get()
+    if job_metrics is not None:
+        job_metrics.incr(name, value)
+
+
+class Histogram:
+    """
+    対数スケールのバケットで値の分布を記録するヒストグラム (誤差は約9%以内)。
+    """
+    _BASE = 2 ** 0.25
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def record(self, value):
+        index = math.floor(math.log(value, self._BASE)) if value > 0 else None
+        with self._lock:
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+            self._buckets[index] = self._buckets.get(index, 0) + 1
+
+    def percentile(self, q):
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q / 100 * self.count
+            seen = 0
+            for index in sorted(self._buckets, key=lambda i: -math.inf if i is None else i):
+                seen += self._buckets[index]
+                if seen >= rank:
+                    # バケットの上端を返す (最大値は超えない)
+                    return 0.0 if index is None else min(self.max, self._BASE ** (index + 1))
+            return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 2) if self.count else 0.0,
+            "p50": round(self.percentile(50), 2),
+            "p95": round(self.percentile(95), 2),
+            "p99": round(self.percentile(99), 2),
+            "max": round(self.max, 2),
+        }
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def record_histogram(name, value):
+    with _histograms_lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+    histogram.record(value)
+
+
+def histograms():
+    """
+    記録済みのヒストグラムの要約 (件数・平均・パーセンタイル) を返します。
+    """
+    with _histograms_lock:
+        items = list(_histograms.items())
+    return {name: histogram.snapshot() for name, histogram in sorted(items)}
+
+
+def reset_histograms():
+    with _histograms_lock:
+        _histograms.clear()
+
+
+def _write_stdout(line):
+    # EMFはログ行全体がJSONである必要があるため、ロガーのフォーマットを通さずに書き出す
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+
+_sink = _write_stdout
+
+
+def set_sink(sink):
+    """
+    レコードの出力先 (1行の文字列を受け取る関数) を差し替えます。
+    """
+    global _sink
+    _sink = sink or _write_stdout
+
+
+def to_emf(record, namespace=None):
+    """
+    レコードを CloudWatch Embedded Metric Format に変換します。
+    """
+    dimensions = [name for name in DIMENSIONS if name in record]
+    metric_names = [
+        name for name, value in record.items()
+        if name not in dimensions and isinstance(value, (int, float)) and not isinstance(value, bool)
+    ]
+    emf = dict(record)
+    emf["_aws"] = {
+        "Timestamp": int(time.time() * 1000),
+        "CloudWatchMetrics": [{
+            "Namespace": namespace or METRICS_NAMESPACE,
+            "Dimensions": [dimensions],
+            "Metrics": [
+                {"Name": name, "Unit": "Milliseconds" if name.endswith("_ms") else UNITS.get(name, "Count")}
+                for name in metric_names
+            ],
+        }],
+    }
+    return emf
+
+
+def emit(job_metrics):
+    """
+    ジョブのメトリクスを1行の構造化レコードとして出力し、ヒストグラムに記録します。
+    """
+    record = job_metrics.to_record()
+    if METRICS_HISTOGRAMS:
+        for name, value in record.items():
+            if name.endswith("_ms"):
+                record_histogram(name, value)
+    if not METRICS_ENABLED:
+        return record
+    try:
+        payload = to_emf(record) if METRICS_FORMAT == "emf" else record
+        _sink(json.dumps(payload, ensure_ascii=False, separators=(",", ":")))
+    except Exception as e:
+        # メトリクスの出力失敗で本処理を止めない
+        logger.warning(f"メトリクスの出力に失敗しました: {e}")
+    return record
@@ -0,0 +1,55 @@
+import logging
+import os
+import string
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+# プロンプトファイルのディレクトリ (既定はこのモジュールと同じ場所の prompts/)
+PROMPT_DIR = os.environ.get("PROMPT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts"))
+
+# テンプレートごとに埋め込みが必要なプレースホルダ (記載のないものは {text} のみ)
+REQUIRED_FIELDS = {
+    "chunk_summary.txt": {"text", "part", "total"},
+    "merge_minutes.txt": {"minutes", "text"},
+}
+
+
+class PromptTemplateError(Exception):
+    """
+    プロンプトテンプレートの読み込み・検証に失敗した場合の例外。
+    """
+    pass
+
+
+def _validate_template(file_name: str, template: str) -> None:
+    """
+    テンプレートのプレースホルダが想定どおりで、format() で組み立てられることを確認します。
+    """
+    required = REQUIRED_FIELDS.get(file_name, {"text"})
+    try:
+        fields = {field for _, field, _, _ in string.Formatter().parse(template) if field is not None}
+        template.format(**{field: "" for field in required})
+    except (ValueError, KeyError, IndexError) as e:
+        raise PromptTemplateError(f"プロンプトテンプレートの形式が不正です: {file_name}, Error: {e}")
+    if fields != required:
+        raise PromptTemplateError(
+            f"プロンプトテンプレートのプレースホルダが不正です: {file_name}, 期待値: {sorted(required)}, 実際: {sorted(fields)}"
+        )
+
+
+def load_prompt_registry(prompt_dir: str = PROMPT_DIR):
+    """
+    prompt_dir 内の全ての .txt テンプレートを読み込んで検証し、読み取り専用の辞書として返します。
+    """
+    templates = {}
+    for file_name in sorted(os.listdir(prompt_dir)):
+        if not file_name.endswith(".txt"):
+            continue
+        path = os.path.join(prompt_dir, file_name)
+        with open(path, "r", encoding="utf-8") as f:
+            template = f.read()
+        _validate_template(file_name, template)
+        templates[file_name] = template
+    logger.info(f"プロンプトテンプレートを {len(templates)} 件読み込みました: {prompt_dir}")
+    return MappingProxyType(templates)
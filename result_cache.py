@@ -0,0 +1,228 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# キャッシュのバックエンド ("none" / "memory" / "sqlite" / "dynamodb")
+RESULT_CACHE_BACKEND = os.environ.get("RESULT_CACHE_BACKEND", "memory")
+# 保持する最大エントリ数 (超えた分は古いものから削除)
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "256"))
+# エントリの有効期間 (秒)
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get("RESULT_CACHE_TTL_SECONDS", "86400"))
+# SQLiteキャッシュのファイルパス
+RESULT_CACHE_SQLITE_PATH = os.environ.get("RESULT_CACHE_SQLITE_PATH", "/tmp/slack_summarizer_cache.db")
+# DynamoDBキャッシュのテーブル名 (パーティションキー: cache_key, TTL属性: expires_at)
+RESULT_CACHE_TABLE = os.environ.get("RESULT_CACHE_TABLE")
+
+
+def normalize_text(text: str) -> str:
+    """
+    キャッシュキー用にテキストを正規化します。
+    (Unicode正規化、行末の空白と空行の除去)
+    """
+    text = unicodedata.normalize("NFKC", text)
+    lines = (line.strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def make_cache_key(kind: str, text: str, prompt_template: str, model_name: str) -> str:
+    """
+    正規化したテキスト・プロンプトテンプレート・モデル名のハッシュからキャッシュキーを生成します。
+    """
+    digest = hashlib.sha256()
+    for part in (kind, model_name or "", prompt_template, normalize_text(text)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return f"{kind}:{digest.hexdigest()}"
+
+
+class ResultCache:
+    """
+    結果キャッシュの共通インターフェース。
+    サブクラスは _get / _set を実装します。ヒット・ミス数は get で集計します。
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: str):
+        try:
+            value = self._get(key)
+        except Exception as e:
+            # キャッシュ障害で本処理を止めない
+            logger.warning(f"キャッシュの読み込みに失敗しました: {e}")
+            value = None
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.incr("cache_misses" if value is None else "cache_hits")
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        try:
+            self._set(key, value)
+        except Exception as e:
+            logger.warning(f"キャッシュの書き込みに失敗しました: {e}")
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def _get(self, key: str):
+        raise NotImplementedError
+
+    def _set(self, key: str, value: str) -> None:
+        raise NotImplementedError
+
+
+class NullCache(ResultCache):
+    """
+    何もキャッシュしない実装 (キャッシュ無効時)。
+    """
+
+    def _get(self, key):
+        return None
+
+    def _set(self, key, value):
+        pass
+
+
+class MemoryLRUCache(ResultCache):
+    """
+    プロセス内のLRUキャッシュ。Lambdaのウォームスタート間で再利用されます。
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES, ttl_seconds: int = RESULT_CACHE_TTL_SECONDS):
+        super().__init__()
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self._ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache(ResultCache):
+    """
+    SQLiteファイルを使ったキャッシュ。同一ホストの複数プロセスで共有できます。
+    """
+
+    def __init__(self, path: str = RESULT_CACHE_SQLITE_PATH, max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+                 ttl_seconds: int = RESULT_CACHE_TTL_SECONDS):
+        super().__init__()
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS result_cache ("
+            " cache_key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+
+    def _get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM result_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM result_cache WHERE cache_key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE result_cache SET accessed_at = ? WHERE cache_key = ?", (now, key))
+            return row[0]
+
+    def _set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO result_cache (cache_key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + self._ttl_seconds, now),
+            )
+            # 期限切れと上限超過分 (最終アクセスが古い順) を削除する
+            self._conn.execute("DELETE FROM result_cache WHERE expires_at < ?", (now,))
+            self._conn.execute(
+                "DELETE FROM result_cache WHERE cache_key IN ("
+                " SELECT cache_key FROM result_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self._max_entries,),
+            )
+
+
+class DynamoDBCache(ResultCache):
+    """
+    DynamoDBテーブルを使ったキャッシュ。複数のLambdaインスタンスで共有できます。
+    エントリの削除はテーブルのTTL設定 (expires_at 属性) に任せます。
+    """
+
+    def __init__(self, table_name: str = RESULT_CACHE_TABLE, ttl_seconds: int = RESULT_CACHE_TTL_SECONDS):
+        super().__init__()
+        if not table_name:
+            raise ValueError("RESULT_CACHE_TABLE が設定されていません。")
+        import boto3  # Lambdaランタイムに同梱されているため requirements.txt には含めない
+        self._table = boto3.resource("dynamodb").Table(table_name)
+        self._ttl_seconds = ttl_seconds
+
+    def _get(self, key):
+        item = self._table.get_item(Key={"cache_key": key}).get("Item")
+        if item is None or int(item.get("expires_at", 0)) < time.time():
+            return None
+        return item.get("value")
+
+    def _set(self, key, value):
+        self._table.put_item(Item={
+            "cache_key": key,
+            "value": value,
+            "expires_at": int(time.time() + self._ttl_seconds),
+        })
+
+
+def create_result_cache(backend: str = None) -> ResultCache:
+    """
+    設定に応じた結果キャッシュを生成します。
+    """
+    backend = (backend or RESULT_CACHE_BACKEND).lower()
+    if backend == "none":
+        return NullCache()
+    if backend == "memory":
+        return MemoryLRUCache()
+    if backend == "sqlite":
+        return SQLiteCache()
+    if backend == "dynamodb":
+        return DynamoDBCache()
+    raise ValueError(f"未対応のキャッシュバックエンドです: {backend}")
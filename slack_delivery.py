@@ -0,0 +1,320 @@
+import collections
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import slack_renderer
+import slack_utils
+
+logger = logging.getLogger(__name__)
+
+# Slack APIのベースURL (ローカルのモックサーバーで試験する場合に変更する)
+SLACK_API_BASE_URL = os.environ.get("SLACK_API_BASE_URL", "https://slack.com/api/")
+# レート制限 (429) 時に Retry-After だけ待って再送する最大回数
+SLACK_MAX_RETRIES = int(os.environ.get("SLACK_MAX_RETRIES", "3"))
+# 同じチャンネルへの投稿の最小間隔 (秒)。chat.postMessage は1チャンネルあたり約1件/秒に制限される
+SLACK_CHANNEL_MIN_INTERVAL_SECONDS = float(os.environ.get("SLACK_CHANNEL_MIN_INTERVAL_SECONDS", "1.0"))
+# 1つのメンションへの返信 (処理中・議事録・エラー) をまとめて送るか
+SLACK_COALESCE_REPLIES = os.environ.get("SLACK_COALESCE_REPLIES", "true").lower() == "true"
+# 結果で処理中メッセージを上書きするか (既定では結果を新しいメッセージで送り、処理中メッセージは削除する)
+# Slackは編集されたメッセージのメンションを通知しないため、上書きするとユーザーに完了が通知されない
+SLACK_REPLACE_PROCESSING_MESSAGE = os.environ.get("SLACK_REPLACE_PROCESSING_MESSAGE", "false").lower() == "true"
+# 投稿をバックグラウンドのスレッドで行い、次の処理と並行させるか
+SLACK_ASYNC_POST = os.environ.get("SLACK_ASYNC_POST", "false").lower() == "true"
+# バックグラウンドで投稿するスレッドの最大数 (全チャンネルで共有する)
+SLACK_POSTER_MAX_WORKERS = int(os.environ.get("SLACK_POSTER_MAX_WORKERS", "4"))
+
+# チャンネル単位のレート制限をかけるAPI (chat.update / chat.delete はメソッド単位の制限のため対象外)
+RATE_LIMITED_METHODS = {"chat_postMessage", "files_upload_v2"}
+
+
+def create_web_client(token, base_url=None, max_retries=None):
+    """
+    レート制限 (429) と接続エラーを自動でリトライする WebClient を生成します。
+    """
+    from slack_sdk import WebClient
+    from slack_sdk.http_retry.builtin_handlers import ConnectionErrorRetryHandler, RateLimitErrorRetryHandler
+
+    return WebClient(
+        token=token,
+        base_url=base_url or SLACK_API_BASE_URL,
+        retry_handlers=[
+            ConnectionErrorRetryHandler(),
+            RateLimitErrorRetryHandler(max_retry_count=SLACK_MAX_RETRIES if max_retries is None else max_retries),
+        ],
+    )
+
+
+class ChannelRateLimiter:
+    """
+    チャンネルごとに投稿の間隔を min_interval 秒以上に保ちます。
+    """
+
+    def __init__(self, min_interval=SLACK_CHANNEL_MIN_INTERVAL_SECONDS):
+        self.min_interval = min_interval
+        self._next_allowed = {} # channel -> 次に投稿できる時刻
+        self._lock = threading.Lock()
+
+    def acquire(self, channel):
+        """
+        投稿できる時刻まで待ちます。待った秒数を返します。
+        """
+        if self.min_interval <= 0 or channel is None:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            allowed_at = max(now, self._next_allowed.get(channel, 0.0))
+            # 先に枠を確保してからロックの外で待つ (同じチャンネルの後続は更に後ろに並ぶ)
+            self._next_allowed[channel] = allowed_at + self.min_interval
+        wait = allowed_at - now
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def touch(self, channel):
+        """
+        投稿の完了時刻から min_interval 秒は次の投稿を待たせます。
+        (files_upload_v2 は複数のAPIを順に呼ぶため、投稿が完了するのは acquire より後になる)
+        """
+        if self.min_interval <= 0 or channel is None:
+            return
+        with self._lock:
+            next_allowed = time.monotonic() + self.min_interval
+            if next_allowed > self._next_allowed.get(channel, 0.0):
+                self._next_allowed[channel] = next_allowed
+
+
+class RateLimitedSlackClient:
+    """
+    WebClient をラップし、チャンネル単位の投稿間隔を守ってAPIを呼び出します。
+    slack_utils の送信関数にそのまま client として渡せます。
+    """
+
+    def __init__(self, client, rate_limiter=None):
+        self.client = client
+        self.rate_limiter = rate_limiter or ChannelRateLimiter()
+
+    def __getattr__(self, method):
+        func = getattr(self.client, method)
+        if method not in RATE_LIMITED_METHODS:
+            return func
+
+        def call(**kwargs):
+            self.rate_limiter.acquire(kwargs.get("channel"))
+            try:
+                return func(**kwargs)
+            finally:
+                self.rate_limiter.touch(kwargs.get("channel"))
+        return call
+
+
+class SlackPoster:
+    """
+    Slackへの投稿を実行します。async_mode では共有のバックグラウンドスレッド (最大 max_workers 本) で
+    チャンネルごとに投稿順を保ったまま実行し、呼び出し元は投稿の完了を待たずに次の処理に進めます。
+    """
+
+    def __init__(self, async_mode=SLACK_ASYNC_POST, max_workers=SLACK_POSTER_MAX_WORKERS):
+        self.async_mode = async_mode
+        self.max_workers = max_workers
+        self._executor = None
+        self._queues = {} # channel -> 投稿待ちの (Future, func, args, kwargs)。投稿中のチャンネルだけを持つ
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, channel=None, **kwargs) -> Future:
+        """
+        func(*args, **kwargs) を実行します。同じ channel の投稿は submit した順に実行されます。
+        """
+        if not self.async_mode:
+            future = Future()
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                logger.error(f"Slackへの投稿に失敗しました: {e}", exc_info=True)
+                future.set_exception(e)
+            return future
+        future = Future()
+        with self._lock:
+            self._pending.append(future)
+            queue = self._queues.get(channel)
+            if queue is not None:
+                # 同じチャンネルの投稿を実行中のスレッドが、順番に実行する
+                queue.append((future, func, args, kwargs))
+                return future
+            self._queues[channel] = collections.deque([(future, func, args, kwargs)])
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="slack-poster")
+            self._executor.submit(self._run_channel, channel)
+        return future
+
+    def _run_channel(self, channel):
+        """
+        チャンネルの投稿待ちがなくなるまで順に実行します。なくなったらチャンネルの待ち行列を破棄します。
+        """
+        while True:
+            with self._lock:
+                queue = self._queues[channel]
+                if not queue:
+                    del self._queues[channel]
+                    return
+                future, func, args, kwargs = queue.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                logger.error(f"Slackへの投稿に失敗しました: {e}", exc_info=True)
+                future.set_exception(e)
+
+    def drain(self, timeout=None):
+        """
+        投稿待ちの処理が全て終わるまで待ちます (Lambdaは応答後に停止するため、ハンドラの終了前に呼ぶ)。
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for future in pending:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass # 失敗は _run_channel でログ出力済み
+
+
+class MentionReplies:
+    """
+    1つのメンションへの返信をまとめて送ります。
+    処理中メッセージを投稿しておき、ファイルごとの結果 (Block Kit のブロック) は1メッセージに
+    収まる限り連結して、メンション付きの新しいメッセージで送ります (ユーザーに通知するため)。
+    処理中メッセージは最初の結果の送信後に削除します (SLACK_REPLACE_PROCESSING_MESSAGE の場合は最初のまとまりで置き換える)。
+    1メッセージに収まらない議事録は send_summary_message で複数メッセージ (またはファイル) として送ります
+    (添付順を保つため、その前にたまった結果を先に送る)。
+    """
+
+    def __init__(self, client, poster, channel_id, user_id, thread_ts, coalesce=SLACK_COALESCE_REPLIES,
+                 replace_processing_message=SLACK_REPLACE_PROCESSING_MESSAGE):
+        self.client = client
+        self.poster = poster
+        self.channel_id = channel_id
+        self.user_id = user_id
+        self.thread_ts = thread_ts
+        self.coalesce = coalesce
+        self.replace_processing_message = replace_processing_message
+        self._processing_ts = None
+        self._blocks = []
+        self._fallbacks = [] # 通知用のテキスト
+        self._items = [] # (ファイル名, 処理結果, MIMEタイプ)。まとめた送信に失敗した場合に1件ずつ送り直すために使う
+        self._callbacks = []
+
+    def start(self):
+        self._submit(self._post_processing_message)
+
+    def _post_processing_message(self):
+        self._processing_ts = slack_utils.send_processing_message(self.client, self.channel_id, self.user_id, self.thread_ts)
+
+    def add(self, file_name, result, mimetype=None, on_posted=None):
+        """
+        1ファイル分の処理結果を追加します。on_posted は結果の送信後に、送信にかかった秒数を引数に呼ばれます。
+        """
+        if result['status'] == 'ok':
+            fallback = slack_utils.format_summary_header(file_name)
+            blocks = [slack_renderer.section_block(fallback)] + slack_renderer.markdown_to_blocks(result['minutes'])
+            if len(slack_renderer.pack_messages(blocks)) > 1:
+                self._flush()
+                self._submit(slack_utils.send_summary_message, self.client, self.channel_id, self.user_id,
+                             file_name, result['minutes'], self.thread_ts, on_posted=on_posted)
+                return
+        else:
+            if result['status'] == 'unsupported':
+                fallback = slack_utils.format_unsupported_text(file_name, mimetype)
+            else:
+                fallback = slack_utils.format_error_text(file_name, result['error'])
+            blocks = [slack_renderer.section_block(text) for text in slack_renderer.split_text(
+                slack_renderer.escape_mrkdwn(fallback), slack_renderer.SECTION_TEXT_LIMIT - 32
+            )]
+
+        if self._blocks:
+            blocks = [{"type": "divider"}] + blocks
+            if len(slack_renderer.pack_messages(self._blocks + blocks)) > 1:
+                self._flush()
+                blocks = blocks[1:]
+        self._blocks.extend(blocks)
+        self._fallbacks.append(fallback)
+        self._items.append((file_name, result, mimetype))
+        if on_posted:
+            self._callbacks.append(on_posted)
+        if not self.coalesce:
+            self._flush()
+
+    def finish(self):
+        """
+        たまっている結果を送ります。
+        """
+        self._flush()
+        # 結果がすべて複数メッセージの議事録だった場合などに残った処理中メッセージを削除する
+        self._submit(self._delete_processing_message)
+
+    def _flush(self):
+        if not self._blocks:
+            return
+        blocks, self._blocks = self._blocks, []
+        fallbacks, self._fallbacks = self._fallbacks, []
+        items, self._items = self._items, []
+        callbacks, self._callbacks = self._callbacks, []
+        # 先頭のブロックにメンションを付ける (先頭はファイル名を含む短い見出し)
+        first = blocks[0]["text"]["text"]
+        blocks[0] = slack_renderer.section_block(f"<@{self.user_id}> {first}")
+        text = f"<@{self.user_id}> " + " / ".join(fallback.split("\n", 1)[0] for fallback in fallbacks)
+        self._submit(self._post, text, blocks, items, on_posted=callbacks)
+
+    def _post(self, text, blocks, items):
+        # 投稿は同じチャンネル内で順に実行されるため、処理中メッセージの投稿は完了している
+        if self._processing_ts and self.replace_processing_message:
+            processing_ts, self._processing_ts = self._processing_ts, None
+            try:
+                self.client.chat_update(channel=self.channel_id, ts=processing_ts, text=text, blocks=blocks)
+                return
+            except Exception as e:
+                logger.warning(f"処理中メッセージの更新に失敗したため、新しいメッセージで送信します: {e}")
+        try:
+            self.client.chat_postMessage(channel=self.channel_id, thread_ts=self.thread_ts, text=text, blocks=blocks)
+        except Exception as e:
+            # まとめたメッセージが送れなくても結果が失われないよう、1件ずつ通常のメッセージで送り直す
+            logger.error(f"Error sending reply message, sending results one by one: {e}")
+            for item in items:
+                self._post_item(*item)
+        self._delete_processing_message()
+
+    def _post_item(self, file_name, result, mimetype):
+        if result['status'] == 'ok':
+            slack_utils.send_summary_message(self.client, self.channel_id, self.user_id, file_name, result['minutes'],
+                                             self.thread_ts)
+        elif result['status'] == 'unsupported':
+            slack_utils.send_non_vtt_message(self.client, self.channel_id, self.user_id, file_name, mimetype, self.thread_ts)
+        else:
+            slack_utils.send_error_message(self.client, self.channel_id, self.user_id, file_name, result['error'],
+                                           self.thread_ts)
+
+    def _delete_processing_message(self):
+        processing_ts, self._processing_ts = self._processing_ts, None
+        if not processing_ts:
+            return
+        try:
+            self.client.chat_delete(channel=self.channel_id, ts=processing_ts)
+        except Exception as e:
+            logger.warning(f"処理中メッセージの削除に失敗しました: {e}")
+
+    def _submit(self, func, *args, on_posted=None):
+        callbacks = on_posted if isinstance(on_posted, list) else [on_posted] if on_posted else []
+
+        def task():
+            start = time.perf_counter()
+            try:
+                func(*args)
+            finally:
+                # 送信に失敗した場合も処理済みとし、計測値を出力する (lambda_function._post_file_result と同じ)
+                elapsed = time.perf_counter() - start
+                for callback in callbacks:
+                    callback(elapsed)
+        self.poster.submit(task, channel=self.channel_id)
@@ -0,0 +1,225 @@
+import os
+import re
+
+# Block Kit のセクションブロックのテキストの上限 (Slackの仕様)
+SECTION_TEXT_LIMIT = 3000
+# 1メッセージあたりのブロック数の上限 (Slackの仕様)
+MAX_BLOCKS_PER_MESSAGE = 50
+# 1メッセージに詰めるテキストの合計文字数の目安 (長すぎるメッセージはスレッド上で読みにくいため)
+SLACK_MESSAGE_MAX_CHARS = int(os.environ.get("SLACK_MESSAGE_MAX_CHARS", "12000"))
+# 議事録をこの件数より多いメッセージに分ける必要がある場合は、ファイルとして送信する
+SUMMARY_MAX_MESSAGES = int(os.environ.get("SUMMARY_MAX_MESSAGES", "8"))
+
+_HEADING_PATTERN = re.compile(r"^\s{0,3}(#{1,6})\s+(.*?)\s*#*\s*$")
+_BULLET_PATTERN = re.compile(r"^(\s*)[-*+]\s+(?:\[([ xX])\]\s+)?(.*)$")
+_ORDERED_PATTERN = re.compile(r"^(\s*)(\d+)[.)]\s+(.*)$")
+_RULE_PATTERN = re.compile(r"^\s{0,3}(?:(?:-\s*){3,}|(?:\*\s*){3,}|(?:_\s*){3,})$")
+_TABLE_ROW_PATTERN = re.compile(r"^\s*\|.*\|\s*$")
+_TABLE_SEPARATOR_PATTERN = re.compile(r"^\s*\|?\s*:?-+:?\s*(?:\|\s*:?-+:?\s*)*\|?\s*$")
+_FENCE_PATTERN = re.compile(r"^\s*```")
+
+_LINK_PATTERN = re.compile(r"!?\[([^\]]*)\]\(([^)\s]+)(?:\s+\"[^\"]*\")?\)")
+_BOLD_PATTERN = re.compile(r"\*\*(.+?)\*\*|__(.+?)__")
+_ITALIC_PATTERN = re.compile(r"(?<![*\w])\*(?!\s)([^*\n]+?)(?<!\s)\*(?![*\w])")
+_STRIKE_PATTERN = re.compile(r"~~(.+?)~~")
+
+
+def escape_mrkdwn(text):
+    """
+    Slackの制御文字 (&, <, >) をエスケープします。
+    """
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _convert_inline(text):
+    """
+    行内のMarkdown記法 (強調・打ち消し・リンク) を mrkdwn に変換します。インラインコードの中は変換しません。
+    """
+    parts = text.split("`")
+    for i in range(0, len(parts), 2):
+        if i == len(parts) - 1 and len(parts) % 2 == 0:
+            break # 閉じられていないバッククォート以降はそのまま
+        part = escape_mrkdwn(parts[i])
+        # リンクは強調の変換で記号が変わらないよう先に退避する
+        links = []
+
+        def stash_link(match):
+            links.append(f"<{match.group(2)}|{match.group(1) or match.group(2)}>")
+            return f"\x00{len(links) - 1}\x00"
+        part = _LINK_PATTERN.sub(stash_link, part)
+        part = _ITALIC_PATTERN.sub(r"_\1_", part)
+        part = _BOLD_PATTERN.sub(lambda m: f"*{m.group(1) or m.group(2)}*", part)
+        part = _STRIKE_PATTERN.sub(r"~\1~", part)
+        parts[i] = re.sub(r"\x00(\d+)\x00", lambda m: links[int(m.group(1))], part)
+    for i in range(1, len(parts), 2):
+        parts[i] = escape_mrkdwn(parts[i])
+    return "`".join(parts)
+
+
+def _strip_emphasis(text):
+    return re.sub(r"\*\*|__", "", text)
+
+
+def markdown_to_blocks(markdown):
+    """
+    Markdownの議事録を Block Kit のブロックのリストに変換します。
+    ブロックの区切りは見出しの境界とし、SECTION_TEXT_LIMIT に収まる限り続く見出しを同じブロックに詰めます。
+    水平線は divider にし、1つの見出しの内容が SECTION_TEXT_LIMIT を超える場合は行の境界で分割します。
+    """
+    sections = [] # セクションのテキスト (None は divider)
+    current = []
+    in_code = False
+    table = []
+
+    def flush_table():
+        if table:
+            # mrkdwn には表がないため、等幅のコードブロックで表示する
+            current.append("```\n" + "\n".join(escape_mrkdwn(row.strip()) for row in table) + "\n```")
+            table.clear()
+
+    def flush_section():
+        flush_table()
+        text = "\n".join(current).strip("\n")
+        if text.strip():
+            sections.append(text)
+        current.clear()
+
+    for line in markdown.splitlines():
+        if _FENCE_PATTERN.match(line):
+            flush_table()
+            in_code = not in_code
+            current.append("```")
+            continue
+        if in_code:
+            current.append(escape_mrkdwn(line))
+            continue
+        if _TABLE_ROW_PATTERN.match(line):
+            if not _TABLE_SEPARATOR_PATTERN.match(line):
+                table.append(line)
+            continue
+        flush_table()
+
+        heading = _HEADING_PATTERN.match(line)
+        if heading:
+            flush_section()
+            current.append(f"*{_convert_inline(_strip_emphasis(heading.group(2)))}*")
+            continue
+        if _RULE_PATTERN.match(line):
+            flush_section()
+            sections.append(None)
+            continue
+        bullet = _BULLET_PATTERN.match(line)
+        if bullet:
+            level = len(bullet.group(1).expandtabs(4)) // 2
+            if bullet.group(2) is not None:
+                marker = "☑" if bullet.group(2).lower() == "x" else "☐"
+            else:
+                marker = "•" if level == 0 else "◦"
+            current.append("    " * level + f"{marker} {_convert_inline(bullet.group(3))}")
+            continue
+        ordered = _ORDERED_PATTERN.match(line)
+        if ordered:
+            level = len(ordered.group(1).expandtabs(4)) // 2
+            current.append("    " * level + f"{ordered.group(2)}. {_convert_inline(ordered.group(3))}")
+            continue
+        current.append(_convert_inline(line))
+    if in_code:
+        current.append("```")
+    flush_section()
+
+    blocks = []
+    merged = None # 直前のブロックに続けて詰められるか
+    for text in sections:
+        if text is None:
+            if blocks and blocks[-1]["type"] != "divider":
+                blocks.append({"type": "divider"})
+            merged = None
+            continue
+        for part in split_text(text, SECTION_TEXT_LIMIT):
+            # ブロック数を減らすため、短い見出し単位のまとまりは上限まで1ブロックに詰める
+            if merged is not None and len(merged["text"]["text"]) + len(part) + 2 <= SECTION_TEXT_LIMIT:
+                merged["text"]["text"] += "\n\n" + part
+                continue
+            merged = section_block(part)
+            blocks.append(merged)
+    return blocks
+
+
+def section_block(text):
+    return {"type": "section", "text": {"type": "mrkdwn", "text": text}}
+
+
+def split_text(text, limit):
+    """
+    テキストを limit 文字以下に分割します。空行 → 行の境界の順に区切り、
+    コードブロックの途中で区切る場合は前後の ``` を補います。
+    """
+    if len(text) <= limit:
+        return [text]
+    parts = []
+    current = []
+    current_len = 0
+    in_code = False
+    for line in text.split("\n"):
+        # 1行だけで上限を超える場合は文字数で強制的に分割する
+        while len(line) > limit - 8:
+            head, line = line[:limit - 8], line[limit - 8:]
+            if current:
+                parts.append(_close_part(current, in_code))
+                current, current_len = (["```"] if in_code else []), (3 if in_code else 0)
+            parts.append(_close_part([head], False) if not in_code else "```\n" + head + "\n```")
+        if current and current_len + len(line) + 1 > limit - 4:
+            parts.append(_close_part(current, in_code))
+            current, current_len = (["```"] if in_code else []), (3 if in_code else 0)
+        current.append(line)
+        current_len += len(line) + 1
+        if line.lstrip().startswith("```"):
+            in_code = not in_code
+    if current:
+        parts.append(_close_part(current, in_code))
+    return [part for part in parts if part.strip() and part.strip() != "```\n```"]
+
+
+def _close_part(lines, in_code):
+    text = "\n".join(lines).strip("\n")
+    return text + "\n```" if in_code else text
+
+
+def _block_length(block):
+    return len(block.get("text", {}).get("text", ""))
+
+
+def pack_messages(blocks, max_blocks=MAX_BLOCKS_PER_MESSAGE, max_chars=None):
+    """
+    ブロックを順序を保ったまま、ブロック数と文字数の上限に収まる最少のメッセージに詰めます。
+    """
+    max_chars = max_chars or SLACK_MESSAGE_MAX_CHARS
+    messages = []
+    current, current_chars = [], 0
+    for block in blocks:
+        length = _block_length(block)
+        if current and (len(current) >= max_blocks or current_chars + length > max_chars):
+            messages.append(current)
+            current, current_chars = [], 0
+        if not current and block["type"] == "divider":
+            continue # メッセージ先頭の区切り線は不要
+        current.append(block)
+        current_chars += length
+    if current:
+        while current and current[-1]["type"] == "divider":
+            current.pop()
+        if current:
+            messages.append(current)
+    return messages
+
+
+def render_summary(header, markdown, max_messages=None):
+    """
+    見出し (メンションなど) と議事録を、スレッドに順に投稿するメッセージ (ブロックのリスト) に変換します。
+    SUMMARY_MAX_MESSAGES 件を超える場合は None を返します (ファイル送信に切り替える)。
+    """
+    max_messages = max_messages or SUMMARY_MAX_MESSAGES
+    messages = pack_messages([section_block(header)] + markdown_to_blocks(markdown))
+    if len(messages) > max_messages:
+        return None
+    return messages
@@ -1,14 +1,37 @@
-import requests
+import codecs
 import json
 import logging
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
+import os
+import threading
+import time
+
+import slack_renderer
+import text_extractor
+
+# slack_sdk と requests はインポートに時間がかかるため、使用する関数内でインポートする
+# (URL検証やリトライの応答ではどちらも不要なためコールドスタートが短くなる)
 
 logger = logging.getLogger(__name__)
 
-# Slackメッセージの最大文字長 (これを超えるとファイルとしてアップロード)
+# 1つのコードブロックで表示するメッセージの最大文字長 (ストリーミング中の途中経過の表示に使う)
 MAX_MESSAGE_LENGTH = 3000
 
+# ファイルダウンロードの設定
+# 許容する最大ファイルサイズ (バイト)
+DOWNLOAD_MAX_BYTES = int(os.environ.get("DOWNLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+# 接続・読み取りのタイムアウト (秒)
+DOWNLOAD_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("DOWNLOAD_CONNECT_TIMEOUT_SECONDS", "5"))
+DOWNLOAD_READ_TIMEOUT_SECONDS = float(os.environ.get("DOWNLOAD_READ_TIMEOUT_SECONDS", "30"))
+# ストリーミング受信の1回あたりの読み込みサイズ (バイト)
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get("DOWNLOAD_CHUNK_SIZE", str(64 * 1024)))
+# コネクションプールの最大接続数
+DOWNLOAD_POOL_SIZE = int(os.environ.get("DOWNLOAD_POOL_SIZE", "10"))
+# 文字コードの判定に使うファイル先頭のバイト数 (この分だけ受信してから判定する)
+ENCODING_DETECT_BYTES = int(os.environ.get("ENCODING_DETECT_BYTES", str(256 * 1024)))
+
+# ストリーミング時に処理中メッセージを更新する最小間隔 (秒)。chat.update のレート制限対策
+STREAM_UPDATE_INTERVAL_SECONDS = float(os.environ.get("STREAM_UPDATE_INTERVAL_SECONDS", "2.0"))
+
 # def is_slack_retry(headers):
 #     """
 #     Slackイベントのリトライを検知します。
@@ -32,6 +55,7 @@ def send_message(client, channel, text, thread_ts=None, file_upload=False, title
     """
     Slackにメッセージを送信する汎用関数。(現在は直接未使用)
     """
+    from slack_sdk.errors import SlackApiError
     try:
         if file_upload:
             # files_upload_v2 は filetype 引数をサポートしないので削除
@@ -57,42 +81,261 @@ def send_message(client, channel, text, thread_ts=None, file_upload=False, title
 def send_processing_message(client, channel_id, user_id, ts):
     """
     ファイル処理中であることをユーザーに通知するメッセージを送信します。
+    送信したメッセージの ts を返します (失敗時は None)。
     """
     try:
-        client.chat_postMessage(
+        response = client.chat_postMessage(
             channel=channel_id,
             thread_ts=ts,
             text=f"<@{user_id}> ファイルを受信しました。内容を処理中です... ⏳" # ユーザーメンションを追加
         )
+        return response.get("ts")
     except Exception as e:
         logger.error(f"Error sending processing message: {e}")
+        return None
 
-def download_file(file_url, slack_bot_token, binary_mode=False):
+class StreamingMessageUpdater:
     """
-    指定されたURLからファイルをダウンロードします。
+    生成中の議事録で処理中メッセージを chat_update により随時更新します。
+    更新は STREAM_UPDATE_INTERVAL_SECONDS 以上の間隔に間引き、
+    MAX_MESSAGE_LENGTH を超えた時点で更新をやめ、完成後に議事録を送り直します。
+    """
+
+    def __init__(self, client, channel_id, user_id, file_name, thread_ts, message_ts,
+                 min_interval=STREAM_UPDATE_INTERVAL_SECONDS):
+        self.client = client
+        self.channel_id = channel_id
+        self.user_id = user_id
+        self.file_name = file_name
+        self.thread_ts = thread_ts
+        self.message_ts = message_ts
+        self.min_interval = min_interval
+        self.update_count = 0
+        self._next_update_at = 0.0
+        self._overflowed = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def start(cls, client, channel_id, user_id, file_name, thread_ts, **kwargs):
+        """
+        ファイルごとの処理中メッセージを投稿し、それを更新するインスタンスを返します。
+        """
+        try:
+            response = client.chat_postMessage(
+                channel=channel_id,
+                thread_ts=thread_ts,
+                text=f"<@{user_id}> '{file_name}' を処理中です... ⏳"
+            )
+        except Exception as e:
+            logger.error(f"Error sending processing message: {e}")
+            return None
+        return cls(client, channel_id, user_id, file_name, thread_ts, response.get("ts"), **kwargs)
+
+    def update(self, partial_text):
+        """
+        生成途中のテキストでメッセージを更新します (間隔内の呼び出しは読み捨てる)。
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._overflowed or now < self._next_update_at:
+                return
+            self._next_update_at = now + self.min_interval
+            if len(partial_text) > MAX_MESSAGE_LENGTH:
+                self._overflowed = True
+                text = f"<@{self.user_id}> '{self.file_name}' の議事録を生成中です... ⏳\n文字数が多いため、完成後にファイルで送信します。"
+            else:
+                text = f"<@{self.user_id}> '{self.file_name}' の議事録を生成中です... ⏳\n\n```{partial_text}```"
+            self._chat_update(text)
+
+    def finish(self, summarized_text):
+        """
+        完成した議事録でメッセージを確定します。長すぎる場合はファイル送信に切り替えます。
+        """
+        header = f"<@{self.user_id}> '{self.file_name}' の議事録ができました！ ✨"
+        messages = slack_renderer.render_summary(header, summarized_text)
+        if messages is not None and len(messages) == 1 and self._chat_update(header, blocks=messages[0]):
+            return
+        # 複数メッセージに分かれる場合は、処理中メッセージを消してから順に投稿し直す
+        self.discard()
+        send_summary_message(self.client, self.channel_id, self.user_id, self.file_name, summarized_text, self.thread_ts)
+
+    def discard(self):
+        """
+        処理中メッセージを削除します (エラー通知などを別メッセージで送る場合)。
+        """
+        try:
+            self.client.chat_delete(channel=self.channel_id, ts=self.message_ts)
+        except Exception as e:
+            logger.warning(f"Error deleting processing message: {e}")
+
+    def _chat_update(self, text, blocks=None):
+        from slack_sdk.errors import SlackApiError
+        try:
+            self.client.chat_update(channel=self.channel_id, ts=self.message_ts, text=text, blocks=blocks)
+            self.update_count += 1
+            return True
+        except SlackApiError as e:
+            # レート制限時は Retry-After の間だけ更新を止める
+            retry_after = e.response.headers.get("Retry-After") if e.response is not None else None
+            if retry_after:
+                self._next_update_at = time.monotonic() + float(retry_after)
+            logger.warning(f"Error updating streaming message: {e.response.get('error') if e.response is not None else e}")
+        except Exception as e:
+            logger.warning(f"Error updating streaming message: {e}")
+        return False
+
+class FileTooLargeError(Exception):
+    """
+    ダウンロードするファイルが DOWNLOAD_MAX_BYTES を超えている場合の例外。
     """
+    pass
+
+# HTTPセッション (Lambdaのウォームスタート間でKeep-Alive接続を再利用する)
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def _get_http_session():
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            import requests
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=DOWNLOAD_POOL_SIZE, pool_maxsize=DOWNLOAD_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
+def iter_download_chunks(file_url, slack_bot_token, max_bytes=None):
+    """
+    指定されたURLからファイルをストリーミングでダウンロードし、バイト列のチャンクを順に返します。
+    max_bytes (省略時は DOWNLOAD_MAX_BYTES) を超えた時点で FileTooLargeError を送出します。
+    """
+    import requests
+    max_bytes = max_bytes or DOWNLOAD_MAX_BYTES
     headers = {"Authorization": f"Bearer {slack_bot_token}"}
     try:
-        response = requests.get(file_url, headers=headers)
-        response.raise_for_status() # HTTPエラーがあれば例外を発生
-        if binary_mode:
-            return response.content
-        else:
-            # Content-Typeを見てエンコーディングを推測 (より堅牢に)
-            response.encoding = response.apparent_encoding
-            return response.text
+        with _get_http_session().get(
+            file_url,
+            headers=headers,
+            stream=True,
+            timeout=(DOWNLOAD_CONNECT_TIMEOUT_SECONDS, DOWNLOAD_READ_TIMEOUT_SECONDS),
+        ) as response:
+            response.raise_for_status() # HTTPエラーがあれば例外を発生
+            content_length = response.headers.get("Content-Length")
+            if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+                raise FileTooLargeError(f"ファイルサイズが上限 ({max_bytes} バイト) を超えています: {content_length} バイト")
+            received = 0
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                received += len(chunk)
+                if received > max_bytes:
+                    raise FileTooLargeError(f"ファイルサイズが上限 ({max_bytes} バイト) を超えています。")
+                yield chunk
     except requests.exceptions.RequestException as e:
         logger.error(f"ファイルのダウンロードに失敗しました: {file_url}, Error: {e}")
         raise # エラーを上位に伝播
 
+def detect_encoding(head):
+    """
+    ファイル先頭のバイト列から文字コードを判定します。
+    BOM付きUTF-8/UTF-16、UTF-8、Shift_JIS (cp932) の順に判定します。
+    """
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    for encoding in ("utf-8", "cp932"):
+        try:
+            # 末尾で分断されたマルチバイト文字は許容する (final=False)
+            codecs.getincrementaldecoder(encoding)().decode(head, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return "utf-8"
+
+def decode_lines(chunks):
+    """
+    バイト列のチャンクを、先頭 ENCODING_DETECT_BYTES バイトで判定した文字コードで逐次デコードし、行単位で返します。
+    (先頭チャンクだけでは英数字しか含まれず、Shift_JIS を UTF-8 と誤判定することがあるため、
+    判定に十分な分だけ受信してから判定します)
+    """
+    decoder = None
+    head = []
+    head_size = 0
+    buffer = ""
+    for chunk in chunks:
+        if decoder is None:
+            head.append(chunk)
+            head_size += len(chunk)
+            if head_size < ENCODING_DETECT_BYTES:
+                continue
+            chunk = b"".join(head)
+            head = []
+            decoder = _make_decoder(chunk)
+        buffer += decoder.decode(chunk)
+        lines = buffer.splitlines(keepends=True)
+        # 最後の行は改行で終わっていなければ次のチャンクに持ち越す
+        buffer = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+        yield from lines
+    if decoder is None and head:
+        # ファイル全体が判定用のバイト数より小さい場合
+        chunk = b"".join(head)
+        decoder = _make_decoder(chunk)
+        buffer += decoder.decode(chunk)
+    if decoder is not None:
+        buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield from buffer.splitlines(keepends=True)
+
+def _make_decoder(head):
+    encoding = detect_encoding(head)
+    logger.info(f"ファイルの文字コードを {encoding} と判定しました。")
+    return codecs.getincrementaldecoder(encoding)(errors="replace")
+
+def iter_download_lines(file_url, slack_bot_token, max_bytes=None):
+    """
+    指定されたURLのテキストファイルをストリーミングでダウンロードし、デコードした行を順に返します。
+    ファイル全体をメモリに載せないため、ファイルサイズによらずメモリ使用量は一定です。
+    """
+    return decode_lines(iter_download_chunks(file_url, slack_bot_token, max_bytes))
+
+def download_file(file_url, slack_bot_token, binary_mode=False):
+    """
+    指定されたURLからファイルをダウンロードします。
+    """
+    content = b"".join(iter_download_chunks(file_url, slack_bot_token))
+    if binary_mode:
+        return content
+    return content.decode(detect_encoding(content), errors="replace")
+
+# --- 返信メッセージの本文 (先頭のユーザーメンションを除く。複数の結果をまとめて送る場合にも使う) ---
+def format_summary_header(file_name):
+    return f"'{file_name}' の議事録ができました！ ✨"
+
+def format_error_text(file_name, error_details):
+    return f"😥 '{file_name}' の処理中にエラーが発生しました。\n> {error_details}"
+
+def format_supported_extensions():
+    """
+    対応している拡張子の一覧 (例: `.vtt`・`.txt`) を、抽出処理の登録内容から作ります。
+    """
+    return "・".join(f"`{extension}`" for extension in text_extractor.supported_extensions())
+
+def format_unsupported_text(file_name, file_mimetype):
+    return f"'{file_name}' (`{file_mimetype}`) は未対応の形式です。\n{format_supported_extensions()} のいずれかのファイルを添付してください。"
+
 def send_summary_message(client, channel_id, user_id, file_name, summarized_text, ts):
     """
     議事録の要約結果をSlackに送信します。
+    議事録は Block Kit に変換し、見出しの境界で分けた最少のメッセージをスレッドに順に投稿します。
+    SUMMARY_MAX_MESSAGES 件に収まらないほど長い場合はファイルとして送信します。
     """
-    initial_comment = f"<@{user_id}> '{file_name}' の議事録ができました！ ✨"
+    from slack_sdk.errors import SlackApiError
+    initial_comment = f"<@{user_id}> " + format_summary_header(file_name)
     try:
-        if len(summarized_text) > MAX_MESSAGE_LENGTH:
-            logger.info(f"要約テキストが{MAX_MESSAGE_LENGTH}文字を超えているためファイルとしてアップロード: {len(summarized_text)}文字")
+        messages = slack_renderer.render_summary(initial_comment, summarized_text)
+        if messages is None:
+            logger.info(f"要約テキストが{slack_renderer.SUMMARY_MAX_MESSAGES}メッセージに収まらないためファイルとしてアップロード: {len(summarized_text)}文字")
             # files_upload_v2 に合わせて filetype を削除
             client.files_upload_v2(
                 channel=channel_id,
@@ -102,12 +345,14 @@ def send_summary_message(client, channel_id, user_id, file_name, summarized_text
                 thread_ts=ts
             )
         else:
-            client.chat_postMessage(
-                channel=channel_id,
-                thread_ts=ts,
-                text=initial_comment + f"\n\n```{summarized_text}```",
-                mrkdwn=True
-            )
+            for i, blocks in enumerate(messages, start=1):
+                client.chat_postMessage(
+                    channel=channel_id,
+                    thread_ts=ts,
+                    # 通知やブロック非対応の表示用のテキスト (メンションは最初のメッセージのみ)
+                    text=initial_comment if i == 1 else f"'{file_name}' の議事録 ({i}/{len(messages)})",
+                    blocks=blocks
+                )
     except SlackApiError as e:
         # missing_scope エラーなどを捕捉
         logger.error(f"Error sending summary message: {e.response['error']}")
@@ -130,7 +375,7 @@ def send_error_message(client, channel_id, user_id, file_name, error_details, ts
         client.chat_postMessage(
             channel=channel_id,
             thread_ts=ts,
-            text=f"<@{user_id}> 😥 '{file_name}' の処理中にエラーが発生しました。\n> {error_details}"
+            text=f"<@{user_id}> " + format_error_text(file_name, error_details)
         )
     except Exception as e:
         logger.error(f"Error sending error message itself: {e}")
@@ -143,7 +388,7 @@ def send_non_vtt_message(client, channel_id, user_id, file_name, file_mimetype,
         client.chat_postMessage(
             channel=channel_id,
             thread_ts=ts,
-            text=f"<@{user_id}> '{file_name}' (`{file_mimetype}`) は未対応の形式です。\n`.vtt` または `.txt` ファイルを添付してください。"
+            text=f"<@{user_id}> " + format_unsupported_text(file_name, file_mimetype)
         )
     except Exception as e:
         logger.error(f"Error sending non-VTT/TXT message: {e}")
@@ -156,7 +401,7 @@ def send_general_mention_message(client, channel_id, user_id, ts):
         client.chat_postMessage(
             channel=channel_id,
             thread_ts=ts,
-            text=f"<@{user_id}> `.vtt` または `.txt` ファイルを添付してメンションすると、議事録を作成します。"
+            text=f"<@{user_id}> {format_supported_extensions()} のいずれかのファイルを添付してメンションすると、議事録を作成します。"
         )
     except Exception as e:
         logger.error(f"Error sending general mention message: {e}")
\ No newline at end of file
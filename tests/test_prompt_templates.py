@@ -0,0 +1,56 @@
+import pytest
+
+import ai_processor
+import prompt_registry
+
+
+def test_registry_contains_every_template_file():
+    assert "merge_minutes.txt" in ai_processor.PROMPTS
+    assert "chunk_summary.txt" in ai_processor.PROMPTS
+    for file_name in ai_processor.MINUTES_PROMPT_FILES.values():
+        assert file_name in ai_processor.PROMPTS
+
+
+@pytest.mark.parametrize("file_name", sorted(ai_processor.PROMPTS))
+def test_template_formats_with_expected_placeholders(file_name):
+    template = ai_processor.PROMPTS[file_name]
+    required = prompt_registry.REQUIRED_FIELDS.get(file_name, {"text"})
+    values = {field: f"<<{field}-value>>" for field in required}
+
+    prompt = template.format(**values)
+
+    for field, value in values.items():
+        assert value in prompt
+        assert "{" + field + "}" not in prompt
+
+
+@pytest.mark.parametrize("build", [
+    ai_processor.generate_classify_meeting_prompt,
+    ai_processor.generate_presales_minutes_prompt,
+    ai_processor.generate_requirements_minutes_prompt,
+    ai_processor.generate_maintenance_minutes_prompt,
+    ai_processor.generate_misc_minutes_prompt,
+    ai_processor.generate_classify_and_minutes_prompt,
+    lambda text: ai_processor.generate_chunk_summary_prompt(text, 1, 2),
+    lambda text: ai_processor.generate_merge_minutes_prompt("<<minutes>>", text),
+])
+def test_prompt_builders_embed_compacted_text(build):
+    text = "山田: 障害の原因はDBの接続数です\nSuzuki: {braces} も壊れないこと"
+
+    prompt = build(text)
+
+    assert text in prompt
+
+
+def test_merge_minutes_prompt_embeds_previous_minutes():
+    prompt = ai_processor.generate_merge_minutes_prompt("## 前回の議事録", "山田: 追加の発言")
+
+    assert "## 前回の議事録" in prompt
+    assert "山田: 追加の発言" in prompt
+
+
+def test_invalid_template_is_rejected(tmp_path):
+    (tmp_path / "merge_minutes.txt").write_text("{text} だけで前回の議事録がない", encoding="utf-8")
+
+    with pytest.raises(prompt_registry.PromptTemplateError):
+        prompt_registry.load_prompt_registry(str(tmp_path))
@@ -0,0 +1,49 @@
+import json
+
+import thread_state
+
+
+def _hashes(lines):
+    return thread_state.diff_lines("\n".join(lines), None)[1]
+
+
+def test_line_overlap_separates_followups_from_other_meetings():
+    first_half = [f"山田: 障害の対応について確認します {i}" for i in range(50)]
+    full = first_half + [f"Suzuki: 復旧手順を共有します {i}" for i in range(50)]
+    other = [f"佐藤: 新機能の要件を整理します {i}" for i in range(100)]
+
+    assert thread_state.line_overlap(_hashes(first_half), _hashes(full)) == 1.0
+    assert thread_state.line_overlap(_hashes(other), _hashes(full)) == 0.0
+
+
+def test_find_related_meeting_skips_meetings_of_the_same_mention():
+    lines = [f"山田: 障害の対応について確認します {i}" for i in range(20)]
+    meetings = [{"minutes": "議事録", "line_hashes": _hashes(lines), "mention": "1.0"}]
+
+    assert thread_state.find_related_meeting(meetings, _hashes(lines), exclude_mention="1.0") is None
+    assert thread_state.find_related_meeting(meetings, _hashes(lines), exclude_mention="2.0") == 0
+
+
+def test_meetings_of_reads_single_meeting_state():
+    state = {"category": "運用保守", "minutes": "議事録", "line_hashes": ["a"], "runs": 1}
+
+    assert thread_state.meetings_of(state) == [state]
+    assert thread_state.meetings_of(None) == []
+
+
+def test_serialize_state_drops_hashes_of_the_oldest_meeting_first():
+    old = {"minutes": "古い議事録", "line_hashes": [f"{i:016x}" for i in range(1000)]}
+    new = {"minutes": "新しい議事録", "line_hashes": [f"{i:016x}" for i in range(1000, 1100)]}
+    state = {"meetings": [old, new]}
+
+    serialized = thread_state.serialize_state(state, max_bytes=10000)
+
+    restored = json.loads(serialized)
+    assert len(serialized.encode("utf-8")) <= 10000
+    assert restored["meetings"][1]["line_hashes"] == new["line_hashes"]
+    assert restored["meetings"][0]["line_hashes"] == old["line_hashes"][-len(restored["meetings"][0]["line_hashes"]):]
+
+
+def test_null_store_is_disabled():
+    assert not thread_state.NullThreadStateStore.enabled
+    assert thread_state.InMemoryThreadStateStore().enabled
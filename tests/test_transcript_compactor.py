@@ -0,0 +1,54 @@
+import pytest
+
+import text_extractor
+import transcript_compactor
+from benchmarks.bench_compaction import make_noisy_transcript
+from token_estimator import estimate_tokens
+
+SAMPLE_VTT = """WEBVTT
+
+1
+00:00:01.000 --> 00:00:03.000
+<v 山田>えーと、障害の原因は
+
+2
+00:00:03.000 --> 00:00:05.000
+<v 山田>えーと、障害の原因はDBの接続数です
+
+3
+00:00:05.000 --> 00:00:07.000
+<v Suzuki>あのー、来週までに見積を出します
+
+4
+00:00:07.000 --> 00:00:09.000
+<v Suzuki>来週までに見積を出します。
+
+5
+00:00:09.000 --> 00:00:10.000
+<v 佐藤>うーん
+
+6
+00:00:10.000 --> 00:00:12.000
+<v 佐藤>まあ、ログを共有します
+"""
+
+
+@pytest.mark.parametrize("text", [
+    make_noisy_transcript(500),
+    make_noisy_transcript(2000, seed=1),
+    text_extractor.extract_speaker_text_from_vtt(SAMPLE_VTT * 20),
+], ids=["synthetic-500", "synthetic-2000", "vtt"])
+def test_compaction_reduces_token_estimate(text):
+    compaction = transcript_compactor.compact_transcript(text)
+
+    assert compaction.original_tokens == estimate_tokens(text)
+    assert compaction.compacted_tokens == estimate_tokens(compaction.text)
+    assert compaction.compacted_tokens < compaction.original_tokens
+
+
+def test_compaction_keeps_every_topic():
+    text = make_noisy_transcript(500)
+    compaction = transcript_compactor.compact_transcript(text)
+
+    for topic in ("障害の原因はDBの接続数です", "来週までに見積を出します", "画面の仕様を確認させてください", "ログを共有します"):
+        assert topic in compaction.text
@@ -1,4 +1,643 @@
 import io
+import itertools
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# VTTから抽出するテキストに各発言の開始時刻を含めるか
+VTT_INCLUDE_TIMESTAMPS = os.environ.get("VTT_INCLUDE_TIMESTAMPS", "true").lower() == "true"
+# VTT・SRTをプロセスプールで並列に解析するワーカー数 (0 はCPU数、1 以下で並列化しない)
+EXTRACT_PARALLEL_WORKERS = int(os.environ.get("EXTRACT_PARALLEL_WORKERS", "0")) or (os.cpu_count() or 1)
+# 並列に解析するのは、読み込んだ文字数がこの値を超えた場合のみ (小さいファイルはプロセス間通信の方が高くつく)
+EXTRACT_PARALLEL_MIN_CHARS = int(os.environ.get("EXTRACT_PARALLEL_MIN_CHARS", str(8 * 1024 * 1024)))
+# 1ワーカーに渡すまとまりの文字数の目安 (キューの境界で区切る)
+EXTRACT_PARALLEL_BATCH_CHARS = int(os.environ.get("EXTRACT_PARALLEL_BATCH_CHARS", str(2 * 1024 * 1024)))
+# DOCXの展開のために受信したデータをメモリに置く上限 (超えた分は一時ファイルに書き出す)
+DOCX_SPOOL_MAX_BYTES = int(os.environ.get("DOCX_SPOOL_MAX_BYTES", str(16 * 1024 * 1024)))
+# 中身から形式を判定するために読む先頭のバイト数
+SNIFF_BYTES = 4096
+
+# VTTのタイミング行 (例: 00:01:02.345 --> 00:01:05.000、時間部分は省略可)
+_VTT_TIMING_PATTERN = re.compile(
+    r"^(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{3})\s+-->\s+(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{3})"
+)
+# 発言者タグ (例: <v 山田 太郎>、<v.loud 山田>)
+_VTT_VOICE_PATTERN = re.compile(r"<v(?:\.[^\s>]*)?\s+([^>]+)>")
+# HTMLタグのようなもの
+_TAG_PATTERN = re.compile(r"<[^>]+>")
+# 発言者情報 (例: <v ->山田>...</v>)
+_VOICE_SPAN_PATTERN = re.compile(r"<v\s*[^>]*>.*?</v>")
+# キューの区切りの空行 (空白だけの行を含む、連続した空行は1つの区切りとみなす)
+_BLANK_LINE_PATTERN = re.compile(r"\n(?:[^\S\n]*\n)+")
+# VTTをブロック単位でまとめて処理するため、入力をこの文字数ずつ読み込む
+_BLOCK_READ_CHARS = 1024 * 1024
+# Zoom形式の「発言者名: 本文」
+# (本文中のURLや時刻 (http://…、10:30) を発言者と誤認しないよう、区切りの後の空白を必須とし、
+#  発言者名に数字・「/」・「.」を含むものは対象外とする)
+_SPEAKER_PREFIX_PATTERN = re.compile(r"^([^:：<>\[\]()（）\d/.]{1,30}?)\s*[:：]\s+(.+)$")
+
+
+class Cue:
+    """
+    VTTの1キュー (開始・終了秒、発言者、本文)。
+    """
+    __slots__ = ("start", "end", "speaker", "text")
+
+    def __init__(self, start, end, speaker, text):
+        self.start = start
+        self.end = end
+        self.speaker = speaker
+        self.text = text
+
+    def __repr__(self):
+        return f"Cue({self.start!r}, {self.end!r}, {self.speaker!r}, {self.text!r})"
+
+
+def _timestamp_to_seconds(hours, minutes, seconds, millis):
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int(millis) / 1000
+
+
+def _iter_lines(source):
+    """
+    文字列・バイト列・ファイルオブジェクト・行のイテラブルを、文字列の行のイテラブルに変換します。
+    (行末の改行は残ります。BOMは除去します)
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    if isinstance(source, str):
+        return io.StringIO(source.lstrip("\ufeff"))
+    if isinstance(source, (io.RawIOBase, io.BufferedIOBase)):
+        # バイナリのファイルはCレベルのデコーダでまとめてデコードする
+        return io.TextIOWrapper(source, encoding="utf-8-sig", errors="replace")
+    return _decode_lines(source)
+
+
+def _decode_lines(lines):
+    first = True
+    for line in lines:
+        if isinstance(line, (bytes, bytearray)):
+            line = line.decode("utf-8", errors="replace")
+        if first:
+            line = line.lstrip("\ufeff")
+            first = False
+        yield line
+
+
+def _parse_cue_payload(payload_lines, speaker_prefix):
+    """
+    キューの本文行から (発言者, 本文) を取り出します。
+    """
+    speaker = None
+    texts = []
+    for line in payload_lines:
+        if "<" in line:
+            if speaker is None:
+                voice = _VTT_VOICE_PATTERN.search(line)
+                if voice:
+                    speaker = voice.group(1).strip()
+            line = _TAG_PATTERN.sub("", line)
+        line = line.strip()
+        if line:
+            texts.append(line)
+    text = " ".join(texts)
+    if speaker is None and speaker_prefix:
+        prefixed = _SPEAKER_PREFIX_PATTERN.match(text)
+        if prefixed:
+            speaker, text = prefixed.group(1).strip(), prefixed.group(2).strip()
+    return speaker, text
+
+
+def _iter_text_chunks(source):
+    """
+    文字列・バイト列・ファイルオブジェクト・行のイテラブルを、_BLOCK_READ_CHARS 文字程度の文字列に分けて順に返します。
+    (BOMは除去し、改行は CRLF・CR も LF にそろえます)
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    if isinstance(source, (io.RawIOBase, io.BufferedIOBase)):
+        # バイナリのファイルはCレベルのデコーダでまとめてデコードする (改行も LF にそろう)
+        source = io.TextIOWrapper(source, encoding="utf-8-sig", errors="replace")
+    if isinstance(source, str):
+        source = source.lstrip("\ufeff")
+        chunks = (source[i:i + _BLOCK_READ_CHARS] for i in range(0, len(source), _BLOCK_READ_CHARS))
+    elif isinstance(source, io.TextIOBase):
+        chunks = iter(lambda: source.read(_BLOCK_READ_CHARS), "")
+    else:
+        chunks = _join_lines(_decode_lines(source))
+
+    carry = ""
+    for chunk in chunks:
+        chunk = carry + chunk
+        # CRLF がチャンクの境界で分かれないよう、末尾の CR は次のチャンクに持ち越す
+        carry = "\r" if chunk.endswith("\r") else ""
+        if carry:
+            chunk = chunk[:-1]
+        if "\r" in chunk:
+            chunk = chunk.replace("\r\n", "\n").replace("\r", "\n")
+        yield chunk
+    if carry:
+        yield "\n"
+
+
+def _join_lines(lines):
+    batch = []
+    size = 0
+    for line in lines:
+        batch.append(line)
+        size += len(line)
+        if size >= _BLOCK_READ_CHARS:
+            yield "".join(batch)
+            batch, size = [], 0
+    if batch:
+        yield "".join(batch)
+
+
+def _iter_blocks(source):
+    """
+    入力を空行で区切ったブロック (キュー・ヘッダーなど) の文字列を順に返します。
+    行ごとに処理せず、まとめて読み込んだ文字列を正規表現で一度に区切るため高速です。
+    """
+    remainder = ""
+    for chunk in _iter_text_chunks(source):
+        blocks = _BLANK_LINE_PATTERN.split(remainder + chunk)
+        # 最後のブロックは次のチャンクに続いている可能性があるため持ち越す
+        remainder = blocks.pop()
+        yield from blocks
+    if remainder:
+        yield remainder
+
+
+def iter_vtt_cues(source, merge_speakers=True, speaker_prefix=True):
+    """
+    VTTを少しずつ読み進めながらキュー (Cue) を順に返します。ファイル全体をメモリに載せません。
+    source には文字列・バイト列・ファイルオブジェクト・行のイテラブルを渡せます。
+    merge_speakers が True の場合、同じ発言者の連続したキューを1つにまとめ、
+    直前と同じ本文の繰り返し (ロールアップ字幕など) は読み飛ばします。発言者が不明なキューはまとめません。
+    speaker_prefix が True の場合、発言者タグがなければ「発言者名: 本文」形式から発言者を取り出します。
+    """
+    pending = None # 発言者ごとにまとめている途中のキュー
+    pending_texts = []
+    pending_end = None
+    timing_match = _VTT_TIMING_PATTERN.match
+
+    for block in _iter_blocks(source):
+        lines = block.split("\n")
+        timing = None
+        for index, line in enumerate(lines):
+            if "-->" in line:
+                match = timing_match(line.strip())
+                if match:
+                    # 時刻の数値変換は必要になるまで遅らせる (同じ発言者のキューは開始時刻を使わない)
+                    timing = match.groups()
+                    break
+            elif line.lstrip().startswith(("WEBVTT", "NOTE", "STYLE", "REGION")):
+                break
+            # それ以外はキュー識別子なので読み飛ばす
+        if timing is None:
+            continue
+
+        speaker, text = _parse_cue_payload(lines[index + 1:], speaker_prefix)
+        if not text:
+            continue
+        if not merge_speakers:
+            yield Cue(_timestamp_to_seconds(*timing[:4]), _timestamp_to_seconds(*timing[4:]), speaker, text)
+        elif pending is not None and pending.speaker == speaker and (speaker is not None or pending_texts[-1] == text):
+            # 発言者が不明なキューは行の区切りを残すため、同じ本文の繰り返しを除いてまとめない
+            pending_end = timing[4:]
+            if pending_texts[-1] != text:
+                pending_texts.append(text)
+        else:
+            if pending is not None:
+                pending.end = _timestamp_to_seconds(*pending_end)
+                pending.text = " ".join(pending_texts)
+                yield pending
+            pending = Cue(_timestamp_to_seconds(*timing[:4]), None, speaker, None)
+            pending_end = timing[4:]
+            pending_texts = [text]
+
+    if pending is not None:
+        pending.end = _timestamp_to_seconds(*pending_end)
+        pending.text = " ".join(pending_texts)
+        yield pending
+
+
+def format_timestamp(seconds):
+    """
+    秒数を HH:MM:SS 形式にします。
+    """
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def format_cues(cues, with_timestamps=True):
+    """
+    キューを「[HH:MM:SS] 発言者: 本文」形式の行として順に返します。(開始時刻が不明なキューは時刻を付けません)
+    """
+    for cue in cues:
+        line = f"{cue.speaker}: {cue.text}" if cue.speaker else cue.text
+        if with_timestamps and cue.start is not None:
+            line = f"[{format_timestamp(cue.start)}] {line}"
+        yield line
+
+
+def _merge_cues(cues):
+    """
+    同じ発言者の連続したキューを1つにまとめます (直前と同じ本文の繰り返しは読み飛ばす)。
+    iter_vtt_cues(merge_speakers=True) と同じ規則で、VTT以外の形式のキューに使います。
+    """
+    pending = None
+    pending_texts = []
+    for cue in cues:
+        if pending is not None and pending.speaker == cue.speaker and (cue.speaker is not None or pending_texts[-1] == cue.text):
+            pending.end = cue.end
+            if pending_texts[-1] != cue.text:
+                pending_texts.append(cue.text)
+            continue
+        if pending is not None:
+            pending.text = " ".join(pending_texts)
+            yield pending
+        pending = Cue(cue.start, cue.end, cue.speaker, None)
+        pending_texts = [cue.text]
+    if pending is not None:
+        pending.text = " ".join(pending_texts)
+        yield pending
+
+
+# --- 大きなVTT・SRTの並列解析 ---
+_process_pool = None
+_process_pool_lock = threading.Lock()
+_process_pool_unavailable = False
+
+
+def _get_process_pool():
+    """
+    解析用のプロセスプールを返します (初回に生成し、ウォームスタート間で再利用する)。
+    プロセスプールを使えない環境 (/dev/shm のない Lambda など) では None を返します。
+    """
+    global _process_pool, _process_pool_unavailable
+    if _process_pool is not None or _process_pool_unavailable:
+        return _process_pool
+    with _process_pool_lock:
+        if _process_pool is None and not _process_pool_unavailable:
+            try:
+                import multiprocessing
+                # 呼び出し元のスレッドの状態を引き継がないよう spawn で起動する
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=EXTRACT_PARALLEL_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                )
+            except (OSError, ImportError, NotImplementedError) as e:
+                logger.warning(f"プロセスプールを利用できないため、文字起こしを直列に解析します: {e}")
+                _process_pool_unavailable = True
+    return _process_pool
+
+
+def shutdown_process_pool():
+    """
+    解析用のプロセスプールを終了します (バッチ処理の終了時など)。
+    """
+    global _process_pool
+    with _process_pool_lock:
+        pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def _parse_cue_batch(text):
+    """
+    (ワーカープロセスで実行) キューの境界で区切った VTT・SRT の一部を解析し、
+    発言者ごとにまとめたキューのタプルと、まとめる前の先頭・末尾のキューの本文を返します。
+    """
+    raw_cues = list(iter_vtt_cues(text, merge_speakers=False))
+    if not raw_cues:
+        return [], None, None
+    cues = [(cue.start, cue.end, cue.speaker, cue.text) for cue in _merge_cues(raw_cues)]
+    return cues, raw_cues[0].text, raw_cues[-1].text
+
+
+def _iter_cue_batches(lines, first_batch):
+    """
+    行を EXTRACT_PARALLEL_BATCH_CHARS 文字程度のまとまりに、キューの境界 (空行) で区切って返します。
+    """
+    batch = first_batch
+    size = sum(len(line) for line in batch)
+    for line in lines:
+        batch.append(line)
+        size += len(line)
+        if size >= EXTRACT_PARALLEL_BATCH_CHARS and not line.strip():
+            yield "".join(batch)
+            batch, size = [], 0
+    if batch:
+        yield "".join(batch)
+
+
+def iter_cues_parallel(source):
+    """
+    iter_vtt_cues(source) と同じキューを返します。
+    入力が EXTRACT_PARALLEL_MIN_CHARS を超える場合は、キューの境界で区切ってプロセスプールで並列に解析し、
+    まとまりの境界をまたぐ同じ発言者のキューを連結します。小さい入力やプールを使えない場合は直列に解析します。
+    """
+    if EXTRACT_PARALLEL_WORKERS <= 1:
+        yield from iter_vtt_cues(source)
+        return
+    lines = iter(_iter_lines(source))
+    head = []
+    head_chars = 0
+    if EXTRACT_PARALLEL_WORKERS > 1:
+        for line in lines:
+            head.append(line)
+            head_chars += len(line)
+            if head_chars > EXTRACT_PARALLEL_MIN_CHARS:
+                break
+    pool = _get_process_pool() if head_chars > EXTRACT_PARALLEL_MIN_CHARS else None
+    if pool is None:
+        yield from iter_vtt_cues(itertools.chain(head, lines))
+        return
+
+    logger.info(f"文字起こしを {EXTRACT_PARALLEL_WORKERS} プロセスで並列に解析します。")
+    pending = None # まとまりをまたいで連結する途中のキュー
+    pending_last_text = None
+    in_flight = []
+    batches = _iter_cue_batches(lines, head)
+
+    def results():
+        # メモリ使用量を抑えるため、実行中のまとまりはワーカー数の2倍までにする
+        for batch in batches:
+            in_flight.append(pool.submit(_parse_cue_batch, batch))
+            if len(in_flight) >= EXTRACT_PARALLEL_WORKERS * 2:
+                yield in_flight.pop(0).result()
+        while in_flight:
+            yield in_flight.pop(0).result()
+
+    for cues, first_text, last_text in results():
+        if not cues:
+            continue
+        start, end, speaker, text = cues[0]
+        if pending is not None and pending.speaker == speaker and (speaker is not None or first_text == pending_last_text):
+            # 前のまとまりの末尾と同じ発言者のキューを連結する (同じ本文の繰り返しは除く。発言者が不明なキューは繰り返しのみ)
+            if first_text == pending_last_text:
+                text = text[len(first_text):].lstrip()
+            if text:
+                pending.text = f"{pending.text} {text}"
+            pending.end = end
+            cues = cues[1:]
+        for start, end, speaker, text in cues:
+            if pending is not None:
+                yield pending
+            pending = Cue(start, end, speaker, text)
+        pending_last_text = last_text
+    if pending is not None:
+        yield pending
+
+
+def extract_speaker_text_from_vtt(source, with_timestamps=None):
+    """
+    VTT (SRTも同じ) から発言者と開始時刻を残したテキストを抽出します (1行 = 1発言のまとまり)。
+    大きなファイルはプロセスプールで並列に解析します。
+    """
+    if with_timestamps is None:
+        with_timestamps = VTT_INCLUDE_TIMESTAMPS
+    return "\n".join(format_cues(iter_cues_parallel(source), with_timestamps=with_timestamps))
+
+
+# --- Zoom・Teams の文字起こしJSON ---
+# エントリの配列を格納するキー (Teams: entries、Zoom: timeline など)
+_JSON_ENTRIES_PATTERN = re.compile(r'"(?:entries|timeline|transcript|segments|captions|results|items)"\s*:\s*\[')
+_JSON_SEPARATOR_PATTERN = re.compile(r"[\s,]*")
+_JSON_TEXT_KEYS = ("text", "content", "caption", "displayText")
+_JSON_SPEAKER_KEYS = ("speakerDisplayName", "speakerName", "speaker", "speaker_name", "username", "userName", "user_name", "displayName")
+_JSON_START_KEYS = ("startOffset", "start", "startTime", "start_time", "ts", "offset")
+_JSON_END_KEYS = ("endOffset", "end", "endTime", "end_time")
+# 時刻の文字列 (例: 00:01:02.345、0:0:4.9500000、01:02)
+_CLOCK_PATTERN = re.compile(r"^(?:(\d+):)?(\d{1,2}):(\d{1,2})(?:[.,](\d+))?$")
+# ISO 8601 の時間 (例: PT1M2.5S)
+_ISO_DURATION_PATTERN = re.compile(r"^PT(?:(\d+(?:\.\d+)?)H)?(?:(\d+(?:\.\d+)?)M)?(?:(\d+(?:\.\d+)?)S)?$")
+
+
+def _parse_time(value):
+    """
+    秒数・時刻の文字列・ISO 8601 の時間を秒数にします。解釈できない場合は None を返します。
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = str(value).strip()
+    match = _CLOCK_PATTERN.match(value)
+    if match:
+        hours, minutes, seconds, fraction = match.groups()
+        return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + (float(f"0.{fraction}") if fraction else 0.0)
+    match = _ISO_DURATION_PATTERN.match(value)
+    if match and any(match.groups()):
+        hours, minutes, seconds = (float(group or 0) for group in match.groups())
+        return hours * 3600 + minutes * 60 + seconds
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _first_value(entry, keys):
+    for key in keys:
+        value = entry.get(key)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def iter_json_entries(source):
+    """
+    文字起こしJSONのエントリの配列から、エントリ (辞書) を1つずつ読み進めながら返します。
+    ルートが配列の場合はその要素を、オブジェクトの場合は entries / timeline などのキーの配列の要素を返します。
+    配列の要素は1つずつデコードするため、ファイル全体をメモリに載せません (1行に全体が書かれたJSONを除く)。
+    """
+    decoder = json.JSONDecoder()
+    lines = iter(_iter_lines(source))
+
+    def read_more():
+        # 1要素の途中で何度もデコードし直さないよう、ある程度まとめて読み足す
+        parts = []
+        size = 0
+        for line in lines:
+            parts.append(line)
+            size += len(line)
+            if size >= 65536:
+                break
+        return "".join(parts)
+
+    buffer = ""
+    pos = None
+    while pos is None:
+        more = read_more()
+        if not more:
+            raise ValueError("文字起こしのエントリの配列が見つかりません。")
+        buffer += more
+        stripped = buffer.lstrip()
+        if stripped.startswith("["):
+            pos = len(buffer) - len(stripped) + 1
+        elif stripped and not stripped.startswith("{"):
+            raise ValueError("JSONではありません。")
+        else:
+            match = _JSON_ENTRIES_PATTERN.search(buffer)
+            if match:
+                pos = match.end()
+
+    while True:
+        pos = _JSON_SEPARATOR_PATTERN.match(buffer, pos).end()
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            if pos >= len(buffer):
+                raise json.JSONDecodeError("incomplete", buffer, pos)
+            entry, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            more = read_more()
+            if not more:
+                raise ValueError("文字起こしのJSONが途中で終わっているか、形式が不正です。")
+            buffer = buffer[pos:] + more
+            pos = 0
+            continue
+        if isinstance(entry, dict):
+            yield entry
+        if pos > 65536:
+            buffer, pos = buffer[pos:], 0
+
+
+def _cue_from_json_entry(entry):
+    text = _first_value(entry, _JSON_TEXT_KEYS)
+    if not isinstance(text, str) or not text.strip():
+        return None
+    speaker = _first_value(entry, _JSON_SPEAKER_KEYS)
+    if isinstance(speaker, dict):
+        speaker = _first_value(speaker, ("displayName", "name", "username"))
+    if speaker is None and isinstance(entry.get("users"), list) and entry["users"]:
+        # Zoom の timeline は発言者を users の配列で持つ
+        user = entry["users"][0]
+        speaker = _first_value(user, ("username", "userName", "name")) if isinstance(user, dict) else None
+    return Cue(
+        _parse_time(_first_value(entry, _JSON_START_KEYS)),
+        _parse_time(_first_value(entry, _JSON_END_KEYS)),
+        str(speaker).strip() if speaker is not None else None,
+        _TAG_PATTERN.sub("", text).strip(),
+    )
+
+
+def extract_text_from_transcript_json(source, with_timestamps=None):
+    """
+    Zoom・Teams などの文字起こしJSONから、VTTと同じ形式 (発言者と開始時刻付き) のテキストを抽出します。
+    """
+    if with_timestamps is None:
+        with_timestamps = VTT_INCLUDE_TIMESTAMPS
+    cues = (cue for cue in map(_cue_from_json_entry, iter_json_entries(source)) if cue is not None)
+    return "\n".join(format_cues(_merge_cues(cues), with_timestamps=with_timestamps))
+
+
+# --- DOCX (Teams の文字起こしのダウンロードなど) ---
+_DOCX_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+# 「発言者名   0:03」形式の見出し行 (新しい Teams の文字起こし)
+# Teams は発言者名と時刻をタブか複数の空白で区切るため、その区切りを必須とする (「次回は 10:30」などの本文と区別する)
+_DOCX_SPEAKER_HEADER_PATTERN = re.compile(r"^(\S.{0,59}?)(?:\t|[ \u3000]{2,})[ \t\u3000]*(\d{1,2}:\d{2}(?::\d{2})?)$")
+# 「0:0:0.0 --> 0:0:4.950」形式のタイミング行 (従来の Teams の文字起こし)
+_DOCX_TIMING_PATTERN = re.compile(r"^(\d+:\d+(?::\d+)?(?:[.,]\d+)?)\s*-->\s*(\d+:\d+(?::\d+)?(?:[.,]\d+)?)")
+
+
+def _spool(chunks):
+    """
+    バイト列のチャンクを、DOCX_SPOOL_MAX_BYTES まではメモリ、それ以降は一時ファイルに書き出します。
+    (ZIPは末尾の目次から読むため、先頭から順に展開することはできない)
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=DOCX_SPOOL_MAX_BYTES)
+    if isinstance(chunks, (bytes, bytearray)):
+        chunks = (chunks,)
+    for chunk in chunks:
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+def iter_docx_paragraphs(chunks):
+    """
+    DOCXの本文の段落のテキストを、XMLを少しずつ解析しながら順に返します。
+    chunks にはバイト列、またはバイト列のチャンクのイテラブルを渡せます。
+    """
+    import xml.etree.ElementTree as ElementTree
+
+    with _spool(chunks) as spool:
+        try:
+            archive = zipfile.ZipFile(spool)
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"DOCXファイルとして読み込めません: {e}")
+        with archive, archive.open("word/document.xml") as document:
+            texts = []
+            for event, element in ElementTree.iterparse(document, events=("end",)):
+                tag = element.tag
+                if tag == f"{_DOCX_NAMESPACE}t":
+                    texts.append(element.text or "")
+                elif tag in (f"{_DOCX_NAMESPACE}br", f"{_DOCX_NAMESPACE}cr"):
+                    texts.append("\n")
+                elif tag == f"{_DOCX_NAMESPACE}tab":
+                    texts.append("\t")
+                elif tag == f"{_DOCX_NAMESPACE}p":
+                    yield "".join(texts)
+                    texts = []
+                    # 解析済みの段落は捨ててメモリ使用量を抑える
+                    element.clear()
+
+
+def iter_docx_cues(chunks):
+    """
+    DOCXの文字起こしの段落をキューとして返します。
+    「発言者名 0:03」の見出し行や「0:0:0.0 --> 0:0:4.95」のタイミング行があれば、発言者と開始時刻を取り出します。
+    どちらもない段落は、発言者・時刻なしのキューになります。
+    本文が続かない見出し行・タイミング行は、読み捨てずにそのまま本文のキューとして返します。
+    """
+    current = None
+    header_lines = [] # 現在のキューの見出し・発言者の行 (本文が続かなかった場合に本文として返す)
+    expecting_speaker = False
+    for paragraph in iter_docx_paragraphs(chunks):
+        for line in paragraph.split("\n"):
+            line = line.strip()
+            if not line:
+                continue
+            header = _DOCX_SPEAKER_HEADER_PATTERN.match(line)
+            timing = _DOCX_TIMING_PATTERN.match(line) if header is None else None
+            if header or timing:
+                if current is not None:
+                    yield current if current.text else Cue(None, None, None, " ".join(header_lines))
+                header_lines = [line]
+                if header:
+                    current = Cue(_parse_time(header.group(2)), None, header.group(1).strip(), "")
+                else:
+                    current = Cue(_parse_time(timing.group(1)), _parse_time(timing.group(2)), None, "")
+                expecting_speaker = timing is not None
+                continue
+            if current is None:
+                yield Cue(None, None, None, line)
+                continue
+            if expecting_speaker and len(line) <= 60:
+                current.speaker = line
+                header_lines.append(line)
+            else:
+                current.text = f"{current.text} {line}" if current.text else line
+            expecting_speaker = False
+    if current is not None:
+        yield current if current.text else Cue(None, None, None, " ".join(header_lines))
+
+
+def extract_text_from_docx(chunks, with_timestamps=None):
+    """
+    DOCXの文字起こしから、VTTと同じ形式 (発言者と開始時刻付き) のテキストを抽出します。
+    """
+    if with_timestamps is None:
+        with_timestamps = VTT_INCLUDE_TIMESTAMPS
+    return "\n".join(format_cues(iter_docx_cues(chunks), with_timestamps=with_timestamps))
+
 
 def extract_text_from_vtt(vtt_content):
     """
@@ -23,10 +662,9 @@ def extract_text_from_vtt(vtt_content):
         # 本文行のみを抽出
         if in_caption:
              # HTMLタグのようなものがあれば除去 (簡易的)
-             import re
-             line = re.sub(r'<[^>]+>', '', line)
+             line = _TAG_PATTERN.sub('', line)
              # 発言者情報 (例: <v ->山田>) があれば除去
-             line = re.sub(r'<v\s*[^>]*>.*?</v>', '', line)
+             line = _VOICE_SPAN_PATTERN.sub('', line)
              # 前後の空白を削除して追加
              cleaned_line = line.strip()
              if cleaned_line: # 空行でなければ追加
@@ -46,8 +684,141 @@ def extract_text_from_vtt(vtt_content):
 def extract_text_from_txt(txt_content):
     """
     TXTコンテンツをそのまま返します。(前後の空白や空行は削除)
+    txt_content には文字列のほか、行のイテラブル (ストリーミングで受信した行など) も渡せます。
     """
-    lines = [line.strip() for line in txt_content.splitlines()]
+    lines = txt_content.splitlines() if isinstance(txt_content, str) else txt_content
     # 完全な空行を除去
-    non_empty_lines = [line for line in lines if line]
-    return "\n".join(non_empty_lines)
\ No newline at end of file
+    non_empty_lines = (line for line in (line.strip() for line in lines) if line)
+    return "\n".join(non_empty_lines)
+
+
+# --- 抽出関数のレジストリ ---
+class Extractor:
+    """
+    ファイル形式ごとの抽出関数と、その形式を判定する拡張子・MIMEタイプ・先頭バイト列の判定関数。
+    binary が True の抽出関数にはバイト列のチャンクを、それ以外はデコードした行を渡します。
+    generic が True の形式 (プレーンテキスト) は、中身による判定でほかの形式が見つからない場合にのみ使います。
+    """
+
+    def __init__(self, name, func, extensions=(), mimetypes=(), sniff=None, binary=False, generic=False):
+        self.name = name
+        self.func = func
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self.mimetypes = tuple(mimetypes)
+        self.sniff = sniff
+        self.binary = binary
+        self.generic = generic
+
+    def __call__(self, source):
+        return self.func(source)
+
+    def __repr__(self):
+        return f"Extractor({self.name!r})"
+
+
+# 登録順に判定する
+EXTRACTORS = []
+
+
+def supported_extensions():
+    """
+    登録済みの形式の拡張子を登録順に返します (ユーザーへの案内用)。
+    """
+    return list(dict.fromkeys(extension for extractor in EXTRACTORS for extension in extractor.extensions))
+
+
+def register_extractor(name, func, extensions=(), mimetypes=(), sniff=None, binary=False, generic=False):
+    """
+    抽出関数を登録します。同じ名前の形式が登録済みの場合は置き換えます。
+    """
+    extractor = Extractor(name, func, extensions, mimetypes, sniff, binary, generic)
+    for i, registered in enumerate(EXTRACTORS):
+        if registered.name == name:
+            EXTRACTORS[i] = extractor
+            return extractor
+    EXTRACTORS.append(extractor)
+    return extractor
+
+
+def _matches(extractor, file_name, mimetype):
+    return file_name.endswith(extractor.extensions) or (mimetype is not None and mimetype in extractor.mimetypes)
+
+
+def select_extractor(file_name, mimetype=None, head=None):
+    """
+    ファイル名・MIMEタイプに応じた抽出関数 (Extractor) を返します。未対応の形式の場合は None を返します。
+    head (ファイル先頭のバイト列) を渡すと、拡張子などで特定の形式に決まらない場合に中身から判定します。
+    """
+    file_name = (file_name or "").lower()
+    for extractor in EXTRACTORS:
+        if not extractor.generic and _matches(extractor, file_name, mimetype):
+            return extractor
+    if head:
+        for extractor in EXTRACTORS:
+            if extractor.sniff is not None and extractor.sniff(head):
+                return extractor
+    for extractor in EXTRACTORS:
+        if extractor.generic and _matches(extractor, file_name, mimetype):
+            return extractor
+    return None
+
+
+# 中身で形式を判定する対象のMIMEタイプ (Slackが形式を特定できなかったファイル)
+_SNIFF_MIMETYPES = {None, "", "application/octet-stream", "binary/octet-stream", "text/plain"}
+
+
+def detect_extractor(file_name, mimetype, chunks):
+    """
+    ファイル名・MIMEタイプで形式が決まらない場合は、chunks の先頭を読んで中身から形式を判定します。
+    (抽出関数または None, 先頭を読み戻した chunks) を返します。
+    """
+    extractor = select_extractor(file_name, mimetype)
+    if extractor is not None and not extractor.generic:
+        return extractor, chunks
+    if extractor is None and mimetype not in _SNIFF_MIMETYPES:
+        return None, chunks
+    chunks = iter(chunks)
+    head = b""
+    peeked = []
+    for chunk in chunks:
+        peeked.append(chunk)
+        head += chunk
+        if len(head) >= SNIFF_BYTES:
+            break
+    return select_extractor(file_name, mimetype, head), itertools.chain(peeked, chunks)
+
+
+def _strip_bom(head):
+    return head[3:] if head.startswith(b"\xef\xbb\xbf") else head
+
+
+_SRT_HEAD_PATTERN = re.compile(rb"^\s*\d+\s*\r?\n\s*\d{1,2}:\d{2}:\d{2},\d{3}\s+-->")
+
+
+def _sniff_vtt(head):
+    return _strip_bom(head).lstrip().startswith(b"WEBVTT")
+
+
+def _sniff_srt(head):
+    return _SRT_HEAD_PATTERN.match(_strip_bom(head)) is not None
+
+
+def _sniff_transcript_json(head):
+    head = _strip_bom(head).lstrip()
+    return head[:1] in (b"{", b"[") and (b'"text"' in head or _JSON_ENTRIES_PATTERN.search(head.decode("utf-8", "ignore")) is not None)
+
+
+def _sniff_docx(head):
+    return head.startswith(b"PK\x03\x04") and b"word/" in head
+
+
+register_extractor("vtt", extract_speaker_text_from_vtt, extensions=(".vtt",), mimetypes=("text/vtt",), sniff=_sniff_vtt)
+# SRTはキューの書式がVTTとほぼ同じ (時刻の小数点が「,」、ヘッダーなし) のため、同じパーサーで解析する
+register_extractor("srt", extract_speaker_text_from_vtt, extensions=(".srt",),
+                   mimetypes=("application/x-subrip", "text/srt"), sniff=_sniff_srt)
+register_extractor("transcript_json", extract_text_from_transcript_json, extensions=(".json",),
+                   mimetypes=("application/json",), sniff=_sniff_transcript_json)
+register_extractor("docx", extract_text_from_docx, extensions=(".docx",),
+                   mimetypes=("application/vnd.openxmlformats-officedocument.wordprocessingml.document",),
+                   sniff=_sniff_docx, binary=True)
+register_extractor("txt", extract_text_from_txt, extensions=(".txt",), mimetypes=("text/plain",), generic=True)
@@ -0,0 +1,290 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import result_cache
+
+logger = logging.getLogger(__name__)
+
+# スレッド単位の要約状態のバックエンド ("none" / "memory" / "sqlite" / "dynamodb")
+# "none" の場合は差分要約を行わず、従来どおりファイルごとに最初から要約する
+THREAD_STATE_BACKEND = os.environ.get("THREAD_STATE_BACKEND", "none")
+# 状態を保持する期間 (秒)。最後の更新からこの期間を過ぎたスレッドは最初から要約し直す
+THREAD_STATE_TTL_SECONDS = int(os.environ.get("THREAD_STATE_TTL_SECONDS", "604800"))
+# プロセス内ストアで保持する最大スレッド数
+THREAD_STATE_MAX_ENTRIES = int(os.environ.get("THREAD_STATE_MAX_ENTRIES", "256"))
+# 1つの会議で保持する行ハッシュの最大数 (超えた分は古いものから捨てる)
+# 行ハッシュ1件はJSONで約20バイトのため、既定値で約200KB (DynamoDBでは1項目400KBを超える分を更に古いものから捨てる)
+THREAD_STATE_MAX_LINE_HASHES = int(os.environ.get("THREAD_STATE_MAX_LINE_HASHES", "10000"))
+# 1スレッドで保持する会議 (別々に要約した議事録) の最大数 (超えた分は古いものから捨てる)
+THREAD_STATE_MAX_MEETINGS = int(os.environ.get("THREAD_STATE_MAX_MEETINGS", "5"))
+# 要約済みの会議の続き・修正版とみなす、行の重複率の下限
+# (共通する行の数 ÷ 行の少ない方の行数。これを下回るファイルは別の会議として最初から要約する)
+THREAD_STATE_MIN_OVERLAP = float(os.environ.get("THREAD_STATE_MIN_OVERLAP", "0.5"))
+# DynamoDBストアに書き込む状態のJSONの上限 (バイト)。1項目の上限 400KB からキーなどの属性の分を除いた値
+THREAD_STATE_MAX_ITEM_BYTES = int(os.environ.get("THREAD_STATE_MAX_ITEM_BYTES", "390000"))
+# SQLiteストアのファイルパス
+THREAD_STATE_SQLITE_PATH = os.environ.get("THREAD_STATE_SQLITE_PATH", "/tmp/slack_summarizer_threads.db")
+# DynamoDBストアのテーブル名 (パーティションキー: thread_key, TTL属性: expires_at)
+THREAD_STATE_TABLE = os.environ.get("THREAD_STATE_TABLE")
+
+
+def hash_line(line: str) -> str:
+    """
+    正規化した1行のハッシュ (短縮形) を返します。空行は None を返します。
+    """
+    normalized = result_cache.normalize_text(line)
+    if not normalized:
+        return None
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def diff_lines(text: str, known_hashes) -> tuple:
+    """
+    既に要約済みの行 (known_hashes) に含まれない行だけを元の順序で取り出します。
+    (新しい部分のテキスト, 全行のハッシュのリスト) を返します。
+    """
+    known = set(known_hashes or ())
+    new_lines = []
+    hashes = []
+    for line in text.split("\n"):
+        line_hash = hash_line(line)
+        if line_hash is None:
+            continue
+        hashes.append(line_hash)
+        if line_hash not in known:
+            new_lines.append(line)
+    return "\n".join(new_lines), hashes
+
+
+def merge_line_hashes(old_hashes, new_hashes, max_hashes: int = None) -> list:
+    """
+    行ハッシュを重複なく連結し、上限を超えた分は古いものから捨てます。
+    """
+    max_hashes = max_hashes or THREAD_STATE_MAX_LINE_HASHES
+    merged = list(dict.fromkeys(list(old_hashes or ()) + list(new_hashes)))
+    return merged[-max_hashes:]
+
+
+def line_overlap(known_hashes, line_hashes) -> float:
+    """
+    2つの文字起こしの行ハッシュが共通する割合 (共通する行の数 ÷ 行の少ない方の行数) を返します。
+    続きを含めて書き出し直した文字起こしや修正版は 1 に近く、別の会議は 0 に近くなります。
+    """
+    known, current = set(known_hashes or ()), set(line_hashes or ())
+    if not known or not current:
+        return 0.0
+    return len(known & current) / min(len(known), len(current))
+
+
+def find_related_meeting(meetings, line_hashes, exclude_mention: str = None, min_overlap: float = None):
+    """
+    行の重複率が min_overlap 以上で最も高い会議の位置を返します。該当がなければ None を返します。
+    exclude_mention と同じメンションで要約した会議 (同時に添付された別のファイル) は対象にしません。
+    """
+    min_overlap = THREAD_STATE_MIN_OVERLAP if min_overlap is None else min_overlap
+    best_index, best_overlap = None, 0.0
+    for index, meeting in enumerate(meetings):
+        if exclude_mention is not None and meeting.get("mention") == exclude_mention:
+            continue
+        overlap = line_overlap(meeting.get("line_hashes"), line_hashes)
+        if overlap >= min_overlap and overlap > best_overlap:
+            best_index, best_overlap = index, overlap
+    return best_index
+
+
+def meetings_of(state) -> list:
+    """
+    スレッドの要約状態から、会議ごとの状態 (カテゴリ・議事録・行ハッシュ・メンション) のリストを古い順に返します。
+    """
+    if not state:
+        return []
+    if "meetings" not in state:
+        # 会議を1つだけ保持していた形式の状態
+        return [state] if state.get("minutes") is not None else []
+    return list(state["meetings"])
+
+
+def serialize_state(state: dict, max_bytes: int = None) -> str:
+    """
+    状態をJSON文字列にします。UTF-8で max_bytes を超える場合は、古い会議の古い行ハッシュから捨てて収めます
+    (捨てた行は次回の差分で新しい行として扱われる)。行ハッシュをすべて捨てても収まらない場合は ValueError を送出します。
+    """
+    serialized = json.dumps(state, ensure_ascii=False)
+    if max_bytes is None:
+        return serialized
+    size = len(serialized.encode("utf-8"))
+    meetings = [dict(meeting, line_hashes=list(meeting.get("line_hashes") or ())) for meeting in meetings_of(state)]
+    dropped = 0
+    while size > max_bytes:
+        meeting = next((meeting for meeting in meetings if meeting["line_hashes"]), None)
+        if meeting is None:
+            raise ValueError(f"スレッドの要約状態が上限を超えています ({size} > {max_bytes} バイト)")
+        # 行ハッシュ1件は16桁の16進数と引用符・区切りで約20バイト
+        drop = min(len(meeting["line_hashes"]), (size - max_bytes) // 20 + 1)
+        meeting["line_hashes"] = meeting["line_hashes"][drop:]
+        dropped += drop
+        serialized = json.dumps(dict(state, meetings=meetings), ensure_ascii=False)
+        size = len(serialized.encode("utf-8"))
+    if dropped:
+        logger.info(f"スレッドの要約状態を上限に収めるため、古い行ハッシュを {dropped} 件捨てました。")
+    return serialized
+
+
+class ThreadStateStore:
+    """
+    スレッド単位の要約状態 (会議ごとのカテゴリ・議事録・要約済みの行ハッシュ) のストアの共通インターフェース。
+    サブクラスは _get / _put を実装します。状態は JSON に変換できる辞書です。
+    enabled は、状態を保持するストアかどうかです (保持しない場合は差分要約を行わない)。
+    """
+    enabled = True
+
+    def get(self, thread_key: str):
+        try:
+            return self._get(thread_key)
+        except Exception as e:
+            # ストア障害時は最初から要約する
+            logger.warning(f"スレッドの要約状態の読み込みに失敗しました: {e}")
+            return None
+
+    def put(self, thread_key: str, state: dict) -> None:
+        try:
+            self._put(thread_key, state)
+        except Exception as e:
+            logger.warning(f"スレッドの要約状態の書き込みに失敗しました: {e}")
+
+    def _get(self, thread_key: str):
+        raise NotImplementedError
+
+    def _put(self, thread_key: str, state: dict) -> None:
+        raise NotImplementedError
+
+
+class NullThreadStateStore(ThreadStateStore):
+    """
+    状態を保持しない実装 (THREAD_STATE_BACKEND=none)。
+    """
+    enabled = False
+
+    def _get(self, thread_key):
+        return None
+
+    def _put(self, thread_key, state):
+        pass
+
+
+class InMemoryThreadStateStore(ThreadStateStore):
+    """
+    プロセス内のストア。同一のLambdaインスタンス内でのみ有効です。
+    """
+
+    def __init__(self, max_entries: int = THREAD_STATE_MAX_ENTRIES, ttl_seconds: int = THREAD_STATE_TTL_SECONDS):
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # thread_key -> (expires_at, state)
+        self._lock = threading.Lock()
+
+    def _get(self, thread_key):
+        with self._lock:
+            entry = self._entries.get(thread_key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[thread_key]
+                return None
+            self._entries.move_to_end(thread_key)
+            # 呼び出し元での変更がストアに反映されないよう複製して返す
+            return json.loads(entry[1])
+
+    def _put(self, thread_key, state):
+        with self._lock:
+            self._entries[thread_key] = (time.time() + self._ttl_seconds, json.dumps(state, ensure_ascii=False))
+            self._entries.move_to_end(thread_key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteThreadStateStore(ThreadStateStore):
+    """
+    SQLiteファイルを使ったストア。同一ホストの複数プロセスで共有できます。
+    """
+
+    def __init__(self, path: str = THREAD_STATE_SQLITE_PATH, ttl_seconds: int = THREAD_STATE_TTL_SECONDS):
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS thread_state ("
+            " thread_key TEXT PRIMARY KEY,"
+            " state TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+
+    def _get(self, thread_key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, expires_at FROM thread_state WHERE thread_key = ?", (thread_key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def _put(self, thread_key, state):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO thread_state (thread_key, state, expires_at) VALUES (?, ?, ?)",
+                (thread_key, json.dumps(state, ensure_ascii=False), now + self._ttl_seconds),
+            )
+            self._conn.execute("DELETE FROM thread_state WHERE expires_at < ?", (now,))
+
+
+class DynamoDBThreadStateStore(ThreadStateStore):
+    """
+    DynamoDBテーブルを使ったストア。複数のLambdaインスタンスで共有できます。
+    状態はJSON文字列として1属性に保存します。項目の上限は400KBのため、
+    THREAD_STATE_MAX_ITEM_BYTES を超える状態は古い行ハッシュから捨てて書き込みます。
+    """
+
+    def __init__(self, table_name: str = THREAD_STATE_TABLE, ttl_seconds: int = THREAD_STATE_TTL_SECONDS,
+                 max_item_bytes: int = THREAD_STATE_MAX_ITEM_BYTES):
+        if not table_name:
+            raise ValueError("THREAD_STATE_TABLE が設定されていません。")
+        import boto3  # Lambdaランタイムに同梱されているため requirements.txt には含めない
+        self._table = boto3.resource("dynamodb").Table(table_name)
+        self._ttl_seconds = ttl_seconds
+        self._max_item_bytes = max_item_bytes
+
+    def _get(self, thread_key):
+        item = self._table.get_item(Key={"thread_key": thread_key}).get("Item")
+        if item is None or int(item.get("expires_at", 0)) < time.time():
+            return None
+        return json.loads(item["state"])
+
+    def _put(self, thread_key, state):
+        self._table.put_item(Item={
+            "thread_key": thread_key,
+            "state": serialize_state(state, self._max_item_bytes),
+            "expires_at": int(time.time() + self._ttl_seconds),
+        })
+
+
+def create_thread_state_store(backend: str = None) -> ThreadStateStore:
+    """
+    設定に応じたスレッドの要約状態のストアを生成します。
+    """
+    backend = (backend or THREAD_STATE_BACKEND).lower()
+    if backend == "none":
+        return NullThreadStateStore()
+    if backend == "memory":
+        return InMemoryThreadStateStore()
+    if backend == "sqlite":
+        return SQLiteThreadStateStore()
+    if backend == "dynamodb":
+        return DynamoDBThreadStateStore()
+    raise ValueError(f"未対応のスレッド状態バックエンドです: {backend}")
@@ -0,0 +1,7 @@
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのおおよそのトークン数を推定します。
+    日本語などの非ASCII文字は1文字≒1トークン、ASCII文字は4文字≒1トークンとして数えます。
+    """
+    ascii_chars = sum(1 for ch in text if ch.isascii())
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
@@ -0,0 +1,139 @@
+import difflib
+import logging
+import os
+import re
+import unicodedata
+
+from token_estimator import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 文字起こしの圧縮を行うか
+COMPACTION_ENABLED = os.environ.get("COMPACTION_ENABLED", "true").lower() == "true"
+# 隣接行をほぼ同一とみなす類似度 (0〜1)
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get("NEAR_DUPLICATE_THRESHOLD", "0.9"))
+# 除去するフィラーの正規表現 ("||" 区切りで環境変数から上書き可能)
+DEFAULT_FILLER_PATTERNS = (
+    r"えー+っと",
+    r"えー+と?",
+    r"えっと",
+    r"あー+",
+    r"あのー+",
+    r"あの(?=[、,\s])",
+    r"そのー+",
+    r"うーん",
+    r"んー+",
+    r"まあ(?=[、,\s])",
+    r"なんか(?=[、,\s])",
+    r"(?i:\b(?:um+|uh+|erm)\b)",
+)
+FILLER_PATTERNS = tuple(
+    pattern for pattern in os.environ.get("FILLER_PATTERNS", "").split("||") if pattern
+) or DEFAULT_FILLER_PATTERNS
+
+# 行頭のタイムスタンプ (例: [00:01:02]) と発言者 (例: 山田: )
+_LINE_PREFIX_PATTERN = re.compile(r"^(\[\d{2}:\d{2}:\d{2}\]\s*)?(?:([^:：\s][^:：]{0,29}?)\s*[:：]\s+)?")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+# フィラー除去後に残った連続・先頭の読点
+_DANGLING_COMMA_PATTERN = re.compile(r"^[、,\s]+|(?<=[、,])[、,\s]+")
+
+
+class CompactionResult:
+    """
+    文字起こしの圧縮結果。
+    """
+    __slots__ = ("text", "original_tokens", "compacted_tokens", "removed_lines")
+
+    def __init__(self, text, original_tokens, compacted_tokens, removed_lines):
+        self.text = text
+        self.original_tokens = original_tokens
+        self.compacted_tokens = compacted_tokens
+        self.removed_lines = removed_lines
+
+    @property
+    def ratio(self):
+        """圧縮後のトークン数 / 圧縮前のトークン数"""
+        return self.compacted_tokens / self.original_tokens if self.original_tokens else 1.0
+
+    def __repr__(self):
+        return (f"CompactionResult(tokens={self.original_tokens}->{self.compacted_tokens}, "
+                f"ratio={self.ratio:.2f}, removed_lines={self.removed_lines})")
+
+
+def _compile_fillers(patterns):
+    return re.compile(r"(?:" + "|".join(patterns) + r")[、,]?\s*")
+
+
+_FILLER_PATTERN = _compile_fillers(FILLER_PATTERNS)
+
+
+def normalize_line(line, filler_pattern=_FILLER_PATTERN):
+    """
+    1行を正規化します (Unicode正規化、空白の圧縮、フィラーの除去)。
+    """
+    line = unicodedata.normalize("NFKC", line)
+    line = _WHITESPACE_PATTERN.sub(" ", line).strip()
+    if filler_pattern is not None:
+        prefix_match = _LINE_PREFIX_PATTERN.match(line)
+        prefix, body = line[:prefix_match.end()], line[prefix_match.end():]
+        body = _DANGLING_COMMA_PATTERN.sub("", filler_pattern.sub("", body)).strip()
+        line = prefix + body if body else ""
+    return line
+
+
+def _split_prefix(line):
+    """
+    行を (発言者, 本文) に分けます。タイムスタンプは比較対象から外します。
+    """
+    match = _LINE_PREFIX_PATTERN.match(line)
+    return match.group(2), line[match.end():]
+
+
+def _is_near_duplicate(previous, current, threshold):
+    if previous == current:
+        return True
+    matcher = difflib.SequenceMatcher(None, previous, current, autojunk=False)
+    return matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold and matcher.ratio() >= threshold
+
+
+def compact_transcript(text, filler_patterns=None, near_duplicate_threshold=None):
+    """
+    文字起こしを正規化し、フィラーと隣接するほぼ同一の行を除去します。
+    発言者が分かっている同じ発言者の隣接行で、一方が他方の書き出しである場合 (字幕の追記など) は長い方だけを残します。
+    """
+    filler_pattern = _FILLER_PATTERN if filler_patterns is None else (
+        _compile_fillers(filler_patterns) if filler_patterns else None
+    )
+    threshold = NEAR_DUPLICATE_THRESHOLD if near_duplicate_threshold is None else near_duplicate_threshold
+
+    kept = [] # (発言者, 本文, 行)
+    removed_lines = 0
+    for raw_line in text.split("\n"):
+        line = normalize_line(raw_line, filler_pattern)
+        speaker, body = _split_prefix(line)
+        if not body:
+            removed_lines += 1
+            continue
+        if kept and kept[-1][0] == speaker:
+            previous_body = kept[-1][1]
+            # 包含関係による除去は、発言者が分かっていて一方が他方の書き出しである場合 (字幕の追記) に限る
+            # (発言者が不明な行や、短い相づちが長い発言の一部に含まれるだけの行は別の発言として残す)
+            rollup = speaker is not None
+            if rollup and previous_body.startswith(body):
+                removed_lines += 1
+                continue
+            if rollup and body.startswith(previous_body):
+                # 前の行が今の行の途中経過なので置き換える (タイムスタンプは前の行を残す)
+                previous_line = kept[-1][2]
+                kept[-1] = (speaker, body, previous_line[:len(previous_line) - len(previous_body)] + body)
+                removed_lines += 1
+                continue
+            if _is_near_duplicate(previous_body, body, threshold):
+                if len(body) > len(previous_body):
+                    kept[-1] = (speaker, body, line)
+                removed_lines += 1
+                continue
+        kept.append((speaker, body, line))
+
+    compacted = "\n".join(line for _, _, line in kept)
+    return CompactionResult(compacted, estimate_tokens(text), estimate_tokens(compacted), removed_lines)